@@ -8,10 +8,23 @@ from .correlation.spearman import SpearmanCorrelation
 from .kruskalwallis.kruskalwallis import KruskalWallis
 # mannwhitney
 from .mannwhitney.mannwhitney import MannWhitney
+# mc
+from ._mc.mc_linreg import (MCLinearRegressor, MCLinearRegressorBatch,
+                            MCLinearRegressorDrawsTable,
+                            MCLinearRegressorPredictor, MCLinearRegressorTable)
+from ._mc.sampler.mc_linreg_sampler import (MCLinRegData, MCLinRegResult,
+                                            MCLinRegSampler)
+from ._mc.sampler.mc_sampler import MCSampler
+from ._mc.sampler.mc_trace_cache import MCTraceCache
+from ._mc.sampler.mc_trace_storage import MCTraceStorage
 # normaltest
 from .normaltest.normaltest import NormalTest
+# pairwise merge
+from .pairwise_merge.pairwise_merge import PairwiseStatsMerge
 # pvalue adjust
 from .pval_adjust.pval_adjust import PValueAdjust
+from .pval_adjust.pval_adjust_helper import PValueAdjustHelper
+from .pval_adjust.streaming_fdr_helper import StreamingFDRHelper
 # ttests
 from .ttests.ttest1sample import TTestOneSample
 from .ttests.ttest2sample_ind import TTestTwoIndepSamples
@@ -0,0 +1,298 @@
+
+import pandas
+from gws_core import (BadRequestException, BoolParam, ConfigParams, FloatParam, InputSpec, OutputSpec, ConfigSpecs,
+                      InputSpecs, OutputSpecs, IntParam, ParamSet, StrParam, Table, Task, TaskInputs, TaskOutputs,
+                      resource_decorator, task_decorator)
+
+from ..base.helper.simple_design_helper import SimpleDesignHelper
+from .sampler.mc_linreg_sampler import MCLinRegData, MCLinRegResult, MCLinRegSampler
+from .sampler.mc_summary_helper import MCSummaryHelper
+
+# *****************************************************************************
+#
+# MCLinearRegressorTable
+#
+# *****************************************************************************
+
+
+@resource_decorator("MCLinearRegressorTable", human_name="MC linear regressor table", hide=True)
+class MCLinearRegressorTable(Table):
+    """ MCLinearRegressorTable """
+
+
+@resource_decorator("MCLinearRegressorDrawsTable", human_name="MC linear regressor posterior draws", hide=True)
+class MCLinearRegressorDrawsTable(Table):
+    """ MCLinearRegressorDrawsTable: the slope draws (one row per target and draw, see `MCLinRegResult.get_posterior_draws()`) """
+
+
+def _create_slope_param_set():
+    return ParamSet(ConfigSpecs({
+        "func": StrParam(allowed_values=["Normal", "TruncatedNormal", "HalfNormal"], human_name="Function", short_description="Distribution function"),
+        "mu": FloatParam(default_value=0.0, human_name="Mean", short_description="Distribution mean"),
+        "sigma": FloatParam(default_value=10.0, min_value=0, human_name="Sigma", short_description="Distribution sigma"),
+        "lb": FloatParam(optional=True, human_name="Lower bound", short_description="The lower bound of the distribution. It is required for TruncatedNormal and used as constrain in any case."),
+        "ub": FloatParam(optional=True, human_name="Upper bound", short_description="The upper bound of the distribution. It is required for TruncatedNormal and used as constrain in any case."),
+    }), human_name="Slope", max_number_of_occurrences=1, min_number_of_occurrences=0)
+
+
+def _create_sigma_param_set():
+    return ParamSet(ConfigSpecs({
+        "func": StrParam(allowed_values=["Normal", "TruncatedNormal", "HalfNormal", "HalfCauchy"], human_name="Distribution function"),
+        "mu": FloatParam(optional=True, default_value=0.0, human_name="Mean", short_description="Distribution mean. Only for Normal-type distribution"),
+        "sigma": FloatParam(optional=True, default_value=10, human_name="Sigma", short_description="Distribution sigma. Only for Normal-type distribution"),
+        "beta": FloatParam(optional=True, default_value=10.0, human_name="Beta", short_description="Distribution beta. Only for HalfCauchy distribution"),
+    }), human_name="Sigma", max_number_of_occurrences=1, min_number_of_occurrences=0)
+
+
+def _create_column_names_param_set(human_name: str, short_description: str):
+    return ParamSet(ConfigSpecs({
+        "name": StrParam(
+            human_name="Column names", short_description="The name of the column(s) to select"),
+        "is_regex": BoolParam(
+            default_value=False, human_name="Is text pattern?",
+            short_description="Set True if it is a text pattern (regular expression), False otherwise")
+    }), human_name=human_name, short_description=short_description)
+
+# *****************************************************************************
+#
+# MCLinRegressor
+#
+# *****************************************************************************
+
+
+@task_decorator("MCLinearRegressor", human_name="MC linear regressor",
+                short_description="Monte-Carlo linear regressior")
+class MCLinearRegressor(Task):
+    """
+    Robust Monte-Carlo based linear regression
+
+    Based on pyMC package.
+
+    Usual distribution functions are
+    * `Normal` with paramerers `mu, sigma`
+    * `TruncatedNormal` with paramerers `mu, sigma, lower, upper`
+    * `HalfNormal` with paramerers `sigma`
+    * `HalfCauchy` with paramerers `beta`
+
+    The slope prior is used for all the predictors (columns of the table that are not targets).
+
+    * Input: a table containing the predictors and the targets.
+    * Output: the posterior summary of the slopes and of the noise (one row per parameter): mean, standard deviation,
+    highest density interval, R-hat and bulk and tail effective sample sizes.
+    * Output: the posterior draws of the slopes, to predict new data with the `MCLinearRegressorPredictor` task.
+
+    See also https://www.pymc.io/projects/examples/en/latest/generalized_linear_models/GLM-robust.html
+    """
+
+    DEFAULT_SLOPE_PRIOR = {"func": "Normal", "mu": 0.0, "sigma": 10.0}
+    DEFAULT_SIGMA_PRIOR = {"func": "HalfCauchy", "beta": 10.0}
+
+    input_specs = InputSpecs({'table': InputSpec(
+        Table, human_name="Table", short_description="The input table")})
+    output_specs = OutputSpecs({'result': OutputSpec(MCLinearRegressorTable, human_name="result",
+                                                     short_description="The output result"),
+                                'posterior_draws': OutputSpec(MCLinearRegressorDrawsTable, human_name="Posterior draws",
+                                                              short_description="The posterior draws of the slopes")})
+    config_specs = ConfigSpecs({
+        'training_design': SimpleDesignHelper.create_training_design_param_set(),
+        # 'intercept': ParamSet(ConfigSpecs({
+        #     "func": StrParam(allowed_values=["Normal", "TruncatedNormal", "HalfNormal"], human_name="Distribution function"),
+        #     "mu": FloatParam(value, human_name="Distribution function"),
+        #     "params": StrParam(human_name="Parameters", short_description="The parameters (e.g. mu=1.2, sigma=3). See documentation."),
+        # }), human_name="Intercept"),
+        'slope': _create_slope_param_set(),
+        'sigma': _create_sigma_param_set(),
+        'chains': IntParam(default_value=MCLinRegSampler.DEFAULT_CHAINS, min_value=1, human_name="Chains",
+                           short_description="The number of MCMC chains"),
+        'cores': IntParam(default_value=None, optional=True, min_value=1, human_name="Cores",
+                          short_description="The number of processes used to run the chains in parallel. By default, one process per chain (up to the number of CPUs)"),
+        'target_accept': FloatParam(default_value=MCLinRegSampler.DEFAULT_TARGET_ACCEPT, min_value=0, max_value=1, human_name="Target acceptance rate",
+                                    short_description="The target acceptance rate of the NUTS sampler. Increase it (e.g. 0.95) in case of divergences"),
+        'random_seed': IntParam(default_value=None, optional=True, human_name="Random seed",
+                                short_description="The random seed, for reproducible results. The seeds of the chains are derived from this seed"),
+        'hdi_prob': FloatParam(default_value=MCSummaryHelper.DEFAULT_HDI_PROB, min_value=0, max_value=1, human_name="HDI probability",
+                               short_description="The probability of the highest density intervals of the posterior summary"),
+    })
+
+    def run(self, params: ConfigParams, inputs: TaskInputs) -> TaskOutputs:
+        table = inputs["table"]
+        training_design = params["training_design"]
+
+        x_true, y_true = SimpleDesignHelper.create_training_matrices(
+            table, training_design)
+        if y_true is None:
+            raise BadRequestException("A training design with at least one target is required")
+        data = MCLinRegData(x_data=x_true, y_data=y_true)
+        sampler = MCLinRegSampler()
+        sampler.set_data(data)
+        sampler.set_chains(params["chains"])
+        sampler.set_cores(params["cores"])
+        sampler.set_target_accept(params["target_accept"])
+
+        self._set_priors(sampler, params, x_true.shape[1])
+
+        result = sampler.trace(random_seed=params["random_seed"])
+        summary = result.get_summary(hdi_prob=params["hdi_prob"])
+        return {"result": MCLinearRegressorTable(data=summary),
+                "posterior_draws": MCLinearRegressorDrawsTable(data=result.get_posterior_draws())}
+
+    @classmethod
+    def _set_priors(cls, sampler: MCLinRegSampler, params: ConfigParams, nb_predictors: int):
+        """ Set the slope prior (the same prior for all the predictors) and the sigma prior of the sampler """
+        slope = params.get_value("slope", [])
+        slope_prior = cls._create_prior(slope[0]) if len(slope) > 0 else dict(cls.DEFAULT_SLOPE_PRIOR)
+        sampler.set_slope_priors([dict(slope_prior) for _ in range(0, nb_predictors)])
+        sigma = params.get_value("sigma", [])
+        sigma_prior = cls._create_prior(sigma[0]) if len(sigma) > 0 else dict(cls.DEFAULT_SIGMA_PRIOR)
+        sampler.set_sigma_prior(sigma_prior)
+
+    @staticmethod
+    def _create_prior(prior_params: dict) -> dict:
+        """ Create a prior (see `MCLinRegSampler`) from the parameters of a distribution """
+        func = prior_params["func"]
+        if func == "HalfCauchy":
+            return {"func": func, "beta": prior_params["beta"]}
+        if func == "HalfNormal":
+            return {"func": func, "sigma": prior_params["sigma"]}
+
+        prior = {"func": func, "mu": prior_params["mu"], "sigma": prior_params["sigma"]}
+        bounds = {"lower": prior_params.get("lb"), "upper": prior_params.get("ub")}
+        bounds = {key: val for key, val in bounds.items() if val is not None}
+        if func == "TruncatedNormal" and len(bounds) == 0:
+            raise BadRequestException("The lower or the upper bound is required for a TruncatedNormal distribution")
+        if len(bounds) > 0:
+            # the bounds are used as constraints
+            prior["func"] = "TruncatedNormal"
+            prior.update(bounds)
+        return prior
+
+# *****************************************************************************
+#
+# MCLinearRegressorBatch
+#
+# *****************************************************************************
+
+
+@task_decorator("MCLinearRegressorBatch", human_name="MC linear regressor batch",
+                short_description="Monte-Carlo linear regressions of many target columns in parallel")
+class MCLinearRegressorBatch(MCLinearRegressor):
+    """
+    Many independent robust Monte-Carlo based linear regressions, run in parallel
+
+    Each target column is regressed separately on the predictor columns, with the same priors. The regressions are
+    distributed over a pool of worker processes (see `MCLinRegSampler.trace_batch()`). The rows with missing
+    values of a regression are ignored.
+
+    * Input: a table containing the predictors and the targets.
+    * Output: the posterior summary of each target (one row per target and parameter): mean, standard deviation,
+    highest density interval, R-hat and bulk and tail effective sample sizes.
+    * Config Parameters:
+      - `predictor_column_names`: The predictor columns.
+      - `target_column_names`: The target columns (one regression per target).
+      - `nb_workers`: The number of worker processes. By default, the number of CPUs.
+      - `random_seed`: The random seed. The seeds of the regressions are derived from this seed.
+    """
+
+    output_specs = OutputSpecs({'result': OutputSpec(MCLinearRegressorTable, human_name="result",
+                                                     short_description="The output result")})
+    config_specs = ConfigSpecs({
+        'predictor_column_names': _create_column_names_param_set(
+            human_name="Predictor columns", short_description="The names of the predictor columns"),
+        'target_column_names': _create_column_names_param_set(
+            human_name="Target columns", short_description="The names of the target columns. One regression is fitted per target"),
+        'slope': _create_slope_param_set(),
+        'sigma': _create_sigma_param_set(),
+        'chains': IntParam(default_value=MCLinRegSampler.DEFAULT_CHAINS, min_value=1, human_name="Chains",
+                           short_description="The number of MCMC chains"),
+        'target_accept': FloatParam(default_value=MCLinRegSampler.DEFAULT_TARGET_ACCEPT, min_value=0, max_value=1, human_name="Target acceptance rate",
+                                    short_description="The target acceptance rate of the NUTS sampler. Increase it (e.g. 0.95) in case of divergences"),
+        'nb_workers': IntParam(default_value=None, optional=True, min_value=1, human_name="Workers",
+                               short_description="The number of worker processes. By default, the number of CPUs"),
+        'random_seed': IntParam(default_value=None, optional=True, human_name="Random seed",
+                                short_description="The random seed, for reproducible results. The seeds of the regressions are derived from this seed"),
+        'hdi_prob': FloatParam(default_value=MCSummaryHelper.DEFAULT_HDI_PROB, min_value=0, max_value=1, human_name="HDI probability",
+                               short_description="The probability of the highest density intervals of the posterior summary"),
+    })
+
+    def run(self, params: ConfigParams, inputs: TaskInputs) -> TaskOutputs:
+        table = inputs["table"]
+        x_data = table.select_by_column_names(params["predictor_column_names"]).get_data()
+        y_data = table.select_by_column_names(params["target_column_names"]).get_data()
+        common_names = set(x_data.columns) & set(y_data.columns)
+        if common_names:
+            raise BadRequestException(f"The columns {sorted(common_names)} cannot be both predictors and targets")
+
+        data_list = []
+        for name in y_data.columns:
+            is_valid = x_data.notna().all(axis=1) & y_data[name].notna()
+            data_list.append(MCLinRegData(x_data=x_data.loc[is_valid], y_data=y_data.loc[is_valid, [name]]))
+
+        sampler = MCLinRegSampler()
+        sampler.set_chains(params["chains"])
+        sampler.set_target_accept(params["target_accept"])
+        self._set_priors(sampler, params, x_data.shape[1])
+
+        nb_targets = len(data_list)
+        summaries = [None] * nb_targets
+        batch = sampler.trace_batch(data_list, random_seed=params["random_seed"], nb_workers=params["nb_workers"],
+                                    hdi_prob=params["hdi_prob"])
+        for count, (index, summary) in enumerate(batch):
+            summary = summary.reset_index()
+            summary.insert(0, "target", y_data.columns[index])
+            summaries[index] = summary
+            self.update_progress_value(100 * (count + 1) / nb_targets, f"{count + 1}/{nb_targets} regressions done")
+
+        result = pandas.concat(summaries, axis=0, ignore_index=True)
+        return {"result": MCLinearRegressorTable(data=result)}
+
+# *****************************************************************************
+#
+# MCLinearRegressorPredictor
+#
+# *****************************************************************************
+
+
+@task_decorator("MCLinearRegressorPredictor", human_name="MC linear regressor predictor",
+                short_description="Predict new data with the posterior draws of a Monte-Carlo linear regression")
+class MCLinearRegressorPredictor(Task):
+    """
+    Prediction of new data with the posterior draws of a `MCLinearRegressor`, without refitting the model
+
+    The predictions of all the posterior draws are computed with one matrix product (see `MCLinRegResult.predict()`).
+
+    * Input: a table containing the predictors (the other columns are ignored).
+    * Input: the posterior draws of the slopes, output by the `MCLinearRegressor` task.
+    * Output: the mean, the standard deviation and the quantiles of the predictions (one row per row of the table).
+    * Config Parameters:
+      - `target`: The target to predict. Only required if several targets were fitted.
+      - `chunk_size`: If given, the predictions are computed by chunks of draws, to bound the memory, and the
+      quantiles are estimated with a streaming sketch.
+    """
+
+    input_specs = InputSpecs({'table': InputSpec(Table, human_name="Table", short_description="The table to predict"),
+                              'posterior_draws': InputSpec(MCLinearRegressorDrawsTable, human_name="Posterior draws",
+                                                           short_description="The posterior draws of the slopes")})
+    output_specs = OutputSpecs({'result': OutputSpec(Table, human_name="result",
+                                                     short_description="The statistics of the predictions")})
+    config_specs = ConfigSpecs({
+        'target': StrParam(default_value=None, optional=True, human_name="Target",
+                           short_description="The target to predict. Only required if several targets were fitted"),
+        'chunk_size': IntParam(default_value=None, optional=True, min_value=1, human_name="Chunk size",
+                               short_description="The number of draws predicted at once. By default, all the draws"),
+    })
+
+    def run(self, params: ConfigParams, inputs: TaskInputs) -> TaskOutputs:
+        draws = inputs["posterior_draws"].get_data()
+        targets = list(draws["target"].unique())
+        target = params["target"]
+        if target is None:
+            if len(targets) > 1:
+                raise BadRequestException("The target is required to predict a multi-target regression")
+            target = targets[0]
+        elif target not in targets:
+            raise BadRequestException(f"The target '{target}' does not exist")
+
+        slope = draws.loc[draws["target"] == target].drop(columns=["target"])
+        stats = MCLinRegResult.predict_from_draws(
+            inputs["table"].get_data(), slope, list(slope.columns), chunk_size=params["chunk_size"])
+        return {"result": Table(data=stats)}
@@ -0,0 +1,108 @@
+# Gencovery software - All rights reserved
+# This software is the exclusive property of Gencovery SAS.
+# The use and distribution of this software is prohibited without the prior consent of Gencovery SAS.
+# About us: https://gencovery.com
+
+from typing import Tuple
+
+import numpy as np
+from gws_core import BadRequestException
+from scipy.linalg import cho_solve, cholesky, solve_triangular
+
+
+class MCConjugateLinRegHelper:
+    """
+    Closed-form posterior of the Bayesian linear regression `y ~ Normal(x @ slope, sigma)` with Normal slope priors
+
+    * Fixed sigma: the posterior of the slopes is Normal.
+    * Inverse-gamma prior on the variance `sigma^2`, the slope priors being conditional on the variance
+      (`slope ~ Normal(mu, prior_sd * sigma)`): the posterior is normal-inverse-gamma.
+
+    The columns of `y` (targets) are fitted independently. The posterior precision matrix of the slopes only depends
+    on `x` and the priors: it is factorized once (Cholesky) for all the targets.
+    """
+
+    @classmethod
+    def compute_posterior(cls, x: np.ndarray, y: np.ndarray, prior_mean: np.ndarray, prior_sd: np.ndarray,
+                          sigma: float = None, alpha: float = None, beta: float = None) -> dict:
+        """
+        Compute the parameters of the posterior
+
+        :param x: The (observation, predictor) design matrix
+        :param y: The (observation, target) responses
+        :param prior_mean: The means of the slope priors (one per predictor)
+        :param prior_sd: The standard deviations of the slope priors (relative to sigma with an inverse-gamma prior)
+        :param sigma: The fixed standard deviation of the noise
+        :param alpha: The shape of the inverse-gamma prior of the variance (if `sigma` is not given)
+        :param beta: The scale of the inverse-gamma prior of the variance (if `sigma` is not given)
+        :return: A dict with the (predictor, target) posterior `mean` of the slopes, the lower Cholesky factor
+        `precision_chol` of the precision matrix of the slopes (relative to the variance with an inverse-gamma prior)
+        and, with an inverse-gamma prior, the posterior `alpha` and the (target,) posterior `beta`
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if y.ndim == 1:
+            y = y[:, None]
+        prior_mean = np.asarray(prior_mean, dtype=float)
+        prior_precision = 1.0 / np.asarray(prior_sd, dtype=float) ** 2
+        if x.shape[0] != y.shape[0]:
+            raise BadRequestException("The x and y data must have the same number of rows")
+        if np.isnan(x).any() or np.isnan(y).any():
+            raise BadRequestException("The closed-form solver does not support missing values")
+
+        # the noise variance scales the data terms (fixed sigma) or the whole precision matrix (inverse-gamma)
+        data_weight = 1.0 / sigma ** 2 if sigma is not None else 1.0
+        precision = data_weight * (x.T @ x) + np.diag(prior_precision)
+        rhs = data_weight * (x.T @ y) + (prior_precision * prior_mean)[:, None]
+        precision_chol = cholesky(precision, lower=True)
+        mean = cho_solve((precision_chol, True), rhs)
+        posterior = {"mean": mean, "precision_chol": precision_chol}
+
+        if sigma is None:
+            nb_obs = x.shape[0]
+            posterior["alpha"] = alpha + nb_obs / 2
+            # mean' * precision * mean = mean' * rhs
+            posterior["beta"] = beta + 0.5 * ((y ** 2).sum(axis=0) + np.sum(prior_precision * prior_mean ** 2)
+                                              - np.sum(mean * rhs, axis=0))
+        return posterior
+
+    @classmethod
+    def compute_covariance(cls, posterior: dict) -> np.ndarray:
+        """
+        Compute the (target, predictor, predictor) posterior covariance matrices of the slopes
+
+        With an inverse-gamma prior, the covariance of the marginal (Student) posterior of the slopes is only defined
+        if the posterior `alpha` is greater than 1 (NaN otherwise).
+        """
+        precision_chol = posterior["precision_chol"]
+        nb_targets = posterior["mean"].shape[1]
+        inv_chol = solve_triangular(precision_chol, np.eye(precision_chol.shape[0]), lower=True)
+        covariance = inv_chol.T @ inv_chol
+        if "alpha" not in posterior:
+            return np.broadcast_to(covariance, (nb_targets,) + covariance.shape).copy()
+        alpha = posterior["alpha"]
+        scale = posterior["beta"] / (alpha - 1) if alpha > 1 else np.full(nb_targets, np.nan)
+        return scale[:, None, None] * covariance[None, :, :]
+
+    @classmethod
+    def sample(cls, posterior: dict, nb_samples: int, random_seed=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Draw independent samples from the posterior
+
+        :return: The (sample, predictor, target) slopes and, with an inverse-gamma prior, the (sample, target)
+        variances (None otherwise)
+        """
+        rng = np.random.default_rng(random_seed)
+        mean = posterior["mean"]
+        nb_predictors, nb_targets = mean.shape
+        variance = None
+        if "alpha" in posterior:
+            variance = posterior["beta"][None, :] / rng.gamma(posterior["alpha"], size=(nb_samples, nb_targets))
+
+        # slope = mean + L^-T z has the covariance (L L^T)^-1: one triangular solve for all the samples and targets
+        noise = rng.standard_normal(size=(nb_predictors, nb_samples * nb_targets))
+        noise = solve_triangular(posterior["precision_chol"], noise, lower=True, trans="T")
+        noise = noise.reshape(nb_predictors, nb_samples, nb_targets).transpose(1, 0, 2)
+        if variance is not None:
+            noise = noise * np.sqrt(variance)[:, None, :]
+        return mean[None, :, :] + noise, variance
@@ -0,0 +1,127 @@
+# Gencovery software - All rights reserved
+# This software is the exclusive property of Gencovery SAS.
+# The use and distribution of this software is prohibited without the prior consent of Gencovery SAS.
+# About us: https://gencovery.com
+
+import copy
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, Tuple
+
+import numpy as np
+from gws_core import BadRequestException
+from pandas import DataFrame
+
+from .mc_summary_helper import MCSummaryHelper
+
+
+class MCLinRegBatchHelper:
+    """
+    Fit many independent linear regressions (one `MCLinRegData` per item) in a process pool
+
+    Each worker process receives a copy of the sampler (priors and settings) when it starts. The models are built
+    and their step methods compiled once per worker and per shape of data: the data of the next items of the same
+    shape are swapped in the compiled model. The conjugate models are solved in closed form
+    (see `MCLinRegSampler.is_conjugate()`).
+    """
+
+    MAX_WORKER_MODELS = 8
+
+    # state of the worker processes
+    _worker_sampler = None
+    _worker_models: dict = None
+
+    @classmethod
+    def run(cls, sampler, data_list: list, random_seed=None, nb_workers: int = None,
+            hdi_prob: float = MCSummaryHelper.DEFAULT_HDI_PROB) -> Iterator[Tuple[int, DataFrame]]:
+        """
+        Fit the regressions and yield their posterior summaries (see `MCLinRegResult.get_summary()`) as they complete
+
+        :param sampler: The sampler (`MCLinRegSampler`) defining the priors and the settings of all the regressions
+        :param data_list: The data of the regressions
+        :param random_seed: One seed, from which the seeds of the items are derived, or a list of seeds (one per item).
+        The result of an item does not depend on the worker that fits it.
+        :param nb_workers: The number of worker processes. By default, the number of CPUs
+        :return: An iterator of (index of the item, summary) tuples, in the order of completion
+        """
+        nb_items = len(data_list)
+        seeds = cls.get_item_seeds(random_seed, nb_items)
+        if nb_workers is None:
+            nb_workers = os.cpu_count() or 1
+        if nb_workers < 1:
+            raise BadRequestException("The number of workers must be greater than 0")
+
+        # the chains of an item run sequentially in its worker
+        worker_sampler = copy.copy(sampler)
+        worker_sampler.set_cores(1)
+        worker_sampler.set_trace_cache(None)
+        worker_sampler.set_data(None)
+        worker_sampler._model = None
+
+        items = iter(zip(range(0, nb_items), data_list, seeds))
+        with ProcessPoolExecutor(max_workers=nb_workers, initializer=cls._init_worker,
+                                 initargs=(worker_sampler,)) as executor:
+            pending = set()
+
+            def submit_next():
+                item = next(items, None)
+                if item is not None:
+                    pending.add(executor.submit(cls._fit, *item, hdi_prob))
+
+            # a bounded number of items are sent to the workers at once
+            for _ in range(0, 2 * nb_workers):
+                submit_next()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    submit_next()
+                    yield future.result()
+
+    @staticmethod
+    def get_item_seeds(random_seed, nb_items: int) -> list:
+        """ Returns the seeds of the items, derived from one seed or given as a list """
+        if random_seed is None:
+            return [None] * nb_items
+        if isinstance(random_seed, (list, tuple)):
+            if len(random_seed) != nb_items:
+                raise BadRequestException(
+                    f"One seed per item is expected ({nb_items} items) but {len(random_seed)} seeds are given")
+            return list(random_seed)
+        return [int(seq.generate_state(1)[0]) for seq in np.random.SeedSequence(random_seed).spawn(nb_items)]
+
+    # -- worker --
+
+    @classmethod
+    def _init_worker(cls, sampler):
+        cls._worker_sampler = sampler
+        cls._worker_models = {}
+
+    @classmethod
+    def _fit(cls, index: int, data, random_seed, hdi_prob: float) -> Tuple[int, DataFrame]:
+        sampler = cls._worker_sampler
+        sampler.set_data(data)
+        if sampler.is_conjugate():
+            result = sampler.trace(random_seed=random_seed)
+        else:
+            model, step = cls._get_worker_model(sampler, data)
+            trace = sampler._run_inference(model, random_seed=random_seed, step=step)
+            result = sampler._create_result(trace)
+        return index, result.get_summary(hdi_prob=hdi_prob)
+
+    @classmethod
+    def _get_worker_model(cls, sampler, data):
+        """ Returns the model and the step method of the shape of the data, with the data swapped in the model """
+        key = (data.x_data.shape[0], tuple(str(name) for name in data.x_data.columns),
+               tuple(str(name) for name in data.y_data.columns))
+        if key in cls._worker_models:
+            model, step = cls._worker_models.pop(key)
+            sampler.update_model_data(model, data)
+        else:
+            if len(cls._worker_models) >= cls.MAX_WORKER_MODELS:
+                # remove the least recently used model
+                cls._worker_models.pop(next(iter(cls._worker_models)))
+            model = sampler.create_model()
+            step = sampler.create_step(model)
+        cls._worker_models[key] = (model, step)
+        return model, step
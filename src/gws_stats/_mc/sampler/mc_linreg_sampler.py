@@ -3,14 +3,21 @@
 # The use and distribution of this software is prohibited without the prior consent of Gencovery SAS.
 # About us: https://gencovery.com
 
-from typing import Type, List
+import copy
+from typing import Iterator, List, Tuple, Type
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
 
 import arviz as az
 import pymc as pm
 from gws_core import BadRequestException
+from .mc_conjugate_linreg_helper import MCConjugateLinRegHelper
+from .mc_linreg_batch_helper import MCLinRegBatchHelper
 from .mc_sampler import MCSampler
+from .mc_streaming_stats import MCQuantileSketch, MCRunningMoments
+from .mc_summary_helper import MCSummaryHelper
+from .mc_trace_storage import MCTraceStorage
 
 
 class MCLinRegData:
@@ -29,6 +36,9 @@ class MCLinRegData:
 
 class MCLinRegResult:
     """ Linear regression data """
+    DEFAULT_PREDICTION_CHUNK_SIZE = 1000
+    DEFAULT_PREDICTION_QUANTILES = [0.05, 0.5, 0.95]
+
     _traces = None
     _data: MCLinRegData = None
 
@@ -39,13 +49,60 @@ class MCLinRegResult:
     def get_traces(self):
         return self._traces
 
-    def get_slope_traces(self, num_samples=None):
-        dfs = []
-        for i, colname in enumerate(self._data.x_data.columns):
-            data = az.extract(self._traces, num_samples=num_samples, group='posterior',
-                              combined=True, var_names=f"slope_{i}")
-            dfs.append(DataFrame(data.T, columns=[colname]))
-        return pd.concat(dfs, axis=1)
+    def save_traces(self, path: str, compression_level: int = MCTraceStorage.DEFAULT_COMPRESSION_LEVEL):
+        """
+        Write the traces in a compressed NetCDF file (see `MCTraceStorage`). The result can be restored with
+        `MCLinRegResult(MCTraceStorage.read(path), data)`
+        """
+        MCTraceStorage.write(self._traces, path, compression_level=compression_level)
+
+    def is_multi_target(self) -> bool:
+        """ Returns True if several targets (columns of `y_data`) are fitted """
+        return self._data.y_data.shape[1] > 1
+
+    def get_target_names(self) -> list:
+        """ Returns the names of the targets (columns of `y_data`) """
+        return list(self._data.y_data.columns)
+
+    def get_slope_traces(self, num_samples=None, target=None):
+        """
+        Returns the slope draws (one row per draw and one column per predictor)
+
+        :param target: The target of a multi-target regression. If not given, the slopes of all the targets are returned
+        with (target, predictor) columns
+        """
+        data = az.extract(self._traces, num_samples=num_samples, group='posterior',
+                          combined=True, var_names="slope")
+        if not self.is_multi_target():
+            return DataFrame(data.transpose("sample", ...).values, columns=self._data.x_data.columns)
+        if target is not None:
+            self._check_target(target)
+            data = data.sel(target=target)
+            return DataFrame(data.transpose("sample", "predictor").values, columns=self._data.x_data.columns)
+
+        values = data.transpose("sample", "target", "predictor").values
+        columns = pd.MultiIndex.from_product(
+            [self.get_target_names(), list(self._data.x_data.columns)], names=["target", "predictor"])
+        return DataFrame(values.reshape(values.shape[0], -1), columns=columns)
+
+    def get_summary(self, hdi_prob: float = MCSummaryHelper.DEFAULT_HDI_PROB) -> DataFrame:
+        """
+        Returns the posterior summary of the slopes and of the noise: mean, standard deviation, highest density
+        interval, R-hat and bulk and tail effective sample sizes (one row per parameter, e.g. `slope[var1]`)
+        """
+        var_names = ["slope"] + [name for name in self._traces.posterior.data_vars if name.startswith("sigma")]
+        return MCSummaryHelper.summarize(self._traces, var_names=var_names, hdi_prob=hdi_prob, with_diagnostics=True)
+
+    def _check_target(self, target):
+        if target not in self.get_target_names():
+            raise BadRequestException(f"The target '{target}' does not exist")
+
+    def _get_prediction_target(self, target):
+        if not self.is_multi_target():
+            return None
+        if target is None:
+            raise BadRequestException("The target is required to predict a multi-target regression")
+        return target
 
     # def get_intercept_traces(self, num_samples=None):
     #     data = az.extract(self._traces, num_samples=num_samples, group='posterior',
@@ -53,40 +110,239 @@ class MCLinRegResult:
     #     df = DataFrame(data.T, columns=self._data.y_data.columns)
     #     return df
 
-    def get_predictions(self, num_samples=None):
-        slope = self.get_slope_traces(num_samples=num_samples)
-        intercept = None
-        # if "intercept_0" in self._traces.posterior:
-        #     intercept = self.get_intercept_traces(num_samples=num_samples)
+    def _get_prediction_slope(self, num_samples=None, target=None) -> np.ndarray:
+        target = self._get_prediction_target(target)
+        return self.get_slope_traces(num_samples=num_samples, target=target).to_numpy(dtype=float)
+
+    def get_posterior_draws(self, num_samples=None) -> DataFrame:
+        """
+        Returns the slope draws of all the targets, to predict new data without the traces (see `predict_from_draws()`)
+
+        :return: A table with one row per target and draw: the column `target`, then one column per predictor
+        """
+        draws = []
+        for target in self.get_target_names():
+            slope = self.get_slope_traces(num_samples=num_samples, target=target if self.is_multi_target() else None)
+            slope.insert(0, "target", target)
+            draws.append(slope)
+        return pd.concat(draws, axis=0, ignore_index=True)
+
+    @staticmethod
+    def _iter_predictions(x_data: np.ndarray, slope: np.ndarray, chunk_size=None):
+        """ Yields the predictions (one column per posterior draw) by chunks of draws """
+        nb_draws = slope.shape[0]
+        if not chunk_size:
+            chunk_size = max(nb_draws, 1)
+        for start in range(0, nb_draws, chunk_size):
+            yield x_data @ slope[start:start+chunk_size, :].T
+
+    def get_predictions(self, num_samples=None, target=None):
+        """
+        Returns the predictions of the posterior draws (one column per draw)
+
+        The predictions of all the draws are stored in memory: see `stream_predictions()` for large data.
+
+        :param target: The target to predict. Only required for multi-target regressions
+        """
+        slope = self._get_prediction_slope(num_samples=num_samples, target=target)
+        preds = np.concatenate(list(self._iter_predictions(self._data.x_data.to_numpy(dtype=float), slope)), axis=1)
+        return DataFrame(preds, index=self._data.x_data.index)
+
+    def get_prediction_stats(self, num_samples=None, chunk_size=DEFAULT_PREDICTION_CHUNK_SIZE, target=None):
+        """
+        Returns the mean and the standard deviation of the predictions of the posterior draws
+
+        The predictions are computed by chunks of `chunk_size` draws and their statistics are merged
+        (parallel algorithm of Chan et al.) so that the predictions of all the draws are never stored.
+
+        :param target: The target to predict. Only required for multi-target regressions
+        """
+        moments = MCRunningMoments(self._data.x_data.shape[0])
+        slope = self._get_prediction_slope(num_samples=num_samples, target=target)
+        for preds in self._iter_predictions(self._data.x_data.to_numpy(dtype=float), slope, chunk_size=chunk_size):
+            moments.update(preds)
+        return DataFrame({"mean": moments.get_mean(), "std": moments.get_std()}, index=self._data.x_data.index)
+
+    def stream_predictions(self, num_samples=None, chunk_size=DEFAULT_PREDICTION_CHUNK_SIZE, target=None,
+                           quantiles=None, draws_path: str = None, thin: int = 1) -> DataFrame:
+        """
+        Returns the mean, the standard deviation and the quantiles of the predictions of the posterior draws,
+        with a memory that does not depend on the number of draws
+
+        The predictions are computed by chunks of `chunk_size` draws. The mean and the standard deviation are merged
+        across the chunks and the quantiles are estimated with a streaming sketch (see `MCQuantileSketch`).
+
+        :param target: The target to predict. Only required for multi-target regressions
+        :param quantiles: The probabilities of the quantiles. Default is `DEFAULT_PREDICTION_QUANTILES`
+        :param draws_path: If given, the predictions of one draw out of `thin` are also written as float32 in this
+        `.npy` file (one row per row of `x_data` and one column per kept draw), to be opened with
+        `numpy.load(draws_path, mmap_mode="r")`
+        :param thin: The thinning of the draws written in `draws_path`
+        :return: A table with the columns `mean`, `std` and one column per quantile (e.g. `5%`)
+        """
+        if chunk_size < 1:
+            raise BadRequestException("The chunk size must be greater than 0")
+        slope = self._get_prediction_slope(num_samples=num_samples, target=target)
+        return self._stream_prediction_stats(
+            self._data.x_data.to_numpy(dtype=float), slope, chunk_size, quantiles=quantiles,
+            index=self._data.x_data.index, draws_path=draws_path, thin=thin)
+
+    def predict(self, new_x, num_samples=None, chunk_size=None, target=None, quantiles=None) -> DataFrame:
+        """
+        Returns the mean, the standard deviation and the quantiles of the predictions of the posterior draws on new
+        data, without refitting the model
+
+        :param new_x: The new data: a DataFrame with (at least) the predictor columns of `x_data`, or an array with one
+        column per predictor
+        :param chunk_size: If given, the predictions are computed by chunks of `chunk_size` draws and the quantiles are
+        estimated with a streaming sketch (see `stream_predictions()`). By default, the predictions of all the draws
+        are computed at once and the quantiles are exact
+        :param target: The target to predict. Only required for multi-target regressions
+        :param quantiles: The probabilities of the quantiles. Default is `DEFAULT_PREDICTION_QUANTILES`
+        :return: A table with the columns `mean`, `std` and one column per quantile (e.g. `5%`)
+        """
+        slope = self._get_prediction_slope(num_samples=num_samples, target=target)
+        return self.predict_from_draws(new_x, slope, self._data.x_data.columns, chunk_size=chunk_size,
+                                       quantiles=quantiles)
+
+    @classmethod
+    def predict_from_draws(cls, new_x, slope, predictor_names: list, chunk_size=None, quantiles=None) -> DataFrame:
+        """
+        Returns the statistics of the predictions of slope draws on new data (see `predict()`)
+
+        :param new_x: The new data: a DataFrame with (at least) the predictor columns, or an array with one column per
+        predictor
+        :param slope: The (draw, predictor) slope draws, e.g. the draws of a target from `get_posterior_draws()`
+        :param predictor_names: The names of the predictors (columns of `slope`)
+        """
+        index = None
+        if isinstance(new_x, DataFrame):
+            missing_names = [name for name in predictor_names if name not in new_x.columns]
+            if missing_names:
+                raise BadRequestException(f"The predictor columns {missing_names} are missing in the new data")
+            index = new_x.index
+            new_x = new_x.loc[:, list(predictor_names)]
+        x_data = np.asarray(new_x, dtype=float)
+        if x_data.ndim != 2 or x_data.shape[1] != len(predictor_names):
+            raise BadRequestException(f"The new data must have {len(predictor_names)} columns (one per predictor)")
+
+        slope = np.asarray(slope, dtype=float)
+        if chunk_size is not None and chunk_size < 1:
+            raise BadRequestException("The chunk size must be greater than 0")
+        if chunk_size is not None and chunk_size < slope.shape[0]:
+            return cls._stream_prediction_stats(x_data, slope, chunk_size, quantiles=quantiles, index=index)
+
+        # all the draws at once: one matrix product and exact quantiles
+        probs = cls._get_quantile_probs(quantiles)
+        preds = x_data @ slope.T
+        stats = DataFrame({"mean": preds.mean(axis=1), "std": preds.std(axis=1, ddof=1)}, index=index)
+        return cls._add_quantile_columns(stats, probs, np.quantile(preds, probs, axis=1).T)
+
+    @classmethod
+    def _stream_prediction_stats(cls, x_data: np.ndarray, slope: np.ndarray, chunk_size: int, quantiles=None,
+                                 index=None, draws_path: str = None, thin: int = 1) -> DataFrame:
+        if thin < 1:
+            raise BadRequestException("The thinning must be greater than 0")
+        nb_rows = x_data.shape[0]
+        moments = MCRunningMoments(nb_rows)
+        sketch = MCQuantileSketch(nb_rows, cls._get_quantile_probs(quantiles))
+        draws = None
+        if draws_path is not None:
+            nb_kept_draws = (slope.shape[0] + thin - 1) // thin
+            draws = np.lib.format.open_memmap(draws_path, mode="w+", dtype=np.float32, shape=(nb_rows, nb_kept_draws))
+
+        start = 0
+        for preds in cls._iter_predictions(x_data, slope, chunk_size=chunk_size):
+            moments.update(preds)
+            sketch.update(preds)
+            if draws is not None:
+                # indexes of the kept draws of the chunk, in the whole sequence of draws
+                first = -start % thin
+                draws[:, (start + first) // thin:(start + preds.shape[1] + thin - 1) // thin] = preds[:, first::thin]
+            start += preds.shape[1]
+        if draws is not None:
+            draws.flush()
+            del draws
+
+        stats = DataFrame({"mean": moments.get_mean(), "std": moments.get_std()}, index=index)
+        return cls._add_quantile_columns(stats, sketch.get_probs(), sketch.get_quantiles())
+
+    @classmethod
+    def _get_quantile_probs(cls, quantiles=None) -> np.ndarray:
+        if quantiles is None:
+            quantiles = cls.DEFAULT_PREDICTION_QUANTILES
+        probs = np.atleast_1d(np.asarray(quantiles, dtype=float))
+        if np.any((probs <= 0) | (probs >= 1)):
+            raise BadRequestException("The probabilities of the quantiles must be between 0 and 1")
+        return probs
+
+    @staticmethod
+    def _add_quantile_columns(stats: DataFrame, probs: np.ndarray, quantile_values: np.ndarray) -> DataFrame:
+        for i, prob in enumerate(probs):
+            stats[f"{100 * prob:g}%"] = quantile_values[:, i]
+        return stats
+
+
+class MCConjugateLinRegResult(MCLinRegResult):
+    """
+    Linear regression result computed in closed form (see `MCLinRegSampler.is_conjugate()`)
 
-        preds = []
-        for i in range(0, num_samples):
-            if intercept is None:
-                preds.append(self._data.x_data @ slope.iloc[i, :].T)
-            else:
-                preds.append(intercept + self._data.x_data @ slope.iloc[i, :].T)
+    The traces are independent draws from the exact posterior. The posterior means and covariances of the slopes are
+    also available.
+    """
+
+    _posterior: dict = None
 
-        preds = pd.concat(preds, axis=1)
-        return preds
+    def __init__(self, traces, data: MCLinRegData, posterior: dict):
+        super().__init__(traces, data)
+        self._posterior = posterior
 
-    def get_prediction_stats(self, num_samples=None):
-        preds = self.get_predictions(num_samples=num_samples)
-        pred_std = preds.std(axis=1)
-        pred_mean = preds.mean(axis=1)
-        pred_stats = pd.concat([pred_mean, pred_std], axis=1)
-        pred_stats.columns = ["mean", "std"]
-        return pred_stats
+    def get_slope_mean(self, target=None):
+        """
+        Returns the posterior mean of the slopes (one value per predictor)
+
+        :param target: The target of a multi-target regression. If not given, the means of all the targets are
+        returned (one column per target)
+        """
+        mean = DataFrame(self._posterior["mean"], index=self._data.x_data.columns, columns=self.get_target_names())
+        if not self.is_multi_target():
+            return mean.iloc[:, 0]
+        if target is not None:
+            self._check_target(target)
+            return mean.loc[:, target]
+        return mean
+
+    def get_slope_covariance(self, target=None) -> DataFrame:
+        """
+        Returns the posterior covariance matrix of the slopes
+
+        :param target: The target of a multi-target regression. Only required for multi-target regressions
+        """
+        target = self._get_prediction_target(target)
+        index = 0 if target is None else self.get_target_names().index(target)
+        covariance = MCConjugateLinRegHelper.compute_covariance(self._posterior)[index]
+        return DataFrame(covariance, index=self._data.x_data.columns, columns=self._data.x_data.columns)
 
 
 class MCLinRegSampler(MCSampler):
     """
     Robust Monte-Carlo based Linear Regression
     See also https://www.pymc.io/projects/examples/en/latest/generalized_linear_models/GLM-robust.html
+
+    The sigma prior is either a distribution of the standard deviation of the noise (e.g. `HalfCauchy`), a fixed value
+    (`{"func": "Fixed", "value": ...}`) or an inverse-gamma distribution of the variance of the noise
+    (`{"func": "InverseGamma", "alpha": ..., "beta": ...}`). With an inverse-gamma prior, the slope priors must be
+    Normal and they are conditional on the noise (`slope ~ Normal(mu, sigma * sigma_noise)`), as in the conjugate
+    normal-inverse-gamma model.
+
+    When the slope priors are Normal, the likelihood is Normal and sigma is fixed or has an inverse-gamma prior, the
+    posterior is analytic: it is computed in closed form instead of running the inference method
+    (see `set_conjugate_solver()`).
     """
 
     _tune = 1000
     _draws = 2000
-    _chains = 2
+    _inference_method = "nuts"
     _model = None
 
     _slope_priors = None
@@ -95,12 +351,15 @@ class MCLinRegSampler(MCSampler):
 
     _intercept_names: List[str] = None
     _likelihood_distrib = pm.Normal
+    _use_conjugate_solver = True
 
     def set_slope_priors(self, priors: list):
+        """
+        Set the priors of the slopes (one prior per column of `x_data`).
+        Priors using the same distribution function are vectorized in a single random variable `slope`.
+        """
         if not isinstance(priors, list):
             raise BadRequestException("Slope priors: a list of dict is expected")
-        for i, prior in enumerate(priors):
-            prior["name"] = f"slope_{i}"
         self._slope_priors = priors
 
     # def set_intercept_priors(self, priors: list):
@@ -111,6 +370,8 @@ class MCLinRegSampler(MCSampler):
     def set_sigma_prior(self, prior: dict):
         if not isinstance(prior, dict):
             raise BadRequestException("Sigma prior: a dict is expected")
+        if prior.get("func") == "Fixed" and not prior.get("value", 0) > 0:
+            raise BadRequestException("Sigma prior: a fixed sigma must have a value greater than 0")
         priors = [prior]
         for i, prior in enumerate(priors):
             prior["name"] = f"sigma_{i}"
@@ -119,32 +380,248 @@ class MCLinRegSampler(MCSampler):
     def set_likelihood_type(self, likelihood_type: Type[pm.Distribution]):
         self._likelihood_distrib = likelihood_type
 
-    def create_model(self, args=None):
-
-        with pm.Model() as model:
-            data = self.get_observed_data()
-            x_out = data.x_data
-            y_out = data.y_data
-
-            slopes = self._build_distribs(self._slope_priors)
-            sigmas = self._build_distribs(self._sigma_priors)
-
-            mu_hat = 0
-            for i, slope in enumerate(slopes):
-                name = x_out.columns[i]
-                xi = pm.ConstantData(name, x_out.iloc[:, i])
-                mu_hat = mu_hat + xi * slope
+    def set_conjugate_solver(self, is_enabled: bool):
+        """ Enable or disable the closed-form solver of the conjugate models (enabled by default) """
+        self._use_conjugate_solver = is_enabled
+
+    def is_conjugate(self) -> bool:
+        """ Returns True if the posterior is computed in closed form (see `MCConjugateLinRegHelper`) """
+        if not self._use_conjugate_solver or self._likelihood_distrib is not pm.Normal:
+            return False
+        if self._intercept_priors is not None or self._sigma_priors is None or self._slope_priors is None:
+            return False
+        sigma_prior = self._sigma_priors[0]
+        if sigma_prior["func"] == "InverseGamma":
+            # the closed-form posterior is parametrized by the shape and the scale
+            is_conjugate_sigma = set(self._get_sigma_params()) == {"alpha", "beta"}
+        else:
+            is_conjugate_sigma = sigma_prior["func"] == "Fixed"
+        return is_conjugate_sigma and self._has_normal_slope_priors()
+
+    def _has_normal_slope_priors(self) -> bool:
+        return all(prior.get("func") == "Normal" and set(prior) <= {"name", "func", "mu", "sigma"}
+                   for prior in self._slope_priors)
+
+    def _get_normal_slope_params(self):
+        if not self._has_normal_slope_priors():
+            raise BadRequestException(
+                "Slope priors: Normal priors (with `mu` and `sigma`) are required with an InverseGamma sigma prior")
+        mu = np.array([prior.get("mu", 0.0) for prior in self._slope_priors], dtype=float)
+        sigma = np.array([prior.get("sigma", 1.0) for prior in self._slope_priors], dtype=float)
+        return mu, sigma
+
+    def _get_sigma_params(self) -> dict:
+        return {key: val for key, val in self._sigma_priors[0].items() if key not in ["name", "func"]}
 
+    def create_model(self, args=None):
+        """
+        Create the model
+
+        If `y_data` has several columns (targets), independent slope vectors and sigmas are fitted for all the
+        targets in one vectorized model: `slope` has the dimensions (`predictor`, `target`) and `sigma` has the
+        dimension `target`. The priors of a predictor are shared by all the targets.
+        """
+        data = self.get_observed_data()
+        x_out = data.x_data
+        y_out = data.y_data
+        if len(self._slope_priors) != x_out.shape[1]:
+            raise BadRequestException(
+                f"Slope priors: {x_out.shape[1]} priors are expected (one per column) but {len(self._slope_priors)} are given")
+
+        is_multi_target = y_out.shape[1] > 1
+        coords = {"predictor": list(x_out.columns), "observation": list(range(0, x_out.shape[0]))}
+        if is_multi_target:
+            coords["target"] = list(y_out.columns)
+            obs_dims = ("observation", "target")
+        else:
+            obs_dims = "observation"
+        y_values = self._get_observed_values(y_out)
+
+        with pm.Model(coords=coords) as model:
+            # one design matrix and one slope vector: the size of the graph does not depend on the number of predictors
+            # the data can be swapped without rebuilding the model (see `trace_many()` and `trace_batch()`)
+            x_data = pm.Data("x", x_out.to_numpy(dtype=float), dims=("observation", "predictor"))
+            y_data = pm.Data("y_obs", y_values, dims=obs_dims)
+            sigma_func = self._sigma_priors[0]["func"]
+            slope_dims = ("predictor", "target") if is_multi_target else "predictor"
+            if sigma_func == "InverseGamma":
+                # conjugate prior of the variance: the slope priors are conditional on the variance
+                slope_mu, slope_sigma = self._get_normal_slope_params()
+                if is_multi_target:
+                    variance = pm.InverseGamma("sigma_sq", **self._get_sigma_params(), dims="target")
+                    sigma = pm.Deterministic("sigma", pm.math.sqrt(variance), dims="target")
+                    slope_mu, slope_sigma = slope_mu[:, None], slope_sigma[:, None] * sigma
+                else:
+                    variance = pm.InverseGamma("sigma_sq_0", **self._get_sigma_params())
+                    sigma = pm.Deterministic("sigma_0", pm.math.sqrt(variance))
+                    slope_sigma = slope_sigma * sigma
+                slope = pm.Normal("slope", mu=slope_mu, sigma=slope_sigma, dims=slope_dims)
+            else:
+                slope = self._build_vector_distrib("slope", self._slope_priors, dims=slope_dims)
+                if sigma_func == "Fixed":
+                    sigma = float(self._sigma_priors[0]["value"])
+                elif is_multi_target:
+                    sigma = self._build_vector_distrib(
+                        "sigma", [copy.deepcopy(self._sigma_priors[0]) for _ in y_out.columns], dims="target")
+                else:
+                    sigma = self._build_distribs(copy.deepcopy(self._sigma_priors))[0]
+
+            mu_hat = pm.math.dot(x_data, slope)
             if self._intercept_priors is not None:
-                intercepts = self._build_distribs(self._intercept_priors)
+                intercepts = self._build_distribs(copy.deepcopy(self._intercept_priors))
                 mu_hat = mu_hat + intercepts[0]
 
-            mu_hat = pm.Deterministic("mu", mu_hat)
-            self._likelihood_distrib("y", mu=mu_hat, sigma=sigmas[0], observed=y_out)
+            mu_hat = pm.Deterministic("mu", mu_hat, dims=obs_dims)
+            self._likelihood_distrib("y", mu=mu_hat, sigma=sigma, observed=y_data, dims=obs_dims)
 
             return model
 
-    def sample(self, model, random_seed=None):
+    @staticmethod
+    def _get_observed_values(y_data: DataFrame) -> np.ndarray:
+        if y_data.shape[1] > 1:
+            return y_data.to_numpy(dtype=float)
+        return y_data.iloc[:, 0].to_numpy(dtype=float)
+
+    def update_model_data(self, model, data: MCLinRegData):
+        """
+        Swap the data of a model created with `create_model()` by data of the same shape, without rebuilding
+        (and recompiling) the model
+        """
         with model:
-            traces = pm.sample(random_seed=random_seed, draws=self._draws, tune=self._tune, chains=self._chains)
-            return MCLinRegResult(traces, data=self.get_observed_data())
+            pm.set_data({"x": data.x_data.to_numpy(dtype=float), "y_obs": self._get_observed_values(data.y_data)})
+
+    def trace(self, random_seed=None, args=None):
+        """
+        Create the model and run the inference, or compute the posterior in closed form if the model is conjugate
+        (see `is_conjugate()`)
+        """
+        if not self.is_conjugate():
+            return super().trace(random_seed=random_seed, args=args)
+        self._check_random_seed(random_seed)
+        data = self.get_observed_data()
+        posterior, slope, variance = self._sample_conjugate(data.y_data, random_seed=random_seed)
+        trace = self._create_conjugate_trace(slope, variance, list(data.y_data.columns))
+        # no deterministic besides the ones required by the result
+        trace = self._compact_trace(trace)
+        return MCConjugateLinRegResult(trace, data=data, posterior=posterior)
+
+    def _sample_conjugate(self, y_data: DataFrame, random_seed=None):
+        """ Compute the closed-form posterior of all the columns of `y_data` and draw `chains` x `draws` samples """
+        self._convergence_diagnostics = None
+        self._is_converged = None
+        x_out = self.get_observed_data().x_data
+        if len(self._slope_priors) != x_out.shape[1]:
+            raise BadRequestException(
+                f"Slope priors: {x_out.shape[1]} priors are expected (one per column) but {len(self._slope_priors)} are given")
+        slope_mu, slope_sigma = self._get_normal_slope_params()
+        sigma_params = self._get_sigma_params()
+        if self._sigma_priors[0]["func"] == "Fixed":
+            sigma_params = {"sigma": float(sigma_params["value"])}
+        posterior = MCConjugateLinRegHelper.compute_posterior(
+            x_out.to_numpy(dtype=float), y_data.to_numpy(dtype=float), slope_mu, slope_sigma, **sigma_params)
+        slope, variance = MCConjugateLinRegHelper.sample(
+            posterior, self._chains * self._draws, random_seed=random_seed)
+        return posterior, slope, variance
+
+    def _create_conjugate_trace(self, slope: np.ndarray, variance: np.ndarray, targets: list):
+        """ Create the traces (`arviz.InferenceData`) of the conjugate draws, with the variables of the model """
+        shape = (self._chains, self._draws)
+        coords = {"predictor": list(self.get_observed_data().x_data.columns)}
+        if len(targets) > 1:
+            coords["target"] = targets
+            posterior = {"slope": slope.reshape(shape + slope.shape[1:])}
+            dims = {"slope": ["predictor", "target"]}
+            if variance is not None:
+                posterior["sigma_sq"] = variance.reshape(shape + variance.shape[1:])
+                posterior["sigma"] = np.sqrt(posterior["sigma_sq"])
+                dims.update({"sigma_sq": ["target"], "sigma": ["target"]})
+        else:
+            posterior = {"slope": slope[:, :, 0].reshape(shape + slope.shape[1:2])}
+            dims = {"slope": ["predictor"]}
+            if variance is not None:
+                posterior["sigma_sq_0"] = variance[:, 0].reshape(shape)
+                posterior["sigma_0"] = np.sqrt(posterior["sigma_sq_0"])
+        return az.from_dict(posterior=posterior, coords=coords, dims=dims)
+
+    def trace_many(self, y_data: DataFrame, random_seed=None, hdi_prob: float = MCSummaryHelper.DEFAULT_HDI_PROB) -> DataFrame:
+        """
+        Fit the same regression (same `x_data` and priors) to each column of `y_data`
+
+        The model and the step method are built once and the observed data are swapped for each response column,
+        so that the graph is not rebuilt nor recompiled for each column. If the model is conjugate
+        (see `is_conjugate()`), the posteriors of all the columns are computed at once in closed form. Only the
+        posterior summaries are kept.
+
+        :param y_data: The response columns, with the same rows as `x_data`
+        :param random_seed: One seed, from which the seeds of the columns are derived, or a list of seeds (one per
+        column)
+        :return: The posterior summary of the parameters of each response column (one row per column and parameter)
+        """
+        if not isinstance(y_data, DataFrame):
+            raise BadRequestException("Data y_data must be a DataFrame")
+        data = self.get_observed_data()
+        if data.y_data.shape[1] > 1:
+            raise BadRequestException("The observed y_data must have a single column to fit many response columns")
+        x_out = data.x_data
+        if y_data.shape[0] != x_out.shape[0]:
+            raise BadRequestException(
+                f"The response data must have the same number of rows as x_data ({x_out.shape[0]} rows)")
+
+        if self.is_conjugate():
+            _, slope, variance = self._sample_conjugate(y_data, random_seed=random_seed)
+            var_names = ["slope", "sigma_sq_0"] if variance is not None else ["slope"]
+            summaries = []
+            for i, name in enumerate(y_data.columns):
+                trace = self._create_conjugate_trace(
+                    slope[:, :, [i]], variance[:, [i]] if variance is not None else None, [name])
+                summary = MCSummaryHelper.summarize(trace, var_names=var_names, hdi_prob=hdi_prob).reset_index()
+                summary.insert(0, "target", name)
+                summaries.append(summary)
+            return pd.concat(summaries, axis=0, ignore_index=True)
+
+        seeds = MCLinRegBatchHelper.get_item_seeds(random_seed, y_data.shape[1])
+        model = self.create_model()
+        step = self.create_step(model)
+        var_names = ["slope"] + [rv.name for rv in model.free_RVs if not rv.name.startswith("slope")]
+        summaries = []
+        for name, seed in zip(y_data.columns, seeds):
+            with model:
+                pm.set_data({"y_obs": y_data.loc[:, name].to_numpy(dtype=float)})
+            trace = self._run_inference(model, random_seed=seed, step=step)
+            summary = MCSummaryHelper.summarize(trace, var_names=var_names, hdi_prob=hdi_prob).reset_index()
+            summary.insert(0, "target", name)
+            summaries.append(summary)
+        return pd.concat(summaries, axis=0, ignore_index=True)
+
+    def trace_batch(self, data_list: List[MCLinRegData], random_seed=None, nb_workers: int = None,
+                    hdi_prob: float = MCSummaryHelper.DEFAULT_HDI_PROB) -> Iterator[Tuple[int, DataFrame]]:
+        """
+        Fit many independent regressions (same priors and settings) in a process pool
+        (see `MCLinRegBatchHelper`)
+
+        :param data_list: The data of the regressions
+        :param random_seed: One seed, from which the seeds of the regressions are derived, or a list of seeds
+        (one per regression)
+        :param nb_workers: The number of worker processes. By default, the number of CPUs
+        :return: An iterator of (index of the data, posterior summary) tuples, yielded as the regressions complete
+        """
+        for data in data_list:
+            if not isinstance(data, MCLinRegData):
+                raise BadRequestException("A list of MCLinRegData is expected")
+        return MCLinRegBatchHelper.run(
+            self, data_list, random_seed=random_seed, nb_workers=nb_workers, hdi_prob=hdi_prob)
+
+    def get_result_var_names(self) -> list:
+        # `slope` is a deterministic with mixed priors and `sigma` a deterministic with an InverseGamma prior
+        return ["slope", "sigma", "sigma_0"]
+
+    def _get_model_specs(self) -> dict:
+        return {
+            "slope_priors": self._slope_priors,
+            "intercept_priors": self._intercept_priors,
+            "sigma_priors": self._sigma_priors,
+            "likelihood": self._likelihood_distrib
+        }
+
+    def _create_result(self, trace):
+        return MCLinRegResult(trace, data=self.get_observed_data())
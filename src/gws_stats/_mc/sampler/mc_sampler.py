@@ -3,23 +3,73 @@
 # The use and distribution of this software is prohibited without the prior consent of Gencovery SAS.
 # About us: https://gencovery.com
 
-from gws_core import BadRequestException
+import copy
+import os
+from gws_core import BadRequestException, Logger
 from abc import abstractmethod
 from typing import Tuple, Type
 
+import arviz as az
 import numpy as np
 import pymc as pm
+from pandas import DataFrame
+from pymc.blocking import DictToArrayBijection, RaveledVars
+
+from .mc_summary_helper import MCSummaryHelper
+from .mc_trace_cache import MCTraceCache
+from .mc_trace_storage import MCTraceStorage
 
 
 class MCSampler:
     """
     General class for Monte Carlo sampling
+
+    The inference method is an option of the sampler (see `set_inference_method()`):
+
+    * `nuts`: No-U-Turn sampler (default sampler of pyMC)
+    * `slice`: Slice sampler
+    * `advi`: Automatic differentiation variational inference (mean-field), then sampling from the approximation
+    * `fullrank_advi`: Full-rank automatic differentiation variational inference, then sampling from the approximation
+    * `map_laplace`: Maximum a posteriori estimate and Laplace approximation (gaussian approximation of the posterior
+      in the unconstrained space, using the hessian at the MAP)
+
+    All the methods return an `arviz.InferenceData` with a `posterior` group of `chains` x `draws` samples.
+    The variational and Laplace methods give approximate posteriors in a fraction of the sampling time and are
+    designed for exploratory runs on large datasets.
+
+    The MCMC chains run in parallel in a process pool of `cores` processes (by default, one process per chain up to
+    the number of CPUs). The `random_seed` given to `trace()` is one integer seed: PyMC derives the seeds of the chains
+    from it.
+
+    With the adaptive sampling (see `set_adaptive_sampling()`), the MCMC methods sample by increments of draws and
+    stop as soon as the rank-normalized R-hat and the bulk and tail effective sample sizes of all the free variables
+    meet their thresholds, or when the maximum number of draws is reached (see `get_convergence_diagnostics()`).
+
+    The stored traces can be made compact (see `set_trace_storage()`): without the deterministic variables, with a
+    selection of variables and with the draws downcasted (e.g. to float32).
     """
 
+    INFERENCE_METHODS = ["nuts", "slice", "advi", "fullrank_advi", "map_laplace"]
+    DEFAULT_CHAINS = 2
+    DEFAULT_TARGET_ACCEPT = 0.8
+    DEFAULT_RHAT_THRESHOLD = 1.01
+    DEFAULT_ESS_THRESHOLD = 400
+    DEFAULT_ADAPTIVE_INCREMENT = 500
+    DEFAULT_ADAPTIVE_RETUNE = 100
+
     _cached_data = None
     _tune = 1000
     _draws = 1000
-    _chains = 2
+    _chains = DEFAULT_CHAINS
+    _cores = None
+    _target_accept = DEFAULT_TARGET_ACCEPT
+    _inference_method = "slice"
+    _vi_iterations = 20000
+    _trace_cache: MCTraceCache = None
+    _adaptive_sampling: dict = None
+    _convergence_diagnostics: DataFrame = None
+    _is_converged: bool = None
+    _trace_storage: dict = None
 
     def __init__(self):
         self._model = pm.Model()
@@ -36,6 +86,11 @@ class MCSampler:
         for val in priors:
             name = val.pop("name")
             func = val.pop("func")
+            # integer parameters would be typed as small integers by pytensor (e.g. `upper - lower` can overflow)
+            for key, param in val.items():
+                if key not in ["dist", "shape", "dims"] and isinstance(param, (int, np.integer)) \
+                        and not isinstance(param, bool):
+                    val[key] = float(param)
             if func == "Uniform":
                 if use_dist:
                     dist = pm.Uniform.dist(**val)
@@ -70,7 +125,8 @@ class MCSampler:
                     val_i["name"] = f"{name}_{i}"  # set a unique name
                     dist_i = MCSampler._build_distribs([val_i], use_dist=True)
                     components.append(dist_i[0])
-                dist = pm.Mixture(name, w=w, comp_dists=components)
+                dist = pm.Mixture(name, w=w, comp_dists=components,
+                                  **{key: val[key] for key in ["shape", "dims"] if key in val})
             else:
                 raise BadRequestException(f"The distribution function '{func}' is unknown")
 
@@ -78,8 +134,60 @@ class MCSampler:
 
         return dist_list
 
+    @staticmethod
+    def _build_vector_distrib(name: str, priors: list, dims=None):
+        """
+        Build one vector random variable from a list of priors (one prior per element)
+
+        If all the priors use the same distribution function with the same parameter names, a single vectorized
+        random variable is created with the parameters of the elements given as arrays. Otherwise (e.g. mixtures),
+        one random variable is created per element and they are stacked in a deterministic vector.
+
+        If several `dims` are given, the priors correspond to the first dimension and are shared along the
+        other dimensions (e.g. the same slope prior of a predictor for all the targets).
+        """
+        if not isinstance(priors, list) or len(priors) == 0:
+            raise BadRequestException(
+                f"Cannot build the distribution '{name}'. A non-empty list of dict is expected.")
+        if isinstance(dims, str):
+            dims = (dims,)
+        element_dims = tuple(dims[1:]) if dims is not None and len(dims) > 1 else None
+
+        funcs = {prior["func"] for prior in priors}
+        param_names = {tuple(sorted(k for k in prior if k not in ["name", "func"])) for prior in priors}
+        if len(funcs) == 1 and len(param_names) == 1 and "Mixture" not in funcs:
+            vector_prior = {"name": name, "func": priors[0]["func"]}
+            # the parameters of the elements are broadcast along the other dimensions
+            param_shape = (len(priors),) + (1,) * (len(element_dims) if element_dims else 0)
+            for param_name in list(param_names)[0]:
+                vector_prior[param_name] = np.array(
+                    [prior[param_name] for prior in priors], dtype=float).reshape(param_shape)
+            if dims is None:
+                vector_prior["shape"] = len(priors)
+            else:
+                vector_prior["dims"] = dims
+            return MCSampler._build_distribs([vector_prior])[0]
+
+        # the priors are copied: building the distributions consumes their keys
+        element_priors = [{**copy.deepcopy(prior), "name": f"{name}_{i}"} for i, prior in enumerate(priors)]
+        if element_dims is not None:
+            for element_prior in element_priors:
+                element_prior["dims"] = element_dims
+        elements = MCSampler._build_distribs(element_priors)
+        return pm.Deterministic(name, pm.math.stack(elements), dims=dims)
+
     # -- C --
 
+    @staticmethod
+    def _check_random_seed(random_seed):
+        """ Raises an exception if the random seed is not an integer (or None) """
+        if random_seed is None:
+            return
+        if isinstance(random_seed, bool) or not isinstance(random_seed, (int, np.integer)):
+            raise BadRequestException(
+                f"The random seed must be an integer (PyMC derives the seeds of the chains from it), "
+                f"'{random_seed}' is given")
+
     @abstractmethod
     def create_model(self, args=None):
         """ Create the model """
@@ -97,6 +205,41 @@ class MCSampler:
 
     # -- G --
 
+    def _get_cache_key(self, random_seed=None, args=None) -> str:
+        settings = {
+            "tune": self._tune,
+            "draws": self._draws,
+            "chains": self._chains,
+            "target_accept": self._target_accept,
+            "inference_method": self._inference_method,
+            "vi_iterations": self._vi_iterations,
+            "adaptive_sampling": self._adaptive_sampling,
+            "trace_storage": self._trace_storage
+        }
+        return MCTraceCache.compute_key(
+            type(self), self.get_observed_data(), self._get_model_specs(), settings, random_seed, args)
+
+    def _get_model_specs(self) -> dict:
+        """
+        Returns the specs (e.g. priors) that define the model, used to identify the cached traces
+
+        To override if the model depends on attributes of the sampler
+        """
+        return {}
+
+    def get_convergence_diagnostics(self) -> DataFrame:
+        """
+        Returns the convergence diagnostics (R-hat, bulk and tail ESS of each free variable) of the last adaptive
+        sampling, or None if the last traces were not sampled adaptively
+        """
+        return self._convergence_diagnostics
+
+    def get_cores(self) -> int:
+        """ Returns the number of processes used to run the chains (by default, one per chain up to the number of CPUs) """
+        if self._cores is not None:
+            return self._cores
+        return max(min(self._chains, os.cpu_count() or 1), 1)
+
     def get_data(self):
         """ Returns the data """
         if self._cached_data is None:
@@ -115,23 +258,338 @@ class MCSampler:
         """
         return self.get_data()
 
+    def get_result_var_names(self) -> list:
+        """
+        Returns the names of the variables required by the result, always stored even if they are deterministics
+        (see `set_trace_storage()`)
+
+        To override if required
+        """
+        return []
+
+    # -- I --
+
+    def is_converged(self) -> bool:
+        """ Returns True if the last adaptive sampling met the convergence thresholds (None if not sampled adaptively) """
+        return self._is_converged
+
+    @staticmethod
+    def _get_increment_seed(random_seed, increment: int):
+        """ Returns the seed of an increment of the adaptive sampling, derived from the given seed """
+        if random_seed is None or increment == 0:
+            return random_seed
+        return int(np.random.SeedSequence([random_seed, increment]).generate_state(1)[0])
+
     # -- S --
 
+    def set_adaptive_sampling(self, is_adaptive: bool = True, rhat_threshold: float = DEFAULT_RHAT_THRESHOLD,
+                              ess_threshold: float = DEFAULT_ESS_THRESHOLD, increment: int = DEFAULT_ADAPTIVE_INCREMENT,
+                              max_draws: int = None, retune: int = DEFAULT_ADAPTIVE_RETUNE):
+        """
+        Set the adaptive sampling of the MCMC methods (`nuts` and `slice`)
+
+        :param is_adaptive: False to sample the fixed number of draws
+        :param rhat_threshold: The maximum R-hat of the free variables
+        :param ess_threshold: The minimum bulk and tail effective sample sizes of the free variables
+        :param increment: The number of draws of each chain sampled before each convergence check
+        :param max_draws: The maximum number of draws of each chain. By default, the number of draws (see `set_draws()`)
+        :param retune: The number of tuning iterations of the increments following the first one
+        """
+        if not is_adaptive:
+            self._adaptive_sampling = None
+            return
+        if rhat_threshold < 1:
+            raise BadRequestException("The R-hat threshold must be greater than or equal to 1")
+        if ess_threshold <= 0:
+            raise BadRequestException("The ESS threshold must be greater than 0")
+        if increment < 4:
+            raise BadRequestException("The increment must be greater than or equal to 4 draws")
+        if max_draws is not None and max_draws < increment:
+            raise BadRequestException("The maximum number of draws must be greater than or equal to the increment")
+        if retune < 0:
+            raise BadRequestException("The number of tuning iterations must be positive")
+        self._adaptive_sampling = {
+            "rhat_threshold": rhat_threshold,
+            "ess_threshold": ess_threshold,
+            "increment": increment,
+            "max_draws": max_draws,
+            "retune": retune
+        }
+
     def set_data(self, data):
         """ Set the data """
         self._cached_data = data
 
+    def set_trace_storage(self, var_names: list = None, keep_deterministics: bool = True, dtype=None):
+        """
+        Set the variables and the type of the draws of the stored traces (all the variables in float64 by default)
+
+        :param var_names: The posterior variables to keep (None to keep all the variables)
+        :param keep_deterministics: False to not store the deterministic variables, except the ones required by the
+        result (see `get_result_var_names()`). They are not stored during the sampling of the MCMC methods
+        :param dtype: The float type of the draws, e.g. `float32` (None to keep float64)
+        """
+        if dtype is not None:
+            dtype = MCTraceStorage.check_dtype(dtype).name
+        if var_names is None and keep_deterministics and dtype is None:
+            self._trace_storage = None
+            return
+        self._trace_storage = {
+            "var_names": list(var_names) if var_names is not None else None,
+            "keep_deterministics": keep_deterministics,
+            "dtype": dtype
+        }
+
+    def _compact_trace(self, trace, deterministic_names: list = None):
+        """ Returns the traces with the storage settings applied (see `set_trace_storage()`) """
+        settings = self._trace_storage
+        if settings is None:
+            return trace
+        drop_names = None
+        if not settings["keep_deterministics"] and deterministic_names:
+            result_var_names = self.get_result_var_names()
+            drop_names = [name for name in deterministic_names if name not in result_var_names]
+        return MCTraceStorage.compact(trace, var_names=settings["var_names"], drop_names=drop_names,
+                                      dtype=settings["dtype"])
+
+    def set_trace_cache(self, trace_cache: MCTraceCache):
+        """ Set the cache of traces (None to disable the cache) """
+        self._trace_cache = trace_cache
+
+    def set_draws(self, draws: int):
+        """ Set the number of draws of each chain """
+        if draws < 1:
+            raise BadRequestException("The number of draws must be greater than 0")
+        self._draws = draws
+
+    def set_tune(self, tune: int):
+        """ Set the number of tuning (warm-up) iterations of each chain """
+        if tune < 0:
+            raise BadRequestException("The number of tuning iterations must be positive")
+        self._tune = tune
+
+    def set_chains(self, chains: int):
+        """ Set the number of chains """
+        if chains < 1:
+            raise BadRequestException("The number of chains must be greater than 0")
+        self._chains = chains
+
+    def set_cores(self, cores: int):
+        """ Set the number of processes used to run the chains in parallel (None to use one process per chain up to the number of CPUs) """
+        if cores is not None and cores < 1:
+            raise BadRequestException("The number of cores must be greater than 0")
+        self._cores = cores
+
+    def set_target_accept(self, target_accept: float):
+        """ Set the target acceptance rate of the NUTS sampler """
+        if not 0 < target_accept < 1:
+            raise BadRequestException("The target acceptance rate must be between 0 and 1")
+        self._target_accept = target_accept
+
+    def set_inference_method(self, method: str):
+        """ Set the inference method (see `INFERENCE_METHODS`) """
+        if method not in self.INFERENCE_METHODS:
+            raise BadRequestException(
+                f"Invalid inference method '{method}'. Valid methods are {self.INFERENCE_METHODS}.")
+        self._inference_method = method
+
+    def set_vi_iterations(self, nb_iterations: int):
+        """ Set the number of iterations of the variational inference methods """
+        if nb_iterations < 1:
+            raise BadRequestException("The number of iterations must be greater than 0")
+        self._vi_iterations = nb_iterations
+
     def sample(self, model, random_seed=None):
-        vars_list = list(model.values_to_rvs.keys())[:-1]
-        # inference
+        trace = self._run_inference(model, random_seed=random_seed)
+        return self._create_result(trace)
+
+    def _run_inference(self, model, random_seed=None, step=None):
+        """
+        Run the inference method and returns the traces (`arviz.InferenceData`)
+
+        :param step: The step method of the MCMC methods, to reuse a step created with `create_step()` (its
+        functions are compiled once and the data of the model can be swapped between the runs)
+        """
+        self._check_random_seed(random_seed)
+        self._convergence_diagnostics = None
+        self._is_converged = None
         with model:
-            trace = pm.sample(step=[pm.Slice(vars_list)], random_seed=random_seed,
-                              tune=self._tune, draws=self._draws, chains=self._chains)
+            if self._inference_method in ["nuts", "slice"] and self._adaptive_sampling is not None:
+                trace = self._sample_adaptively(model, random_seed=random_seed, step=step)
+            elif self._inference_method in ["nuts", "slice"]:
+                trace = self._sample_mcmc(model, self._get_sample_kwargs(random_seed), step=step)
+            elif self._inference_method in ["advi", "fullrank_advi"]:
+                approx = pm.fit(n=self._vi_iterations, method=self._inference_method, random_seed=random_seed,
+                                progressbar=False)
+                trace = approx.sample(draws=self._draws * self._chains, random_seed=random_seed)
+                trace = self._split_chains(trace)
+            elif self._inference_method == "map_laplace":
+                trace = self._laplace(model, random_seed=random_seed)
+            else:
+                raise BadRequestException(f"Invalid inference method '{self._inference_method}'")
+        return trace
+
+    def create_step(self, model):
+        """ Create the step method of the MCMC inference methods (`nuts` or `slice`) for a model (None for the other methods) """
+        with model:
+            if self._inference_method == "nuts":
+                return pm.NUTS(target_accept=self._target_accept)
+            if self._inference_method == "slice":
+                vars_list = list(model.values_to_rvs.keys())[:-1]
+                return [pm.Slice(vars_list)]
+        return None
+
+    def _sample_mcmc(self, model, sample_kwargs: dict, step=None):
+        if self._trace_storage is not None and not self._trace_storage["keep_deterministics"]:
+            # the free variables are always sampled (they are used by the adaptive sampling), and the deterministics
+            # required by the result (e.g. a slope vector stacking mixture priors)
+            result_var_names = self.get_result_var_names()
+            var_names = [rv.name for rv in model.free_RVs] + \
+                [var.name for var in model.deterministics if var.name in result_var_names]
+            sample_kwargs = {**sample_kwargs, "var_names": var_names}
+        if step is not None:
+            return pm.sample(step=step, **sample_kwargs)
+        if self._inference_method == "nuts":
+            return pm.sample(target_accept=self._target_accept, **sample_kwargs)
+        vars_list = list(model.values_to_rvs.keys())[:-1]
+        return pm.sample(step=[pm.Slice(vars_list)], **sample_kwargs)
+
+    def _sample_adaptively(self, model, random_seed=None, step=None):
+        """
+        Sample by increments until the convergence thresholds are met or the maximum number of draws is reached
+
+        The state of the step methods (e.g. the adapted step size and mass matrix of NUTS) cannot be resumed by pyMC:
+        each increment continues the chains from their last draws after a short tuning of `retune` iterations.
+        """
+        settings = self._adaptive_sampling
+        max_draws = settings["max_draws"] or self._draws
+        var_names = [rv.name for rv in model.free_RVs]
+        traces = []
+        values = None
+        nb_draws = 0
+        initvals = None
+        while True:
+            increment = len(traces)
+            sample_kwargs = self._get_sample_kwargs(self._get_increment_seed(random_seed, increment))
+            sample_kwargs["draws"] = min(settings["increment"], max_draws - nb_draws)
+            if increment > 0:
+                sample_kwargs["tune"] = min(self._tune, settings["retune"])
+                sample_kwargs["initvals"] = initvals
+            trace = self._sample_mcmc(model, sample_kwargs, step=step)
+            traces.append(trace)
+            nb_draws += sample_kwargs["draws"]
+
+            # only the free variables are checked: the deterministics are functions of them
+            increment_values, names = MCSummaryHelper.stack_posterior(trace, var_names=var_names)
+            values = increment_values if values is None else np.concatenate([values, increment_values], axis=1)
+            diagnostics = MCSummaryHelper.compute_diagnostics_of_values(values, names)
+            is_converged = self._check_convergence(diagnostics)
+            if is_converged or nb_draws >= max_draws:
+                break
+
+            last_draws = trace.posterior[var_names].isel(draw=-1)
+            initvals = [{name: last_draws[name].isel(chain=chain).values for name in var_names}
+                        for chain in range(0, self._chains)]
+
+        self._convergence_diagnostics = diagnostics
+        self._is_converged = is_converged
+        if not is_converged:
+            worst = diagnostics[MCSummaryHelper.RHAT_NAME].idxmax()
+            Logger.warning(
+                f"The chains did not converge after {nb_draws} draws per chain (maximum R-hat {diagnostics[MCSummaryHelper.RHAT_NAME].max():.4f} "
+                f"for '{worst}', minimum bulk ESS {diagnostics[MCSummaryHelper.ESS_BULK_NAME].min():.0f}, "
+                f"minimum tail ESS {diagnostics[MCSummaryHelper.ESS_TAIL_NAME].min():.0f})")
+        return traces[0] if len(traces) == 1 else az.concat(traces, dim="draw")
+
+    def _check_convergence(self, diagnostics: DataFrame) -> bool:
+        """ Returns True if all the free variables meet the thresholds (the constant variables are ignored) """
+        settings = self._adaptive_sampling
+        rhat = diagnostics[MCSummaryHelper.RHAT_NAME].fillna(1.0)
+        ess = diagnostics[[MCSummaryHelper.ESS_BULK_NAME, MCSummaryHelper.ESS_TAIL_NAME]].fillna(np.inf)
+        return bool((rhat <= settings["rhat_threshold"]).all() and (ess >= settings["ess_threshold"]).all(axis=None))
+
+    def _get_sample_kwargs(self, random_seed=None) -> dict:
+        """ Returns the options of `pm.sample` """
+        return {
+            "random_seed": random_seed,
+            "tune": self._tune,
+            "draws": self._draws,
+            "chains": self._chains,
+            "cores": self.get_cores()
+        }
+
+    def _create_result(self, trace):
+        """
+        Create the result from the traces
+
+        To override if required
+        """
         return trace
 
+    def _laplace(self, model, random_seed=None):
+        """ MAP estimate and Laplace approximation of the posterior in the unconstrained space """
+        map_point = pm.find_MAP(progressbar=False, seed=random_seed)
+        value_vars = model.value_vars
+        point = {var.name: map_point[var.name] for var in value_vars}
+
+        # the negative hessian of the log-posterior at the MAP is the precision of the gaussian approximation
+        precision = -model.compile_d2logp(vars=model.free_RVs, jacobian=False, negate_output=False)(point)
+        covariance = np.linalg.pinv(np.atleast_2d(precision))
+        mean = DictToArrayBijection.map(point)
+        rng = np.random.default_rng(random_seed)
+        samples = rng.multivariate_normal(mean.data, covariance, size=self._chains * self._draws)
+
+        # map the unconstrained samples to the model variables (including the deterministics)
+        output_vars = model.unobserved_value_vars
+        output_names = [var.name for var in output_vars]
+        func = model.compile_fn(output_vars, inputs=value_vars, on_unused_input="ignore", point_fn=True)
+        values = {name: [] for name in output_names}
+        for sample in samples:
+            sample_point = DictToArrayBijection.rmap(RaveledVars(sample, mean.point_map_info))
+            for name, value in zip(output_names, func(sample_point)):
+                values[name].append(value)
+
+        transformed_names = {var.name for var in value_vars if model.rvs_to_transforms.get(model.values_to_rvs[var])}
+        posterior = {
+            name: np.array(value).reshape((self._chains, self._draws) + np.shape(value[0]))
+            for name, value in values.items() if name not in transformed_names
+        }
+        dims = {name: list(dims_) for name, dims_ in model.named_vars_to_dims.items() if name in posterior}
+        return az.from_dict(posterior=posterior, coords=model.coords, dims=dims)
+
+    def _split_chains(self, trace):
+        """ Split the draws of an approximation (sampled as one chain) into `chains` chains of `draws` draws """
+        posterior = trace.posterior
+        values = {
+            name: data.values.reshape((self._chains, self._draws) + data.shape[2:])
+            for name, data in posterior.data_vars.items()
+        }
+        dims = {name: list(data.dims[2:]) for name, data in posterior.data_vars.items()}
+        coords = {name: coord.values for name, coord in posterior.coords.items() if name not in ["chain", "draw"]}
+        groups = {group: getattr(trace, group) for group in trace.groups()}
+        groups["posterior"] = az.from_dict(posterior=values, coords=coords, dims=dims).posterior
+        return az.InferenceData(**groups)
+
     # -- T --
 
     def trace(self, random_seed=None, args=None):
+        """
+        Create the model and run the inference
+
+        If a trace cache is set (see `set_trace_cache()`) and a `random_seed` is given, the trace is taken from the
+        cache when the same data, model specs, sampler settings and seed were already used.
+        """
+        self._check_random_seed(random_seed)
+        cache_key = None
+        if self._trace_cache is not None and random_seed is not None:
+            cache_key = self._get_cache_key(random_seed=random_seed, args=args)
+            trace = self._trace_cache.get(cache_key)
+            if trace is not None:
+                return self._create_result(trace)
+
         model = self.create_model(args=args)
-        trace = self.sample(model, random_seed=random_seed)
-        return trace
+        trace = self._run_inference(model, random_seed=random_seed)
+        trace = self._compact_trace(trace, deterministic_names=[var.name for var in model.deterministics])
+        if cache_key is not None:
+            self._trace_cache.put(cache_key, trace)
+        return self._create_result(trace)
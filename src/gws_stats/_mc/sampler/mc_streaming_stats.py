@@ -0,0 +1,180 @@
+# Gencovery software - All rights reserved
+# This software is the exclusive property of Gencovery SAS.
+# The use and distribution of this software is prohibited without the prior consent of Gencovery SAS.
+# About us: https://gencovery.com
+
+import numpy as np
+from gws_core import BadRequestException
+
+
+class MCRunningMoments:
+    """
+    Running mean and variance of many variables at once
+
+    The observations are given by chunks (one row per variable and one column per observation) and the statistics of
+    the chunks are merged with the parallel algorithm of Chan et al.
+    """
+
+    _count: int = 0
+    _mean: np.ndarray = None
+    _m2: np.ndarray = None
+
+    def __init__(self, nb_variables: int):
+        self._count = 0
+        self._mean = np.zeros(nb_variables)
+        self._m2 = np.zeros(nb_variables)
+
+    def get_count(self) -> int:
+        """ Returns the number of observations of each variable """
+        return self._count
+
+    def get_mean(self) -> np.ndarray:
+        """ Returns the mean of each variable (NaN without observation) """
+        if self._count == 0:
+            return np.full(len(self._mean), np.nan)
+        return self._mean.copy()
+
+    def get_std(self, ddof: int = 1) -> np.ndarray:
+        """ Returns the standard deviation of each variable (NaN with less than `ddof + 1` observations) """
+        if self._count <= ddof:
+            return np.full(len(self._mean), np.nan)
+        return np.sqrt(self._m2 / (self._count - ddof))
+
+    def update(self, values: np.ndarray):
+        """ Add a (variable, observation) chunk of observations """
+        chunk_count = values.shape[1]
+        if chunk_count == 0:
+            return
+        chunk_mean = values.mean(axis=1)
+        chunk_m2 = ((values - chunk_mean[:, None]) ** 2).sum(axis=1)
+        delta = chunk_mean - self._mean
+        total_count = self._count + chunk_count
+        self._mean = self._mean + delta * chunk_count / total_count
+        self._m2 = self._m2 + chunk_m2 + delta ** 2 * self._count * chunk_count / total_count
+        self._count = total_count
+
+
+class MCQuantileSketch:
+    """
+    Streaming estimation of quantiles of many variables at once with the P² algorithm (Jain and Chlamtac, 1985)
+
+    Each quantile of each variable is tracked by 5 markers whose heights are adjusted with a piecewise-parabolic
+    interpolation at each observation: the memory does not depend on the number of observations. The observations
+    of all the variables are processed at once (one vectorized update per observation).
+
+    The markers are initialized with the exact order statistics of the first chunk of observations, which makes the
+    estimation of the extreme quantiles much more accurate than the original 5-observation initialization. The first
+    observations are kept until the markers of each quantile can be placed one observation apart (e.g. 41
+    observations for the 5% quantile, at most `MAX_NB_INITIAL_VALUES`): until then, the quantiles are exact.
+    """
+
+    NB_MARKERS = 5
+    MAX_NB_INITIAL_VALUES = 100
+
+    _probs: np.ndarray = None
+    _count: int = 0
+    _nb_initial_values: int = 0
+    _buffer: np.ndarray = None
+    _heights: np.ndarray = None
+    _positions: np.ndarray = None
+    _desired_positions: np.ndarray = None
+    _desired_increments: np.ndarray = None
+
+    def __init__(self, nb_variables: int, probs):
+        probs = np.atleast_1d(np.asarray(probs, dtype=float))
+        if np.any((probs <= 0) | (probs >= 1)):
+            raise BadRequestException("The probabilities of the quantiles must be between 0 and 1")
+        self._probs = probs
+        self._count = 0
+        # the markers are at least one observation apart when (n - 1) * min(p / 2, (1 - p) / 2) >= 1
+        min_gap = np.minimum(probs, 1 - probs).min() / 2
+        self._nb_initial_values = int(min(max(np.ceil(1 / min_gap) + 1, self.NB_MARKERS), self.MAX_NB_INITIAL_VALUES))
+        self._buffer = np.empty((nb_variables, self._nb_initial_values))
+        # the desired positions of the markers (0-based) only depend on the number of observations
+        self._desired_increments = np.stack([np.zeros_like(probs), probs / 2, probs, (1 + probs) / 2,
+                                             np.ones_like(probs)], axis=1)
+
+    def get_count(self) -> int:
+        """ Returns the number of observations of each variable """
+        return self._count
+
+    def get_probs(self) -> np.ndarray:
+        """ Returns the probabilities of the quantiles """
+        return self._probs
+
+    def get_quantiles(self) -> np.ndarray:
+        """ Returns the (variable, quantile) estimated quantiles (NaN without observation) """
+        nb_variables = self._buffer.shape[0]
+        if self._count == 0:
+            return np.full((nb_variables, len(self._probs)), np.nan)
+        if self._count < self._nb_initial_values:
+            # exact quantiles of the first observations
+            return np.quantile(self._buffer[:, :self._count], self._probs, axis=1).T
+        return self._heights[:, :, 2].copy()
+
+    def update(self, values: np.ndarray):
+        """ Add a (variable, observation) chunk of observations """
+        start = 0
+        if self._count == 0 and values.shape[1] >= self._nb_initial_values:
+            self._initialize(values)
+            start = values.shape[1]
+        for j in range(start, values.shape[1]):
+            self._add(values[:, j])
+
+    def _initialize(self, values: np.ndarray):
+        """ Place the markers at the order statistics of the first observations """
+        nb_values = values.shape[1]
+        sorted_values = np.sort(values, axis=1)
+        self._desired_positions = (nb_values - 1) * self._desired_increments
+        positions = np.clip(np.round(self._desired_positions), 0, nb_values - 1)
+        # the positions of the markers must be distinct and within the observations (at least 5 observations are
+        # given, so that 5 distinct positions always exist, e.g. for the quantiles too extreme for the buffer)
+        for i in range(1, self.NB_MARKERS):
+            positions[:, i] = np.maximum(positions[:, i], positions[:, i - 1] + 1)
+        positions[:, -1] = np.minimum(positions[:, -1], nb_values - 1)
+        for i in range(self.NB_MARKERS - 2, -1, -1):
+            positions[:, i] = np.minimum(positions[:, i], positions[:, i + 1] - 1)
+        indexes = positions.astype(int)
+        self._heights = sorted_values[:, indexes]
+        self._positions = np.broadcast_to(positions, self._heights.shape).copy()
+        self._count = nb_values
+
+    def _add(self, value: np.ndarray):
+        if self._count < self._nb_initial_values:
+            self._buffer[:, self._count] = value
+            self._count += 1
+            if self._count == self._nb_initial_values:
+                self._initialize(self._buffer)
+            return
+
+        self._count += 1
+        heights = self._heights
+        positions = self._positions
+        value = value[:, None]
+        # the markers above the observation are shifted (the last marker is always shifted)
+        positions[:, :, 1:4] += value[:, :, None] < heights[:, :, 1:4]
+        positions[:, :, 4] += 1
+        heights[:, :, 0] = np.minimum(heights[:, :, 0], value)
+        heights[:, :, 4] = np.maximum(heights[:, :, 4], value)
+        self._desired_positions = self._desired_positions + self._desired_increments
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i in range(1, 4):
+                delta = self._desired_positions[None, :, i] - positions[:, :, i]
+                is_up = (delta >= 1) & (positions[:, :, i + 1] - positions[:, :, i] > 1)
+                is_down = (delta <= -1) & (positions[:, :, i - 1] - positions[:, :, i] < -1)
+                is_moved = is_up | is_down
+                if not is_moved.any():
+                    continue
+                step = np.where(is_up, 1.0, -1.0)
+                h_prev, h_cur, h_next = heights[:, :, i - 1], heights[:, :, i], heights[:, :, i + 1]
+                n_prev, n_cur, n_next = positions[:, :, i - 1], positions[:, :, i], positions[:, :, i + 1]
+                parabolic = h_cur + step / (n_next - n_prev) * (
+                    (n_cur - n_prev + step) * (h_next - h_cur) / (n_next - n_cur) +
+                    (n_next - n_cur - step) * (h_cur - h_prev) / (n_cur - n_prev))
+                h_side = np.where(is_up, h_next, h_prev)
+                n_side = np.where(is_up, n_next, n_prev)
+                linear = h_cur + step * (h_side - h_cur) / (n_side - n_cur)
+                new_height = np.where((h_prev < parabolic) & (parabolic < h_next), parabolic, linear)
+                heights[:, :, i] = np.where(is_moved, new_height, h_cur)
+                positions[:, :, i] = n_cur + np.where(is_moved, step, 0.0)
@@ -0,0 +1,215 @@
+# Gencovery software - All rights reserved
+# This software is the exclusive property of Gencovery SAS.
+# The use and distribution of this software is prohibited without the prior consent of Gencovery SAS.
+# About us: https://gencovery.com
+
+from typing import List, Tuple
+
+import numpy as np
+from pandas import DataFrame
+from scipy.special import ndtri
+from scipy.stats import rankdata
+
+
+class MCSummaryHelper:
+    """
+    Helper to summarize posterior traces
+
+    The variables are stacked in one (chain, draw, parameter) array and all the statistics are computed
+    in one vectorized pass over the parameters.
+    """
+
+    DEFAULT_HDI_PROB = 0.94
+
+    PARAMETER_NAME = "parameter"
+    MEAN_NAME = "mean"
+    SD_NAME = "sd"
+    RHAT_NAME = "r_hat"
+    ESS_BULK_NAME = "ess_bulk"
+    ESS_TAIL_NAME = "ess_tail"
+
+    @classmethod
+    def stack_posterior(cls, trace, var_names: List[str] = None) -> Tuple[np.ndarray, List[str]]:
+        """
+        Stack the posterior variables of a trace
+
+        :param trace: The traces (`arviz.InferenceData`)
+        :param var_names: The names of the variables. By default, all the posterior variables are used
+        :return: The (chain, draw, parameter) array and the names of the parameters (e.g. `slope[var1]`)
+        """
+        posterior = trace.posterior
+        if var_names is None:
+            var_names = list(posterior.data_vars)
+        arrays = []
+        names = []
+        for var_name in var_names:
+            data = posterior[var_name].transpose("chain", "draw", ...)
+            values = data.values
+            arrays.append(values.reshape(values.shape[0], values.shape[1], -1))
+            names.extend(cls._get_parameter_names(data))
+        return np.concatenate(arrays, axis=2), names
+
+    @staticmethod
+    def _get_parameter_names(data) -> List[str]:
+        element_dims = list(data.dims[2:])
+        if len(element_dims) == 0:
+            return [data.name]
+        labels = [[str(label) for label in data.coords[dim].values] if dim in data.coords
+                  else [str(i) for i in range(0, data.sizes[dim])] for dim in element_dims]
+        grids = np.meshgrid(*labels, indexing="ij")
+        return [f"{data.name}[{','.join(element)}]" for element in zip(*[grid.ravel() for grid in grids])]
+
+    @classmethod
+    def compute_hdi(cls, draws: np.ndarray, hdi_prob: float = DEFAULT_HDI_PROB) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compute the highest density interval of each column of a (sample, parameter) array of draws
+
+        :return: The lower and upper bounds of the intervals
+        """
+        nb_samples = draws.shape[0]
+        sorted_draws = np.sort(draws, axis=0)
+        interval_size = int(np.floor(hdi_prob * nb_samples))
+        nb_intervals = nb_samples - interval_size
+        widths = sorted_draws[interval_size:] - sorted_draws[:nb_intervals]
+        min_index = np.argmin(widths, axis=0)[None, :]
+        lower = np.take_along_axis(sorted_draws, min_index, axis=0)[0]
+        upper = np.take_along_axis(sorted_draws, min_index + interval_size, axis=0)[0]
+        return lower, upper
+
+    @classmethod
+    def summarize(cls, trace, var_names: List[str] = None, hdi_prob: float = DEFAULT_HDI_PROB,
+                  with_diagnostics: bool = False) -> DataFrame:
+        """
+        Compute the posterior mean, standard deviation and highest density interval of each parameter
+
+        :param with_diagnostics: True to add the convergence diagnostics (see `compute_diagnostics()`), computed on
+        the same stacked posterior
+        :return: A table with one row per parameter
+        """
+        values, names = cls.stack_posterior(trace, var_names=var_names)
+        draws = values.reshape(-1, values.shape[2])
+        lower, upper = cls.compute_hdi(draws, hdi_prob=hdi_prob)
+        percent = 100 * (1 - hdi_prob) / 2
+        summary = DataFrame({
+            cls.MEAN_NAME: draws.mean(axis=0),
+            cls.SD_NAME: draws.std(axis=0, ddof=1),
+            f"hdi_{percent:g}%": lower,
+            f"hdi_{100 - percent:g}%": upper
+        }, index=names)
+        summary.index.name = cls.PARAMETER_NAME
+        if with_diagnostics:
+            summary = summary.join(cls.compute_diagnostics_of_values(values, names))
+        return summary
+
+    # -- convergence diagnostics --
+
+    @classmethod
+    def compute_diagnostics(cls, trace, var_names: List[str] = None) -> DataFrame:
+        """
+        Compute the rank-normalized split R-hat and the bulk and tail effective sample sizes of each parameter
+        (Vehtari et al. 2021), for all the parameters at once
+
+        :return: A table with one row per parameter
+        """
+        values, names = cls.stack_posterior(trace, var_names=var_names)
+        return cls.compute_diagnostics_of_values(values, names)
+
+    @classmethod
+    def compute_diagnostics_of_values(cls, values: np.ndarray, names: List[str]) -> DataFrame:
+        """
+        Compute the convergence diagnostics of a (chain, draw, parameter) array (see `stack_posterior()`)
+
+        :return: A table with one row per parameter
+        """
+        diagnostics = DataFrame({
+            cls.RHAT_NAME: cls.compute_rhat(values),
+            cls.ESS_BULK_NAME: cls.compute_ess_bulk(values),
+            cls.ESS_TAIL_NAME: cls.compute_ess_tail(values)
+        }, index=names)
+        diagnostics.index.name = cls.PARAMETER_NAME
+        return diagnostics
+
+    @classmethod
+    def compute_rhat(cls, values: np.ndarray) -> np.ndarray:
+        """ Rank-normalized split R-hat of a (chain, draw, parameter) array """
+        split_values = cls._split_chains(values)
+        rhat_bulk = cls._compute_split_rhat(cls._rank_normalize(split_values))
+        folded_values = np.abs(split_values - np.median(split_values, axis=(0, 1))[None, None, :])
+        rhat_tail = cls._compute_split_rhat(cls._rank_normalize(folded_values))
+        return np.maximum(rhat_bulk, rhat_tail)
+
+    @classmethod
+    def compute_ess_bulk(cls, values: np.ndarray) -> np.ndarray:
+        """ Bulk effective sample size of a (chain, draw, parameter) array """
+        return cls._compute_ess(cls._rank_normalize(cls._split_chains(values)))
+
+    @classmethod
+    def compute_ess_tail(cls, values: np.ndarray) -> np.ndarray:
+        """ Tail effective sample size (minimum of the ESS of the 5% and 95% quantiles) of a (chain, draw, parameter) array """
+        quantiles = np.quantile(values, [0.05, 0.95], axis=(0, 1))
+        split_values = cls._split_chains(values)
+        ess_low = cls._compute_ess((split_values <= quantiles[0][None, None, :]).astype(float))
+        ess_high = cls._compute_ess((split_values <= quantiles[1][None, None, :]).astype(float))
+        return np.minimum(ess_low, ess_high)
+
+    @staticmethod
+    def _split_chains(values: np.ndarray) -> np.ndarray:
+        nb_draws = values.shape[1] // 2
+        if nb_draws == 0:
+            return values
+        # the middle draw of odd-length chains is dropped
+        return np.concatenate([values[:, :nb_draws], values[:, -nb_draws:]], axis=0)
+
+    @staticmethod
+    def _rank_normalize(values: np.ndarray) -> np.ndarray:
+        nb_chains, nb_draws, nb_params = values.shape
+        size = nb_chains * nb_draws
+        ranks = rankdata(values.reshape(size, nb_params), axis=0)
+        return ndtri((ranks - 3 / 8) / (size + 1 / 4)).reshape(values.shape)
+
+    @staticmethod
+    def _compute_split_rhat(values: np.ndarray) -> np.ndarray:
+        nb_draws = values.shape[1]
+        within_var = values.var(axis=1, ddof=1).mean(axis=0)
+        between_var = nb_draws * values.mean(axis=1).var(axis=0, ddof=1)
+        var_plus = (nb_draws - 1) / nb_draws * within_var + between_var / nb_draws
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.sqrt(var_plus / within_var)
+
+    @staticmethod
+    def _compute_ess(values: np.ndarray) -> np.ndarray:
+        """ Effective sample size with Geyer's initial monotone sequence, computed for all the parameters at once """
+        nb_chains, nb_draws, _ = values.shape
+        # autocovariances of all the chains and parameters with one FFT
+        centered = values - values.mean(axis=1, keepdims=True)
+        nb_fft = 1 << int(np.ceil(np.log2(2 * nb_draws)))
+        spectrum = np.fft.rfft(centered, n=nb_fft, axis=1)
+        acov = np.fft.irfft(spectrum * np.conjugate(spectrum), n=nb_fft, axis=1)[:, :nb_draws] / nb_draws
+
+        mean_var = acov[:, 0].mean(axis=0) * nb_draws / (nb_draws - 1)
+        var_plus = mean_var * (nb_draws - 1) / nb_draws
+        if nb_chains > 1:
+            var_plus = var_plus + values.mean(axis=1).var(axis=0, ddof=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rho = 1 - (mean_var[None, :] - acov.mean(axis=0)) / var_plus[None, :]
+        rho[0] = 1
+
+        # sums of the pairs of consecutive autocorrelations, truncated at the first negative pair and made monotone
+        # (the sequence stops at the last pair before the lag `nb_draws - 3` when no pair is negative)
+        nb_pairs = max((nb_draws - 3) // 2, 0) + 1
+        pair_sums = rho[0:2 * nb_pairs:2] + rho[1:2 * nb_pairs:2]
+        is_negative = pair_sums < 0
+        is_negative[-1] = True
+        is_truncated = np.cumsum(is_negative, axis=0) > 0
+        pair_sums = np.minimum.accumulate(np.where(is_truncated, 0, pair_sums), axis=0)
+        tau = -1 + 2 * np.sum(np.where(is_truncated, 0, pair_sums), axis=0)
+        # the positive even autocorrelation of the first negative pair improves the estimation
+        first_negative = np.argmax(is_truncated, axis=0)
+        first_negative_rho = np.take_along_axis(rho, 2 * first_negative[None, :], axis=0)[0]
+        tau = tau + np.maximum(first_negative_rho, 0)
+
+        nb_samples = nb_chains * nb_draws
+        tau = np.maximum(tau, 1 / np.log10(nb_samples))
+        ess = nb_samples / tau
+        # constant parameters
+        return np.where(var_plus > 0, ess, np.nan)
@@ -0,0 +1,157 @@
+# Gencovery software - All rights reserved
+# This software is the exclusive property of Gencovery SAS.
+# The use and distribution of this software is prohibited without the prior consent of Gencovery SAS.
+# About us: https://gencovery.com
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from gws_core import BadRequestException
+
+from .mc_trace_storage import MCTraceStorage
+
+
+class MCTraceCache:
+    """
+    Content-addressed cache of Monte Carlo traces
+
+    Traces (`arviz.InferenceData`) are stored on the local disk as compressed NetCDF files (see `MCTraceStorage`)
+    named by the hash of everything that determines them (observed data, prior specs, sampler settings and random
+    seed).
+    When the total size of the cache exceeds `max_size` bytes, the least recently used traces are removed.
+    """
+
+    DEFAULT_MAX_SIZE = 1024 ** 3
+    FILE_EXTENSION = ".nc"
+
+    _cache_dir: str = None
+    _max_size: int = None
+
+    def __init__(self, cache_dir: str = None, max_size: int = DEFAULT_MAX_SIZE):
+        if max_size <= 0:
+            raise BadRequestException("The maximum size of the trace cache must be greater than 0")
+        if cache_dir is None:
+            cache_dir = os.path.join(tempfile.gettempdir(), "gws_stats_mc_trace_cache")
+        os.makedirs(cache_dir, exist_ok=True)
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+
+    # -- C --
+
+    def clear(self):
+        """ Remove all the traces of the cache """
+        for path in self._get_trace_paths():
+            self._remove(path)
+
+    @classmethod
+    def compute_key(cls, *values) -> str:
+        """ Compute the hash of values (data frames, arrays, dict, lists, scalars or objects with attributes) """
+        hash_ = hashlib.sha256()
+        for value in values:
+            cls._update_hash(hash_, value)
+        return hash_.hexdigest()
+
+    # -- G --
+
+    def get(self, key: str):
+        """ Returns the trace of a key, or None if it is not in the cache """
+        path = self._get_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            trace = MCTraceStorage.read(path)
+        except (OSError, ValueError):
+            # corrupted or partially removed file
+            self._remove(path)
+            return None
+        # mark the trace as recently used
+        os.utime(path)
+        return trace
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key + self.FILE_EXTENSION)
+
+    def _get_trace_paths(self):
+        return [os.path.join(self._cache_dir, name) for name in os.listdir(self._cache_dir)
+                if name.endswith(self.FILE_EXTENSION)]
+
+    def get_size(self) -> int:
+        """ Returns the total size of the stored traces in bytes """
+        return sum(os.path.getsize(path) for path in self._get_trace_paths() if os.path.exists(path))
+
+    # -- P --
+
+    def put(self, key: str, trace):
+        """ Store the trace of a key and evict the least recently used traces if required """
+        path = self._get_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            MCTraceStorage.write(trace, tmp_path)
+            # atomic replacement: concurrent readers never see a partial file
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._evict(keep_path=path)
+
+    # -- E --
+
+    def _evict(self, keep_path: str = None):
+        paths = [path for path in self._get_trace_paths() if os.path.exists(path)]
+        paths.sort(key=os.path.getmtime)
+        total_size = sum(os.path.getsize(path) for path in paths)
+        for path in paths:
+            if total_size <= self._max_size:
+                break
+            if path == keep_path:
+                continue
+            total_size -= os.path.getsize(path)
+            self._remove(path)
+
+    # -- R --
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # -- U --
+
+    @classmethod
+    def _update_hash(cls, hash_, value):
+        if isinstance(value, pd.DataFrame):
+            hash_.update(b"DataFrame")
+            hash_.update(json.dumps([str(name) for name in value.columns]).encode())
+            hash_.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        elif isinstance(value, pd.Series):
+            hash_.update(b"Series")
+            hash_.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        elif isinstance(value, np.ndarray):
+            hash_.update(b"ndarray")
+            hash_.update(str((value.dtype, value.shape)).encode())
+            hash_.update(np.ascontiguousarray(value).tobytes())
+        elif isinstance(value, dict):
+            hash_.update(b"dict")
+            for key in sorted(value, key=str):
+                hash_.update(str(key).encode())
+                cls._update_hash(hash_, value[key])
+        elif isinstance(value, (list, tuple)):
+            hash_.update(b"list")
+            for element in value:
+                cls._update_hash(hash_, element)
+        elif value is None or isinstance(value, (str, int, float, bool, np.generic)):
+            hash_.update(repr(value).encode())
+        elif isinstance(value, type):
+            hash_.update(f"{value.__module__}.{value.__qualname__}".encode())
+        elif hasattr(value, "__dict__"):
+            hash_.update(type(value).__name__.encode())
+            cls._update_hash(hash_, vars(value))
+        else:
+            raise BadRequestException(f"Cannot compute the hash of a '{type(value).__name__}'")
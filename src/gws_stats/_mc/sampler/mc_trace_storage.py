@@ -0,0 +1,107 @@
+# Gencovery software - All rights reserved
+# This software is the exclusive property of Gencovery SAS.
+# The use and distribution of this software is prohibited without the prior consent of Gencovery SAS.
+# About us: https://gencovery.com
+
+import arviz as az
+import numpy as np
+from gws_core import BadRequestException
+
+
+class MCTraceStorage:
+    """
+    Compact storage of Monte Carlo traces (`arviz.InferenceData`)
+
+    * `compact()` keeps a selection of the posterior variables (e.g. without the deterministics, that can be much
+      larger than the parameters) and downcasts the draws (e.g. to float32).
+    * `write()` writes the traces in a NetCDF file with a chunked and compressed (zlib) storage of the numeric
+      variables. The chunks contain whole trailing dimensions (e.g. observations) and as many draws as fit in
+      `chunk_size` bytes, so that a slice of draws is read without decompressing the whole variable.
+    """
+
+    DEFAULT_COMPRESSION_LEVEL = 4
+    DEFAULT_CHUNK_SIZE = 1024 ** 2
+    ENGINE = "h5netcdf"
+
+    @classmethod
+    def compact(cls, trace, var_names: list = None, drop_names: list = None, dtype=None):
+        """
+        Returns the traces with a selection of the posterior variables and the posterior draws downcasted
+
+        :param var_names: The posterior variables to keep (None to keep all the variables)
+        :param drop_names: The posterior variables to remove (e.g. the deterministics), if present
+        :param dtype: The float type of the posterior draws, e.g. `float32` (None to keep the type of the draws)
+        """
+        posterior = trace.posterior
+        if var_names is not None:
+            missing_names = [name for name in var_names if name not in posterior.data_vars]
+            if missing_names:
+                raise BadRequestException(f"The variables {missing_names} are not in the posterior")
+            posterior = posterior[list(var_names)]
+        if drop_names:
+            posterior = posterior.drop_vars([name for name in drop_names if name in posterior.data_vars])
+        if dtype is not None:
+            dtype = cls.check_dtype(dtype)
+            posterior = posterior.assign({
+                name: values.astype(dtype) for name, values in posterior.data_vars.items()
+                if np.issubdtype(values.dtype, np.floating)})
+
+        groups = {group: getattr(trace, group) for group in trace.groups()}
+        groups["posterior"] = posterior
+        return az.InferenceData(**groups)
+
+    @staticmethod
+    def check_dtype(dtype) -> np.dtype:
+        """ Returns the float type of the draws or raises an exception if the type is not a float type """
+        try:
+            dtype = np.dtype(dtype)
+        except TypeError as err:
+            raise BadRequestException(f"Invalid type of the draws '{dtype}'") from err
+        if not np.issubdtype(dtype, np.floating):
+            raise BadRequestException(f"The type of the draws must be a float type, '{dtype}' is given")
+        return dtype
+
+    @classmethod
+    def write(cls, trace, path: str, compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+              chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Write the traces in a NetCDF file (to read with `read()` or `arviz.from_netcdf()`)
+
+        :param compression_level: The zlib compression level, from 1 (fastest) to 9 (smallest)
+        :param chunk_size: The maximum size of the chunks in bytes
+        """
+        if not 1 <= compression_level <= 9:
+            raise BadRequestException("The compression level must be between 1 and 9")
+        if chunk_size < 1:
+            raise BadRequestException("The chunk size must be greater than 0")
+        mode = "w"
+        for group in trace.groups():
+            data = getattr(trace, group)
+            encoding = {}
+            for name, values in data.variables.items():
+                if values.dtype.kind not in "biufc" or values.ndim == 0 or values.size == 0:
+                    continue
+                encoding[name] = {
+                    "zlib": True,
+                    "complevel": compression_level,
+                    "shuffle": True,
+                    "chunksizes": cls._get_chunk_sizes(values.shape, values.dtype.itemsize, chunk_size)
+                }
+            data.to_netcdf(path, mode=mode, group=group, engine=cls.ENGINE, encoding=encoding)
+            mode = "a"
+
+    @staticmethod
+    def _get_chunk_sizes(shape: tuple, itemsize: int, chunk_size: int) -> tuple:
+        """ Returns the chunk sizes: the last dimensions are filled first """
+        nb_elements = max(chunk_size // itemsize, 1)
+        chunk_sizes = []
+        for size in reversed(shape):
+            chunk_sizes.insert(0, max(min(size, nb_elements), 1))
+            nb_elements = max(nb_elements // size, 1)
+        return tuple(chunk_sizes)
+
+    @classmethod
+    def read(cls, path: str):
+        """ Read traces written by `write()` (the draws are loaded in memory) """
+        with az.rc_context(rc={"data.load": "eager"}):
+            return az.from_netcdf(path, engine=cls.ENGINE)
@@ -2,10 +2,13 @@
 from typing import Dict
 
 import numpy as np
-from gws_core import BadRequestException, ListRField, Table, resource_decorator
-from pandas import DataFrame
+from gws_core import (BadRequestException, ConfigParams, DictRField,
+                      ListRField, RField, Table, TabularView,
+                      resource_decorator, view)
+from pandas import DataFrame, Index
 
 from ..base.base_resource import BaseResource
+from ..base.helper.table_view_helper import TableViewHelper
 
 
 @resource_decorator("BasePairwiseStatsResult", hide=True)
@@ -21,19 +24,23 @@ class BasePairwiseStatsResult(BaseResource):
     PVALUE_CONTINGENCY_TABLE_NAME = "Contingency table - PValue"
     ADJUSTED_PVALUE_CONTINGENCY_TABLE_NAME = "Contingency table - Adjusted PValue"
     STATISTICS_CONTINGENCY_TABLE_NAME = "Contingency table - Statistics"
+    CONDENSED_CONTINGENCY_TABLE_NAME = "Contingency table - Condensed"
+
+    MAX_NUMBER_OF_COLUMNS_FOR_DENSE_CONTINGENCY = 1000
 
     _GROUP_STATISTIC_TABLE_NAME = "Statistics table - %"
 
     _group_statistic_table_names = ListRField()
+    _sort_indexes: dict = RField(default_value=None)
+    _contingency_column_names = ListRField()
+    _column_hashes = DictRField()
 
-    def __init__(self, result=None, input_table: Table = None):
-        super().__init__(result=result, input_table=input_table)
+    def __init__(self, result=None, input_table: Table = None, column_summary: DataFrame = None):
+        super().__init__(result=result, input_table=input_table, column_summary=column_summary)
         if result is not None:
             self._create_full_statistics_table()
             self._create_group_statistics_table()
-            self._create_contingency_table(self.PVALUE_NAME)
-            self._create_contingency_table(self.ADJUSTED_PVALUE_NAME)
-            self._create_contingency_table(self.STATISTICS_NAME)
+            self._create_contingency_tables()
 
     def get_full_statistics_table(self) -> DataFrame:
         if self.resource_exists(self.FULL_STATISTIC_TABLE_NAME):
@@ -48,6 +55,28 @@ class BasePairwiseStatsResult(BaseResource):
                 tables[name] = self.get_resource(name)
         return tables
 
+    def get_column_hashes(self) -> Dict[str, str]:
+        """ Returns the content hashes of the compared columns (used for incremental comparisons) """
+        return self._column_hashes
+
+    def set_column_hashes(self, column_hashes: Dict[str, str]):
+        """ Set the content hashes of the compared columns """
+        self._column_hashes = column_hashes
+
+    def is_group_comparison(self) -> bool:
+        """ Returns True if the result comes from group-wise comparisons along row tags """
+        return len(self._group_statistic_table_names) > 0
+
+    def get_raw_result(self) -> DataFrame:
+        """
+        Returns the raw (non-adjusted) comparison results, i.e. the reference, compared, statistic and p-value columns
+        """
+        stats_data = self.get_full_statistics_table().get_data()
+        raw_result = stats_data.iloc[:, 0:4].copy()
+        raw_result.columns = range(0, 4)
+        raw_result.index = range(0, raw_result.shape[0])
+        return raw_result
+
     def _create_full_statistics_table(self) -> DataFrame:
         stat_result = self.get_result()
         columns = [
@@ -61,6 +90,15 @@ class BasePairwiseStatsResult(BaseResource):
         table = Table(data=stat_result["full"], column_names=columns)
         table.name = self.FULL_STATISTIC_TABLE_NAME
         self.add_resource(table)
+        self._sort_indexes = TableViewHelper.compute_sort_indexes(
+            table.get_data(), self._get_sortable_columns())
+
+    def _get_sortable_columns(self):
+        return {
+            "Statistic": self.STATISTICS_NAME,
+            "PValue": self.PVALUE_NAME,
+            "Adjusted_PValue": self.ADJUSTED_PVALUE_NAME
+        }
 
     def _create_group_statistics_table(self):
         stat_result = self.get_result()
@@ -79,70 +117,155 @@ class BasePairwiseStatsResult(BaseResource):
                 self._group_statistic_table_names.append(table.name)
                 self.add_resource(table)
 
+    def _get_contingency_layout(self):
+        """
+        Returns the sorted names of all the compared columns and the position of each computed pair in
+        the upper triangle of the (virtual) square contingency matrix
+        """
+        stats_data = self.get_full_statistics_table().get_data()
+        ref_names = stats_data.loc[:, self.REFERENCE_NAME].to_numpy()
+        comp_names = stats_data.loc[:, self.COMPARED_NAME].to_numpy()
+        all_columns = Index(sorted(set(ref_names.tolist()) | set(comp_names.tolist())))
+        ref_pos = all_columns.get_indexer(ref_names)
+        comp_pos = all_columns.get_indexer(comp_names)
+        # each pair is stored once in the upper triangle, the diagonal is ignored
+        row_pos = np.minimum(ref_pos, comp_pos)
+        col_pos = np.maximum(ref_pos, comp_pos)
+        is_valid = row_pos != col_pos
+        return all_columns, row_pos, col_pos, is_valid
+
+    def _is_condensed_contingency(self, nb_columns: int, nb_pairs: int) -> bool:
+        """
+        Use a condensed contingency vector for large all-pairs comparisons, i.e. when most of
+        the pairs of the upper triangle are computed
+        """
+        nb_triangle_pairs = nb_columns * (nb_columns - 1) // 2
+        return nb_columns > self.MAX_NUMBER_OF_COLUMNS_FOR_DENSE_CONTINGENCY and \
+            2 * nb_pairs >= nb_triangle_pairs
+
+    def _create_contingency_tables(self):
+        stats_data = self.get_full_statistics_table().get_data()
+        all_columns, row_pos, col_pos, is_valid = self._get_contingency_layout()
+        nb_columns = len(all_columns)
+        if self._is_condensed_contingency(nb_columns, int(np.count_nonzero(is_valid))):
+            # condensed vector of the upper triangle (same layout as scipy.spatial.distance.squareform)
+            row_pos = row_pos[is_valid]
+            col_pos = col_pos[is_valid]
+            vector_index = nb_columns * row_pos - row_pos * (row_pos + 1) // 2 + (col_pos - row_pos - 1)
+            nb_triangle_pairs = nb_columns * (nb_columns - 1) // 2
+            cdata = {}
+            for metric in [self.PVALUE_NAME, self.ADJUSTED_PVALUE_NAME, self.STATISTICS_NAME]:
+                values = stats_data.loc[:, self._get_metric_column_name(metric)].to_numpy(
+                    dtype=float, na_value=np.nan)
+                vector = np.full(nb_triangle_pairs, np.nan)
+                vector[vector_index] = values[is_valid]
+                cdata[metric] = vector
+            table = Table(DataFrame(cdata))
+            table.name = self.CONDENSED_CONTINGENCY_TABLE_NAME
+            self.add_resource(table)
+            self._contingency_column_names = all_columns.tolist()
+        else:
+            self._create_contingency_table(self.PVALUE_NAME)
+            self._create_contingency_table(self.ADJUSTED_PVALUE_NAME)
+            self._create_contingency_table(self.STATISTICS_NAME)
+
     def _create_contingency_table(self, metric):
         stats_data = self.get_full_statistics_table().get_data()
-        columns = [
-            *stats_data.loc[:, self.REFERENCE_NAME].values.tolist(),
-            *stats_data.loc[:, self.COMPARED_NAME].values.tolist()
-        ]
-        columns = sorted(list(set(columns)))
-        n = len(columns)
-        cdata = np.empty([n, n]).fill(np.nan)
-        cdata = DataFrame(cdata, columns=columns, index=columns)
-        for i in range(0, stats_data.shape[0]):
-            index = str(i)
-            col1 = stats_data.loc[index, self.REFERENCE_NAME]
-            col2 = stats_data.loc[index, self.COMPARED_NAME]
-            if metric.lower() == self.PVALUE_NAME.lower():
-                cdata.at[col1, col2] = stats_data.loc[index, self.PVALUE_NAME]
-                cdata.at[col2, col1] = stats_data.loc[index, self.PVALUE_NAME]
-            elif metric.lower() == self.ADJUSTED_PVALUE_NAME.lower():
-                cdata.at[col1, col2] = stats_data.loc[index,
-                                                      self.ADJUSTED_PVALUE_NAME]
-                cdata.at[col2, col1] = stats_data.loc[index,
-                                                      self.ADJUSTED_PVALUE_NAME]
-            elif metric.lower() == self.STATISTICS_NAME.lower():
-                cdata.at[col1, col2] = stats_data.loc[index,
-                                                      self.STATISTICS_NAME]
-                cdata.at[col2, col1] = stats_data.loc[index,
-                                                      self.STATISTICS_NAME]
-            else:
-                raise BadRequestException(
-                    f"Cannot create contingency table. Invalid metric '{metric}'.")
-
-        for i in range(0, cdata.shape[0]):
-            for j in range(i, cdata.shape[0]):
-                cdata.iloc[j, i] = np.nan
-
-        # remove
-        ref_columns = sorted(
-            list(set(stats_data.loc[:, self.REFERENCE_NAME].values.tolist())))
-        comp_columns = sorted(
-            list(set(stats_data.loc[:, self.COMPARED_NAME].values.tolist())))
-        cdata = cdata.loc[ref_columns, comp_columns]
-
-        table = Table(cdata)
+        values = stats_data.loc[:, self._get_metric_column_name(metric)].to_numpy(
+            dtype=float, na_value=np.nan)
+        table = Table(self._create_contingency_data(values))
+        table.name = self._get_contingency_table_name(metric)
+        self.add_resource(table)
 
+    def _create_contingency_data(self, values: np.ndarray) -> DataFrame:
+        """
+        Create the reference x compared contingency matrix of the values of the pairs (one value per row of
+        the full statistics table). Each value is stored at the reference and compared columns of its pair.
+        """
+        stats_data = self.get_full_statistics_table().get_data()
+        ref_names = stats_data.loc[:, self.REFERENCE_NAME].to_numpy()
+        comp_names = stats_data.loc[:, self.COMPARED_NAME].to_numpy()
+        # the storage is sized to the reference x compared sets only
+        ref_columns = Index(sorted(set(ref_names.tolist())))
+        comp_columns = Index(sorted(set(comp_names.tolist())))
+        row_idx = ref_columns.get_indexer(ref_names)
+        col_idx = comp_columns.get_indexer(comp_names)
+        is_valid = ref_names != comp_names
+
+        cdata = np.full([len(ref_columns), len(comp_columns)], np.nan)
+        cdata[row_idx[is_valid], col_idx[is_valid]] = values[is_valid]
+        return DataFrame(cdata, index=ref_columns, columns=comp_columns)
+
+    def _get_metric_column_name(self, metric) -> str:
         if metric.lower() == self.PVALUE_NAME.lower():
-            table.name = self.PVALUE_CONTINGENCY_TABLE_NAME
+            return self.PVALUE_NAME
         elif metric.lower() == self.ADJUSTED_PVALUE_NAME.lower():
-            table.name = self.ADJUSTED_PVALUE_CONTINGENCY_TABLE_NAME
+            return self.ADJUSTED_PVALUE_NAME
         elif metric.lower() == self.STATISTICS_NAME.lower():
-            table.name = self.STATISTICS_CONTINGENCY_TABLE_NAME
+            return self.STATISTICS_NAME
         else:
             raise BadRequestException(
                 f"Cannot create contingency table. Invalid metric '{metric}'.")
-        self.add_resource(table)
 
-    def get_contingency_table(self, metric):
-        """ Get the contingency table """
+    def _get_contingency_table_name(self, metric) -> str:
         if metric.lower() == self.PVALUE_NAME.lower():
-            name = self.PVALUE_CONTINGENCY_TABLE_NAME
+            return self.PVALUE_CONTINGENCY_TABLE_NAME
         elif metric.lower() == self.ADJUSTED_PVALUE_NAME.lower():
-            name = self.ADJUSTED_PVALUE_CONTINGENCY_TABLE_NAME
+            return self.ADJUSTED_PVALUE_CONTINGENCY_TABLE_NAME
         elif metric.lower() == self.STATISTICS_NAME.lower():
-            name = self.STATISTICS_CONTINGENCY_TABLE_NAME
+            return self.STATISTICS_CONTINGENCY_TABLE_NAME
         else:
             raise BadRequestException(
                 f"Cannot find contingency table. Invalid metric '{metric}'.")
-        return self.get_resource(name)
+
+    def is_contingency_condensed(self) -> bool:
+        """ Returns True if the contingency tables are stored as condensed vectors """
+        return self.resource_exists(self.CONDENSED_CONTINGENCY_TABLE_NAME)
+
+    def get_condensed_contingency_vector(self, metric):
+        """
+        Get the condensed contingency vector (upper triangle, see scipy.spatial.distance.squareform)
+        and the names of the columns.
+        """
+        if not self.is_contingency_condensed():
+            raise BadRequestException("The contingency tables are not stored as condensed vectors.")
+        metric = self._get_metric_column_name(metric)
+        cdata = self.get_resource(self.CONDENSED_CONTINGENCY_TABLE_NAME).get_data()
+        col_idx = [self.PVALUE_NAME, self.ADJUSTED_PVALUE_NAME, self.STATISTICS_NAME].index(metric)
+        vector = cdata.iloc[:, col_idx].to_numpy(dtype=float, na_value=np.nan)
+        return vector, self._contingency_column_names
+
+    def get_contingency_table(self, metric):
+        """ Get the contingency table """
+        name = self._get_contingency_table_name(metric)
+        if not self.is_contingency_condensed():
+            return self.get_resource(name)
+
+        # expand the condensed vector (upper triangle) on demand
+        vector, _ = self.get_condensed_contingency_vector(metric)
+        all_columns, row_pos, col_pos, is_valid = self._get_contingency_layout()
+        nb_columns = len(all_columns)
+        vector_index = nb_columns * row_pos - row_pos * (row_pos + 1) // 2 + (col_pos - row_pos - 1)
+        values = np.full(len(vector_index), np.nan)
+        values[is_valid] = vector[vector_index[is_valid]]
+        table = Table(self._create_contingency_data(values))
+        table.name = name
+        return table
+
+    @view(view_type=TabularView, human_name="Statistics table - Paginated",
+          short_description="Paginated, sortable and filterable view of the full statistics table",
+          specs=TableViewHelper.create_view_specs(["Statistic", "PValue", "Adjusted_PValue"]))
+    def view_full_statistics_table(self, params: ConfigParams) -> TabularView:
+        """
+        View a page of the full statistics table
+        """
+        table = self.get_full_statistics_table()
+        if self._sort_indexes is None:
+            self._sort_indexes = TableViewHelper.compute_sort_indexes(
+                table.get_data(), self._get_sortable_columns())
+
+        return TableViewHelper.create_view(
+            table, params, self._sort_indexes,
+            name_column_names=[self.REFERENCE_NAME, self.COMPARED_NAME],
+            pvalue_column_name=self.PVALUE_NAME,
+            adjusted_pvalue_column_name=self.ADJUSTED_PVALUE_NAME)
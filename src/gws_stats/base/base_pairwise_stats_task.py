@@ -1,5 +1,6 @@
 
 from abc import abstractmethod
+from typing import Dict
 
 import numpy as np
 import pandas
@@ -8,9 +9,11 @@ from gws_core import (BadRequestException, BoolParam, ConfigParams, FloatParam,
                       StrParam, Table, TableUnfolderHelper, Task, TaskInputs,
                       TaskOutputs, task_decorator)
 from pandas import concat
-from statsmodels.stats.multitest import multipletests
 
 from ..base.base_pairwise_stats_result import BasePairwiseStatsResult
+from ..base.helper.column_summary_helper import ColumnSummaryHelper
+from ..pval_adjust.pval_adjust_helper import PValueAdjustHelper
+from ..pval_adjust.streaming_fdr_helper import StreamingFDRHelper
 
 
 @task_decorator("BasePairwiseStatsTask", hide=True)
@@ -22,6 +25,7 @@ class BasePairwiseStatsTask(Task):
 
     * Input: a table containing the sample measurements, with the name of the samples.
     * Output: a table listing the correlation coefficient, and its associated p-value for each pairwise comparison testing.
+    * Optional input: a previous result of the same task, to only compute the comparisons involving new or changed columns (see below).
     * Config Parameters:
       - `preselected_column_names`: List of columns to pre-select for pairwise comparisons. By default a maximum pre-defined number of columns are selected (see configuration).
       - `reference_column`: If given, this reference column is compared against all the other columns.
@@ -29,6 +33,8 @@ class BasePairwiseStatsTask(Task):
       - `adjust_pvalue`:
         - `method`: The correction method for p-value adjustment in multiple testing.
         - `alpha`: The FWER, family-wise error rate. Default is 0.05.
+        - `family`: The families of tests within which the p-values are adjusted (see below).
+        - `family_tag_key`: The key of the column tags defining the families (only used if `family` is `column_tag`).
 
     # Example 1: Direct column comparisons
 
@@ -73,14 +79,44 @@ class BasePairwiseStatsTask(Task):
     Here, the first row correspond to 10-years old male individuals.
     In this this case, we may be interested in only comparing each columns along row metadata tags.
     For instance, to compare `Males (M)` versus `Females (F)` of each columns separately, you can use the advance parameter `row_tag_key`=`Gender`.
+
+    # Incremental comparisons
+
+    When columns are added to (or changed in) a table that was already analyzed, the previous result can be given as input.
+    Columns are identified by their content hashes: the comparisons between unchanged columns are taken from the previous result
+    and only the comparisons involving new or changed columns are computed. The p-values are then adjusted over all the comparisons.
+    This mode is not available for group-wise comparisons along row tags.
+
+    # Families of tests
+
+    By default (`auto`), the p-values of column-wise comparisons are adjusted all together and the p-values of group-wise
+    comparisons are adjusted within each pair of groups. The `family` parameter allows adjusting the p-values within:
+
+    - `all`: all the comparisons (one family),
+    - `reference`: the comparisons of each reference column,
+    - `compared`: the comparisons of each compared column,
+    - `group_pair`: the comparisons of each pair of groups (group-wise comparisons only),
+    - `column_tag`: the comparisons of each pair of column tag values (e.g. gene-gene, gene-metabolite and metabolite-metabolite
+      comparisons), using the column tag `family_tag_key`.
+
+    All the families are adjusted at once, so that thousands of small families cost the same as one large family.
     """
 
     DEFAULT_MAX_NUMBER_OF_COLUMNS_TO_USE = 500
     DEFAULT_ADJUST_METHOD = "bonferroni"
     DEFAULT_ADJUST_ALPHA = 0.05
-
-    input_specs = InputSpecs({'table': InputSpec(
-        Table, human_name="Table", short_description="The input table")})
+    # above this number of p-values, the fdr adjustments are computed chunk by chunk, without sorting all the
+    # p-values at once (the p-values of the results are in memory)
+    MIN_NUMBER_OF_PVALUES_FOR_STREAMING_ADJUST = 10000000
+    ADJUST_FAMILIES = ["auto", "all", "reference", "compared", "group_pair", "column_tag"]
+    DEFAULT_ADJUST_FAMILY = "auto"
+
+    input_specs = InputSpecs({
+        'table': InputSpec(Table, human_name="Table", short_description="The input table"),
+        'previous_result': InputSpec(
+            BasePairwiseStatsResult, human_name="Previous result", is_optional=True,
+            short_description="A previous result on an older version of the table, to only compute new comparisons")
+    })
     output_specs = OutputSpecs({'result': OutputSpec(BasePairwiseStatsResult, human_name="Result",
                                                      short_description="The output result")})
     config_specs = ConfigSpecs({
@@ -109,17 +145,24 @@ class BasePairwiseStatsTask(Task):
         ParamSet(ConfigSpecs({
             "method": StrParam(
                 default_value=DEFAULT_ADJUST_METHOD, human_name="Correction method",
-                allowed_values=["bonferroni", "fdr_bh", "fdr_by", "fdr_tsbh", "fdr_tsbky",
-                                "sidak", "holm-sidak", "holm", "simes-hochberg", "hommel"],
+                allowed_values=PValueAdjustHelper.METHODS,
                 short_description="The method used to adjust (correct) p-values", visibility=FloatParam.PROTECTED_VISIBILITY),
             "alpha": FloatParam(
                 default_value=DEFAULT_ADJUST_ALPHA, min_value=0, max_value=1, human_name="Alpha",
-                short_description=f"FWER, family-wise error rate. Default is {DEFAULT_ADJUST_ALPHA}", visibility=StrParam.PROTECTED_VISIBILITY)
+                short_description=f"FWER, family-wise error rate. Default is {DEFAULT_ADJUST_ALPHA}", visibility=StrParam.PROTECTED_VISIBILITY),
+            "family": StrParam(
+                default_value=DEFAULT_ADJUST_FAMILY, human_name="Families of tests", allowed_values=ADJUST_FAMILIES,
+                short_description="The families of tests within which p-values are adjusted", visibility=StrParam.PROTECTED_VISIBILITY),
+            "family_tag_key": StrParam(
+                default_value=None, optional=True, human_name="Family tag key",
+                short_description="The key of the column tags defining the families of tests. Only used if the families are `column_tag`", visibility=StrParam.PROTECTED_VISIBILITY)
         }), human_name="Adjust p-values", short_description="Adjust p-values for multiple tests.", max_number_of_occurrences=1, min_number_of_occurrences=0, visibility=ParamSet.PROTECTED_VISIBILITY)
     })
 
     _remove_nan_before_compute = True
     _is_nan_warning_shown = False
+    _column_summary = None
+    _column_hashes = None
 
     @abstractmethod
     def compute_stats(self, current_data, ref_col, target_col, params: ConfigParams):
@@ -132,76 +175,151 @@ class BasePairwiseStatsTask(Task):
 
     def run(self, params: ConfigParams, inputs: TaskInputs) -> TaskOutputs:
         table = inputs['table']
+        previous_result = inputs.get('previous_result')
         reference_column = params.get_value("reference_column")
         row_tag_key = params.get_value("row_tag_key")
         is_group_comparison = False
         if reference_column:
-            all_result = self._column_wise_compare(table, params)
+            all_result = self._column_wise_compare(table, params, previous_result)
         elif row_tag_key:
+            if previous_result is not None:
+                self.log_warning_message(
+                    "The previous result is ignored: incremental comparisons are not available for group-wise comparisons.")
             all_result = self._row_group_compare(table, params)
             is_group_comparison = True
         else:
-            all_result = self._column_wise_compare(table, params)
+            all_result = self._column_wise_compare(table, params, previous_result)
 
         if all_result is None:
             raise BadRequestException(
                 "The final result table seems empty. Please check pre-selected column names.")
         # adjust pvalue
         all_result_dict = self._adjust_pvals(
-            all_result, is_group_comparison, params)
+            all_result, is_group_comparison, params, table=table)
 
         t = self.output_specs.get_spec("result").get_default_resource_type()
-        result = t(result=all_result_dict, input_table=table)
+        result = t(result=all_result_dict, input_table=table, column_summary=self._column_summary)
+        if self._column_hashes is not None:
+            result.set_column_hashes(self._column_hashes)
         return {'result': result}
 
-    def _adjust_pvals(self, all_result, is_group_comparison, params):
+    def _adjust_pvals(self, all_result, is_group_comparison, params, table=None):
         # adjust pvalue
         paraset = params.get_value("adjust_pvalue", [])
         if len(paraset) == 0:
             adjust_method = self.DEFAULT_ADJUST_METHOD
             adjust_alpha = self.DEFAULT_ADJUST_ALPHA
+            family = self.DEFAULT_ADJUST_FAMILY
+            family_tag_key = None
         else:
             adjust_method = paraset[0].get(
                 "method", self.DEFAULT_ADJUST_METHOD)
             adjust_alpha = paraset[0].get("alpha", self.DEFAULT_ADJUST_ALPHA)
+            family = paraset[0].get("family", self.DEFAULT_ADJUST_FAMILY)
+            family_tag_key = paraset[0].get("family_tag_key")
+
+        column_families = None
+        if family == "column_tag":
+            if not family_tag_key:
+                raise BadRequestException("A family tag key is required to adjust p-values within column tag families.")
+            if table is None:
+                raise BadRequestException("The column tags are required to adjust p-values within column tag families.")
+            column_families = {
+                name: tags.get(family_tag_key)
+                for name, tags in zip(table.column_names, table.get_column_tags())
+            }
+
+        return self.adjust_pvals(all_result, is_group_comparison, adjust_method, adjust_alpha,
+                                 family=family, column_families=column_families)
+
+    @classmethod
+    def adjust_pvals(cls, all_result, is_group_comparison, adjust_method, adjust_alpha,
+                     family=DEFAULT_ADJUST_FAMILY, column_families: Dict[str, str] = None):
+        """
+        Adjust the p-values of raw comparison results (i.e. the reference, compared, statistic and p-value columns)
+        and returns the dictionary of results expected by `BasePairwiseStatsResult`
+
+        :param family: The families of tests within which the p-values are adjusted (see `ADJUST_FAMILIES`)
+        :param column_families: The family (e.g. a tag value) of each column. Only used if `family` is `column_tag`
+        """
+        if family == "auto":
+            family = "group_pair" if is_group_comparison else "all"
+
+        group_pairs = None
+        if is_group_comparison:
+            # only the comparisons between different groups are kept
+            group_pairs = cls._get_group_pairs(all_result)
+            is_kept = group_pairs.notna().to_numpy()
+            all_result = all_result.loc[is_kept, :]
+            group_pairs = group_pairs.loc[is_kept]
+
+        if family == "all":
+            families = None
+        elif family == "reference":
+            families = all_result.iloc[:, 0]
+        elif family == "compared":
+            families = all_result.iloc[:, 1]
+        elif family == "group_pair":
+            if not is_group_comparison:
+                raise BadRequestException("Group pair families are only available for group-wise comparisons.")
+            families = group_pairs
+        elif family == "column_tag":
+            if column_families is None:
+                raise BadRequestException("The column families are required to adjust p-values within column tag families.")
+            families = cls._get_pair_families(
+                all_result.iloc[:, 0].map(column_families), all_result.iloc[:, 1].map(column_families))
+        else:
+            raise BadRequestException(
+                f"Invalid families of tests '{family}'. Valid families are {cls.ADJUST_FAMILIES}.")
+
+        all_result = cls._do_adjust_pvals(all_result, adjust_method, adjust_alpha, families=families)
 
         all_result_dict = {}
         if is_group_comparison:
-            comparison_list = [
-                *all_result.iloc[:, 0].to_list(),
-                *all_result.iloc[:, 1].to_list()
-            ]
-            groups = list(set([name.split("_")[-1]
-                               for name in comparison_list]))
-            for i, grp1 in enumerate(groups):
-                for j, grp2 in enumerate(groups):
-                    if j <= i:
-                        continue
-                    all_result_grp = self._select_comparisons_by_groups(
-                        all_result, grp1, grp2)
-                    all_result_grp = self._do_adjust_pvals(
-                        all_result_grp, adjust_method, adjust_alpha)
-                    all_result_dict[f"{grp1}_{grp2}"] = all_result_grp
-
+            for group_pair in sorted(group_pairs.unique()):
+                all_result_dict[group_pair] = all_result.loc[(group_pairs == group_pair).to_numpy(), :]
             all_result_dict["full"] = pandas.concat(
                 all_result_dict.values(), axis=0, ignore_index=True)
         else:
-            all_result_dict["full"] = self._do_adjust_pvals(
-                all_result, adjust_method, adjust_alpha)
+            all_result_dict["full"] = all_result
 
         return all_result_dict
 
-    def _select_comparisons_by_groups(self, all_result, grp1, grp2):
-        col1 = all_result.iloc[:, 0]
-        col2 = all_result.iloc[:, 1]
-        cond1 = (col1.str.endswith(f"_{grp1}")) & (
-            col2.str.endswith(f"_{grp2}"))
-        cond2 = (col1.str.endswith(f"_{grp2}")) & (
-            col2.str.endswith(f"_{grp1}"))
-        all_result_grp = all_result[cond1 | cond2]
-        return all_result_grp
-
-    def _column_wise_compare(self, table, params):
+    @classmethod
+    def concat_raw_results(cls, raw_results):
+        """
+        Concatenate raw comparison results and remove duplicated pairs, regardless of their orientation.
+        If a pair is found several times, the first one is kept.
+        """
+        all_result = pandas.concat(raw_results, axis=0, ignore_index=True)
+        col1 = all_result.iloc[:, 0].astype(str).to_numpy()
+        col2 = all_result.iloc[:, 1].astype(str).to_numpy()
+        pair_keys = pandas.DataFrame({
+            "first": np.where(col1 <= col2, col1, col2),
+            "second": np.where(col1 <= col2, col2, col1)
+        })
+        is_duplicated = pair_keys.duplicated(keep="first").to_numpy()
+        return all_result.loc[~is_duplicated, :].reset_index(drop=True)
+
+    @classmethod
+    def _get_group_pairs(cls, all_result):
+        """ Returns the pair of groups of each comparison (None for comparisons within a group) """
+        grp1 = all_result.iloc[:, 0].astype(str).str.split("_").str[-1]
+        grp2 = all_result.iloc[:, 1].astype(str).str.split("_").str[-1]
+        group_pairs = cls._get_pair_families(grp1, grp2)
+        return group_pairs.where((grp1 != grp2).to_numpy(), None)
+
+    @staticmethod
+    def _get_pair_families(family1, family2):
+        """ Returns the unordered pair of families of each comparison """
+        family1 = np.array([str(family) for family in family1])
+        family2 = np.array([str(family) for family in family2])
+        first = np.where(family1 <= family2, family1, family2)
+        second = np.where(family1 <= family2, family2, family1)
+        return pandas.Series(
+            [f"{first_}_{second_}" for first_, second_ in zip(first, second)], dtype=object)
+
+    def _column_wise_compare(self, table, params, previous_result: BasePairwiseStatsResult = None):
         selected_cols = params.get_value("preselected_column_names")
         reference_column = params.get_value("reference_column")
         if selected_cols:
@@ -232,9 +350,56 @@ class BasePairwiseStatsTask(Task):
             reference_columns = list(
                 set(table.column_names[0:self.DEFAULT_MAX_NUMBER_OF_COLUMNS_TO_USE]))
 
-        all_result = self._do_comparisons(data, params, reference_columns)
+        self._column_summary = ColumnSummaryHelper.compute_summary(data)
+        self._column_hashes = ColumnSummaryHelper.compute_column_hashes(data)
+
+        previous_raw_result = None
+        changed_columns = None
+        if previous_result is not None:
+            previous_raw_result, changed_columns = self._get_reusable_comparisons(
+                data, reference_columns, previous_result)
+
+        all_result = self._do_comparisons(
+            data, params, reference_columns, column_summary=self._column_summary,
+            changed_columns=changed_columns)
+
+        if previous_raw_result is not None and previous_raw_result.shape[0] > 0:
+            if all_result is None:
+                all_result = previous_raw_result
+            else:
+                all_result = self.concat_raw_results([all_result, previous_raw_result])
         return all_result
 
+    def _get_reusable_comparisons(self, data, reference_columns, previous_result: BasePairwiseStatsResult):
+        """
+        Returns the previous comparisons between unchanged columns and the list of new or changed columns
+        """
+        t = self.output_specs.get_spec("result").get_default_resource_type()
+        if not isinstance(previous_result, t):
+            raise BadRequestException(
+                f"The previous result must be a '{t.__name__}'. A '{type(previous_result).__name__}' is given.")
+
+        previous_hashes = previous_result.get_column_hashes()
+        if not previous_hashes or previous_result.is_group_comparison():
+            self.log_warning_message(
+                "The previous result cannot be reused (no column hashes found). All the comparisons are computed.")
+            return None, None
+
+        unchanged_columns = set([name for name in data.columns
+                                 if previous_hashes.get(str(name)) == self._column_hashes[str(name)]])
+        changed_columns = set(data.columns) - unchanged_columns
+
+        previous_raw_result = previous_result.get_raw_result()
+        col1 = previous_raw_result.iloc[:, 0]
+        col2 = previous_raw_result.iloc[:, 1]
+        is_reusable = col1.isin(unchanged_columns) & col2.isin(unchanged_columns) & \
+            (col1.isin(reference_columns) | col2.isin(reference_columns))
+        previous_raw_result = previous_raw_result.loc[is_reusable, :]
+
+        self.log_info_message(
+            f"{len(changed_columns)} new or changed column(s) found. {previous_raw_result.shape[0]} comparison(s) are reused.")
+        return previous_raw_result, changed_columns
+
     def _row_group_compare(self, table, params):
         selected_cols = params.get_value("preselected_column_names")
         if selected_cols:
@@ -247,38 +412,53 @@ class BasePairwiseStatsTask(Task):
         data = table.get_data()
         data = data.apply(pandas.to_numeric, errors='coerce')
         all_result = None
+        column_summaries = []
         for k in range(0, data.shape[1]):
             # select each column separately to compare them
             sub_table = table.select_by_column_indexes([k])
             # unfold the current column
             sub_table = TableUnfolderHelper.unfold_rows_by_tags(
                 sub_table, [key], 'column_name')
+            sub_data = sub_table.get_data()
+            column_summary = ColumnSummaryHelper.compute_summary(sub_data)
+            column_summaries.append(column_summary)
             # compare all the unfolded columns
             reference_columns = list(
                 set(sub_table.column_names[0:self.DEFAULT_MAX_NUMBER_OF_COLUMNS_TO_USE]))
             if all_result is None:
                 all_result = self._do_comparisons(
-                    sub_table.get_data(), params, reference_columns)
+                    sub_data, params, reference_columns, column_summary=column_summary)
             else:
                 df = self._do_comparisons(
-                    sub_table.get_data(), params, reference_columns)
+                    sub_data, params, reference_columns, column_summary=column_summary)
                 all_result = pandas.concat(
                     [all_result, df], axis=0, ignore_index=True)
 
+        if len(column_summaries) > 0:
+            self._column_summary = pandas.concat(column_summaries, axis=0)
         return all_result
 
-    def _do_adjust_pvals(self, data, adjust_method, adjust_alpha):
-        _, pvals_corrected, _, _ = multipletests(
-            data.iloc[:, 3].to_numpy().flatten(),
-            adjust_alpha, adjust_method)
+    @classmethod
+    def _do_adjust_pvals(cls, data, adjust_method, adjust_alpha, families=None):
+        pvals = data.iloc[:, 3].to_numpy(dtype=float).flatten()
+        if families is not None:
+            pvals_corrected = PValueAdjustHelper.adjust_grouped(pvals, families, adjust_method, adjust_alpha)
+        elif adjust_method in StreamingFDRHelper.METHODS and \
+                len(pvals) >= cls.MIN_NUMBER_OF_PVALUES_FOR_STREAMING_ADJUST:
+            pvals_corrected = StreamingFDRHelper.adjust(pvals, adjust_method)
+        else:
+            pvals_corrected = PValueAdjustHelper.adjust(pvals, adjust_method, adjust_alpha)
         pvals_corrected = pandas.DataFrame(pvals_corrected)
         pvals_corrected.index = data.index
         return pandas.concat([data, pvals_corrected], axis=1, ignore_index=True)
 
-    def _do_comparisons(self, data, params, reference_columns=None):
+    def _do_comparisons(self, data, params, reference_columns=None, column_summary=None, changed_columns=None):
         all_result = None
         if reference_columns is None:
             reference_columns = []
+        if column_summary is None:
+            column_summary = ColumnSummaryHelper.compute_summary(data)
+        nan_counts = column_summary.loc[:, ColumnSummaryHelper.NAN_COUNT_NAME].to_numpy()
 
         reference_column = params.get_value("reference_column")
         for i in range(0, data.shape[1]):
@@ -292,6 +472,10 @@ class BasePairwiseStatsTask(Task):
                 if not reference_column:
                     if j <= i:
                         continue
+                if changed_columns is not None:
+                    # only compare new or changed columns
+                    if ref_col not in changed_columns and target_col not in changed_columns:
+                        continue
                 target_data = data.iloc[:, [j]]
                 current_data = concat(
                     [ref_data, target_data],
@@ -300,8 +484,8 @@ class BasePairwiseStatsTask(Task):
                 current_data = current_data.apply(
                     pandas.to_numeric, errors='coerce')
                 current_data = current_data.to_numpy().T
-                array_sum = np.sum(current_data)
-                array_has_nan = np.isnan(array_sum)
+                # use the precomputed column summary to check NaN values
+                array_has_nan = nan_counts[i] > 0 or nan_counts[j] > 0
                 if array_has_nan:
                     if self._remove_nan_before_compute:
                         current_data = [
@@ -1,8 +1,10 @@
 
-from gws_core import Table, resource_decorator
+from gws_core import (ConfigParams, RField, Table, TabularView,
+                      resource_decorator, view)
 from pandas import DataFrame
 
 from ..base.base_resource import BaseResource
+from ..base.helper.table_view_helper import TableViewHelper
 
 
 @resource_decorator("BasePopulationStatsResult", hide=True)
@@ -14,8 +16,10 @@ class BasePopulationStatsResult(BaseResource):
     STATISTICS_NAME = "Statistic"
     STATISTIC_TABLE_NAME = "Statistics table"
 
-    def __init__(self, result=None, input_table: Table = None):
-        super().__init__(result=result, input_table=input_table)
+    _sort_indexes: dict = RField(default_value=None)
+
+    def __init__(self, result=None, input_table: Table = None, column_summary: DataFrame = None):
+        super().__init__(result=result, input_table=input_table, column_summary=column_summary)
         if result is not None:
             self._create_statistics_table()
 
@@ -37,3 +41,30 @@ class BasePopulationStatsResult(BaseResource):
         table = Table(data=stat_result, column_names=columns)
         table.name = self.STATISTIC_TABLE_NAME
         self.add_resource(table)
+        self._sort_indexes = TableViewHelper.compute_sort_indexes(
+            table.get_data(), self._get_sortable_columns())
+
+    def _get_sortable_columns(self):
+        return {
+            "Statistic": self.STATISTICS_NAME,
+            "PValue": self.PVALUE_NAME,
+            "Adjusted_PValue": self.ADJUSTED_PVALUE_NAME
+        }
+
+    @view(view_type=TabularView, human_name="Statistics table - Paginated",
+          short_description="Paginated, sortable and filterable view of the statistics table",
+          specs=TableViewHelper.create_view_specs(["Statistic", "PValue", "Adjusted_PValue"]))
+    def view_statistics_table(self, params: ConfigParams) -> TabularView:
+        """
+        View a page of the statistics table
+        """
+        table = self.get_statistics_table()
+        if self._sort_indexes is None:
+            self._sort_indexes = TableViewHelper.compute_sort_indexes(
+                table.get_data(), self._get_sortable_columns())
+
+        return TableViewHelper.create_view(
+            table, params, self._sort_indexes,
+            name_column_names=["Columns"],
+            pvalue_column_name=self.PVALUE_NAME,
+            adjusted_pvalue_column_name=self.ADJUSTED_PVALUE_NAME)
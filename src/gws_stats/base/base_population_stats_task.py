@@ -8,9 +8,10 @@ from gws_core import (BoolParam, ConfigParams, FloatParam,
                       OutputSpecs, ParamSet, StrParam, Table, ConfigSpecs,
                       TableUnfolderHelper, Task, TaskInputs, TaskOutputs,
                       task_decorator)
-from statsmodels.stats.multitest import multipletests
 
 from ..base.base_population_stats_result import BasePopulationStatsResult
+from ..base.helper.column_summary_helper import ColumnSummaryHelper
+from ..pval_adjust.pval_adjust_helper import PValueAdjustHelper
 
 
 @task_decorator("BasePopulationStatsTask", hide=True)
@@ -89,8 +90,7 @@ class BasePopulationStatsTask(Task):
         ParamSet(ConfigSpecs({
             "method": StrParam(
                 default_value=DEFAULT_ADJUST_METHOD, human_name="Correction method",
-                allowed_values=["bonferroni", "fdr_bh", "fdr_by", "fdr_tsbh", "fdr_tsbky",
-                                "sidak", "holm-sidak", "holm", "simes-hochberg", "hommel"],
+                allowed_values=PValueAdjustHelper.METHODS,
                 short_description="The method used to adjust (correct) p-values", visibility=FloatParam.PROTECTED_VISIBILITY),
             "alpha": FloatParam(
                 default_value=DEFAULT_ADJUST_ALPHA, min_value=0, max_value=1, human_name="Alpha",
@@ -100,6 +100,7 @@ class BasePopulationStatsTask(Task):
 
     _remove_nan_before_compute = True
     _is_nan_warning_shown = False
+    _column_summary = None
 
     @abstractmethod
     def compute_stats(self, data, params: ConfigParams):
@@ -119,13 +120,13 @@ class BasePopulationStatsTask(Task):
             stat_result = self._column_compare(table, params)
 
         t = self.output_specs.get_spec("result").get_default_resource_type()
-        result = t(result=stat_result, input_table=table)
+        result = t(result=stat_result, input_table=table, column_summary=self._column_summary)
         return {'result': result}
 
     def _do_adjust_pvals(self, data, adjust_method, adjust_alpha):
-        _, pvals_corrected, _, _ = multipletests(
-            data.iloc[:, 2].to_numpy().flatten(),
-            adjust_alpha, adjust_method)
+        pvals_corrected = PValueAdjustHelper.adjust(
+            data.iloc[:, 2].to_numpy(dtype=float).flatten(),
+            adjust_method, adjust_alpha)
         pvals_corrected = pandas.DataFrame(pvals_corrected)
         pvals_corrected.index = data.index
         return pandas.concat([data, pvals_corrected], axis=1, ignore_index=True)
@@ -133,7 +134,8 @@ class BasePopulationStatsTask(Task):
     def _column_compare(self, table, params):
         data = table.get_data()
         data = data.apply(pandas.to_numeric, errors='coerce')
-        array_has_nan = data.isnull().sum().sum()
+        self._column_summary = ColumnSummaryHelper.compute_summary(data)
+        array_has_nan = self._column_summary.loc[:, ColumnSummaryHelper.NAN_COUNT_NAME].sum() > 0
         data = data.to_numpy().T
         if array_has_nan:
             # remove nan values
@@ -153,6 +155,7 @@ class BasePopulationStatsTask(Task):
         data = table.get_data()
 
         all_stat_result = None
+        column_summaries = []
         for k in range(0, data.shape[1]):
             # select each column separately to compare them
             sub_table = table.select_by_column_indexes([k])
@@ -162,9 +165,10 @@ class BasePopulationStatsTask(Task):
 
             sub_data = sub_table.get_data()
             sub_data = sub_data.apply(pandas.to_numeric, errors='coerce')
+            column_summary = ColumnSummaryHelper.compute_summary(sub_data)
+            column_summaries.append(column_summary)
             sub_data = sub_data.to_numpy().T
-            array_sum = np.sum(sub_data)
-            array_has_nan = np.isnan(array_sum)
+            array_has_nan = column_summary.loc[:, ColumnSummaryHelper.NAN_COUNT_NAME].sum() > 0
             if array_has_nan:
                 # remove nan values
                 sub_data = [
@@ -187,6 +191,9 @@ class BasePopulationStatsTask(Task):
                 all_stat_result = pandas.concat(
                     [all_stat_result, stat_result], axis=0, ignore_index=True)
 
+        if len(column_summaries) > 0:
+            self._column_summary = pandas.concat(column_summaries, axis=0)
+
         # adjust pvalue
         paraset = params.get_value("adjust_pvalue", [])
         if len(paraset) == 0:
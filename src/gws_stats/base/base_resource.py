@@ -2,14 +2,18 @@
 import numpy as np
 from gws_core import (ResourceRField, ResourceSet, RField, Table,
                       resource_decorator)
+from pandas import DataFrame
 
 
 @resource_decorator("BaseResource", hide=True)
 class BaseResource(ResourceSet):
+
+    COLUMN_SUMMARY_TABLE_NAME = "Column summary table"
+
     _result: np.array = RField(default_value=None)
     _input_table: Table = ResourceRField()
 
-    def __init__(self, result: np.array = None, input_table: Table = None):
+    def __init__(self, result: np.array = None, input_table: Table = None, column_summary: DataFrame = None):
         super().__init__()
         if result is not None:
             self._result = result
@@ -17,5 +21,20 @@ class BaseResource(ResourceSet):
         if input_table is not None:
             self.input_table = input_table
 
+        if column_summary is not None:
+            self._create_column_summary_table(column_summary)
+
     def get_result(self):
         return self._result
+
+    def get_column_summary_table(self) -> Table:
+        """ Returns the summary statistics of the compared columns """
+        if self.resource_exists(self.COLUMN_SUMMARY_TABLE_NAME):
+            return self.get_resource(self.COLUMN_SUMMARY_TABLE_NAME)
+        else:
+            return None
+
+    def _create_column_summary_table(self, column_summary: DataFrame):
+        table = Table(data=column_summary)
+        table.name = self.COLUMN_SUMMARY_TABLE_NAME
+        self.add_resource(table)
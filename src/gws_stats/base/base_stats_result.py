@@ -13,8 +13,8 @@ class BaseStatsResult(BaseResource):
 
     FULL_STATISTIC_TABLE_NAME = "Statistics table"
 
-    def __init__(self, result=None, input_table: Table = None):
-        super().__init__(result=result, input_table=input_table)
+    def __init__(self, result=None, input_table: Table = None, column_summary: DataFrame = None):
+        super().__init__(result=result, input_table=input_table, column_summary=column_summary)
         if result is not None:
             self._create_statistics_table()
 
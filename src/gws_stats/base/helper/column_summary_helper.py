@@ -0,0 +1,64 @@
+
+import hashlib
+import warnings
+from typing import Dict
+
+import numpy as np
+import pandas
+from pandas import DataFrame
+
+
+class ColumnSummaryHelper:
+    """
+    Helper to compute the summary statistics of the columns of a table in one vectorized pass
+    """
+
+    COUNT_NAME = "Count"
+    MEAN_NAME = "Mean"
+    STD_NAME = "Std"
+    MEDIAN_NAME = "Median"
+    MIN_NAME = "Min"
+    MAX_NAME = "Max"
+    NAN_COUNT_NAME = "NaN count"
+
+    @classmethod
+    def compute_summary(cls, data: DataFrame) -> DataFrame:
+        """
+        Compute the number of valid values, mean, standard deviation (ddof=1), median, min, max and
+        number of NaN values of each column. Non-numeric values are considered as NaN.
+        """
+        data = data.apply(pandas.to_numeric, errors='coerce')
+        values = data.to_numpy(dtype=float, na_value=np.nan)
+        is_nan = np.isnan(values)
+        nan_count = is_nan.sum(axis=0)
+        count = values.shape[0] - nan_count
+        with warnings.catch_warnings():
+            # all-NaN columns and columns with a single value yield NaN summaries
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            mean = np.nanmean(values, axis=0)
+            std = np.nanstd(values, axis=0, ddof=1)
+            median = np.nanmedian(values, axis=0)
+            min_ = np.nanmin(values, axis=0)
+            max_ = np.nanmax(values, axis=0)
+
+        return DataFrame({
+            cls.COUNT_NAME: count,
+            cls.MEAN_NAME: mean,
+            cls.STD_NAME: std,
+            cls.MEDIAN_NAME: median,
+            cls.MIN_NAME: min_,
+            cls.MAX_NAME: max_,
+            cls.NAN_COUNT_NAME: nan_count
+        }, index=data.columns)
+
+    @classmethod
+    def compute_column_hashes(cls, data: DataFrame) -> Dict[str, str]:
+        """
+        Compute a content hash of each column (values and row names).
+        Two columns with the same hash are considered identical.
+        """
+        hashes = {}
+        for name in data.columns:
+            row_hashes = pandas.util.hash_pandas_object(data.loc[:, name], index=True).to_numpy()
+            hashes[str(name)] = hashlib.sha1(row_hashes.tobytes()).hexdigest()
+        return hashes
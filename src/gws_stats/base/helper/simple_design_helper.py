@@ -47,7 +47,7 @@ class SimpleDesignHelper(BaseDesignHelper):
                 else:
                     # y_temp: DataFrame = DataFrame(data=targets, index=training_set.row_names, columns=key)
                     y_temp = cls.convert_labels_to_numeric_matrix(
-                        targets, index=training_set.row_names, columns=key)
+                        targets, index=training_set.row_names, columns=[key])
             else:
                 colname = design_target["target_name"]
                 y_temp: DataFrame = training_set.select_by_column_names(
@@ -68,13 +68,15 @@ class SimpleDesignHelper(BaseDesignHelper):
                             labels=y_temp, index=training_set.row_names)
                     else:
                         y_temp = cls.convert_labels_to_numeric_matrix(
-                            labels=y_temp, index=training_set.row_names, columns=colname)
+                            labels=y_temp, index=training_set.row_names, columns=[colname])
 
-                x_true.drop(columns=[colname], inplace=True)
+                # the data of the training set are not modified
+                x_true = x_true.drop(columns=[colname])
             y_tab.append(y_temp)
 
         if len(y_tab) != 0:
-            y_true: DataFrame = pandas.concat(y_tab)
+            # one column per target
+            y_true: DataFrame = pandas.concat(y_tab, axis=1)
         else:
             y_true = None
 
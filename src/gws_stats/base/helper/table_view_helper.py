@@ -0,0 +1,146 @@
+
+import re
+from typing import Dict, List
+
+import numpy as np
+from gws_core import (BadRequestException, BoolParam, ConfigParams,
+                      ConfigSpecs, FloatParam, IntParam, StrParam, Table,
+                      TabularView)
+from pandas import DataFrame
+
+
+class TableViewHelper:
+    """
+    Helper to create paginated, sortable and filterable views of large statistics tables.
+
+    Sort indexes are computed once (when the result is created) and reused by every view call,
+    so that only the rows of the requested page are read from the stored table.
+    """
+
+    DEFAULT_NUMBER_OF_ROWS_PER_PAGE = 50
+    MAX_NUMBER_OF_ROWS_PER_PAGE = 5000
+    NO_SORT = "none"
+
+    @classmethod
+    def create_view_specs(cls, sort_keys: List[str]) -> ConfigSpecs:
+        """ Create the config specs of a paginated view """
+        return ConfigSpecs({
+            "page": IntParam(
+                default_value=1, min_value=1, human_name="Page",
+                short_description="The page to display"),
+            "number_of_rows_per_page": IntParam(
+                default_value=cls.DEFAULT_NUMBER_OF_ROWS_PER_PAGE, min_value=1,
+                max_value=cls.MAX_NUMBER_OF_ROWS_PER_PAGE, human_name="Number of rows per page",
+                short_description="The number of rows to display per page"),
+            "sort_by": StrParam(
+                default_value=cls.NO_SORT, allowed_values=[cls.NO_SORT, *sort_keys],
+                human_name="Sort by", short_description="The column used to sort the rows"),
+            "ascending": BoolParam(
+                default_value=True, human_name="Ascending",
+                short_description="Set True to sort in ascending order, False otherwise"),
+            "name_filter": StrParam(
+                default_value=None, optional=True, human_name="Name filter",
+                short_description="Only display the rows whose names contain this text (regular expressions are allowed)"),
+            "max_pvalue": FloatParam(
+                default_value=None, optional=True, min_value=0, max_value=1, human_name="Maximum p-value",
+                short_description="Only display the rows with a p-value lower or equal to this value"),
+            "max_adjusted_pvalue": FloatParam(
+                default_value=None, optional=True, min_value=0, max_value=1, human_name="Maximum adjusted p-value",
+                short_description="Only display the rows with an adjusted p-value lower or equal to this value"),
+        })
+
+    @classmethod
+    def compute_sort_indexes(cls, data: DataFrame, sortable_columns: Dict[str, str]) -> Dict[str, dict]:
+        """
+        Compute the ascending sort index of each sortable column.
+        NaN values are placed at the end, after the `nb_valid` first indexes.
+
+        :param sortable_columns: The sort keys (as given in the view specs) mapped to their column names
+        """
+        sort_indexes = {}
+        for key, name in sortable_columns.items():
+            if name not in data.columns:
+                continue
+            values = data.loc[:, name].to_numpy(dtype=float, na_value=np.nan)
+            sort_indexes[key] = {
+                "order": np.argsort(values, kind="stable").astype(np.int64),
+                "nb_valid": int(np.count_nonzero(~np.isnan(values)))
+            }
+        return sort_indexes
+
+    @classmethod
+    def get_page(cls, data: DataFrame, params: ConfigParams, sort_indexes: Dict[str, dict],
+                 name_column_names: List[str], pvalue_column_name: str,
+                 adjusted_pvalue_column_name: str) -> DataFrame:
+        """ Returns the rows of the requested page """
+        sort_by = params.get_value("sort_by", cls.NO_SORT)
+        ascending = params.get_value("ascending", True)
+
+        if sort_by != cls.NO_SORT and sort_by in sort_indexes:
+            order = sort_indexes[sort_by]["order"]
+            if not ascending:
+                # reverse the valid values and keep NaN values at the end
+                nb_valid = sort_indexes[sort_by]["nb_valid"]
+                order = np.concatenate([order[:nb_valid][::-1], order[nb_valid:]])
+        else:
+            order = None
+
+        mask = cls._get_filter_mask(data, params, name_column_names,
+                                    pvalue_column_name, adjusted_pvalue_column_name)
+        if mask is not None:
+            if order is None:
+                order = np.flatnonzero(mask)
+            else:
+                order = order[mask[order]]
+
+        page = params.get_value("page", 1)
+        nb_rows_per_page = params.get_value("number_of_rows_per_page", cls.DEFAULT_NUMBER_OF_ROWS_PER_PAGE)
+        start = (page - 1) * nb_rows_per_page
+        stop = start + nb_rows_per_page
+
+        if order is None:
+            return data.iloc[start:stop, :]
+        else:
+            return data.iloc[order[start:stop], :]
+
+    @classmethod
+    def create_view(cls, table: Table, params: ConfigParams, sort_indexes: Dict[str, dict],
+                    name_column_names: List[str], pvalue_column_name: str,
+                    adjusted_pvalue_column_name: str) -> TabularView:
+        """ Create the tabular view of the requested page """
+        page_data = cls.get_page(
+            table.get_data(), params, sort_indexes,
+            name_column_names=name_column_names,
+            pvalue_column_name=pvalue_column_name,
+            adjusted_pvalue_column_name=adjusted_pvalue_column_name)
+        t_view = TabularView()
+        t_view.set_data(data=page_data)
+        return t_view
+
+    @classmethod
+    def _get_filter_mask(cls, data: DataFrame, params: ConfigParams, name_column_names: List[str],
+                         pvalue_column_name: str, adjusted_pvalue_column_name: str) -> np.ndarray:
+        mask = None
+        name_filter = params.get_value("name_filter")
+        if name_filter:
+            try:
+                pattern = re.compile(name_filter)
+            except re.error as err:
+                raise BadRequestException(
+                    f"The name filter '{name_filter}' is not a valid regular expression: {err}") from err
+            name_mask = np.zeros(data.shape[0], dtype=bool)
+            for name in name_column_names:
+                if name in data.columns:
+                    name_mask |= data.loc[:, name].astype(str).str.contains(pattern).to_numpy()
+            mask = name_mask
+
+        for param_name, column_name in [("max_pvalue", pvalue_column_name),
+                                        ("max_adjusted_pvalue", adjusted_pvalue_column_name)]:
+            max_value = params.get_value(param_name)
+            if max_value is None or column_name not in data.columns:
+                continue
+            values = data.loc[:, column_name].to_numpy(dtype=float, na_value=np.nan)
+            value_mask = values <= max_value
+            mask = value_mask if mask is None else (mask & value_mask)
+
+        return mask
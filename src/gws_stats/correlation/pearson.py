@@ -43,6 +43,7 @@ class PearsonCorrelation(BasePairwiseStatsTask):
 
     * Input: a table containing the sample measurements, with the name of the samples.
     * Output: a table listing the correlation coefficient, and its associated p-value for each pairwise comparison testing.
+    * Optional input: a previous result on an older version of the table. Only the comparisons involving new or changed columns are computed.
     * Config Parameters:
       - `preselected_column_names`: List of columns to pre-select for pairwise comparisons. By default a maximum pre-defined number of columns are selected (see configuration).
       - `reference_column`: If given, this reference column is compared against all the other columns.
@@ -100,8 +101,12 @@ class PearsonCorrelation(BasePairwiseStatsTask):
     For more details on the Pearson correlation coefficient, see https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.pearsonr.html.
     """
 
-    input_specs = InputSpecs({'table': InputSpec(
-        Table, human_name="Table", short_description="The input table")})
+    input_specs = InputSpecs({
+        'table': InputSpec(Table, human_name="Table", short_description="The input table"),
+        'previous_result': InputSpec(
+            PearsonCorrelationResult, human_name="Previous result", is_optional=True,
+            short_description="A previous result on an older version of the table, to only compute new comparisons")
+    })
     output_specs = OutputSpecs({'result': OutputSpec(PearsonCorrelationResult, human_name="Result",
                                                      short_description="The output result")})
 
@@ -0,0 +1,133 @@
+
+from typing import List
+
+from gws_core import (BadRequestException, ConfigParams, ConfigSpecs,
+                      FloatParam, InputSpec, InputSpecs, OutputSpec,
+                      OutputSpecs, ParamSet, ResourceSet, StrParam, Task,
+                      TaskInputs, TaskOutputs, task_decorator)
+
+from ..base.base_pairwise_stats_result import BasePairwiseStatsResult
+from ..base.base_pairwise_stats_task import BasePairwiseStatsTask
+from ..pval_adjust.pval_adjust_helper import PValueAdjustHelper
+
+# *****************************************************************************
+#
+# PairwiseStatsMerge
+#
+# *****************************************************************************
+
+
+@task_decorator("PairwiseStatsMerge", human_name="Pairwise stats merge",
+                short_description="Merge the results of pairwise comparisons computed on column-block shards")
+class PairwiseStatsMerge(Task):
+    """
+    Merge the results of pairwise comparisons computed on column-block shards
+
+    Large pairwise comparison jobs can be split into shards (e.g. using the `preselected_column_names` of
+    each pairwise task on different blocks of columns) and run as separate tasks.
+    This task concatenates the raw results of the shards, removes the pairs computed by several shards,
+    recomputes the p-value adjustment over the union of all the comparisons and rebuilds the contingency tables.
+
+    * Input: a set of pairwise results of the same type (e.g. several Pearson correlation results).
+    * Output: the merged pairwise result.
+    * Config Parameters:
+      - `adjust_pvalue`:
+        - `method`: The correction method for p-value adjustment in multiple testing.
+        - `alpha`: The FWER, family-wise error rate. Default is 0.05.
+        - `family`: The families of tests within which the p-values are adjusted (`auto`, `all`, `reference`, `compared` or `group_pair`).
+    """
+
+    DEFAULT_ADJUST_METHOD = BasePairwiseStatsTask.DEFAULT_ADJUST_METHOD
+    DEFAULT_ADJUST_ALPHA = BasePairwiseStatsTask.DEFAULT_ADJUST_ALPHA
+    DEFAULT_ADJUST_FAMILY = BasePairwiseStatsTask.DEFAULT_ADJUST_FAMILY
+    # the column tags are not available in the results
+    ADJUST_FAMILIES = [family for family in BasePairwiseStatsTask.ADJUST_FAMILIES if family != "column_tag"]
+
+    input_specs = InputSpecs({'results': InputSpec(
+        ResourceSet, human_name="Results", short_description="The set of pairwise results to merge")})
+    output_specs = OutputSpecs({'result': OutputSpec(BasePairwiseStatsResult, human_name="Result",
+                                                     short_description="The merged result")})
+    config_specs = ConfigSpecs({
+        "adjust_pvalue":
+        ParamSet(ConfigSpecs({
+            "method": StrParam(
+                default_value=DEFAULT_ADJUST_METHOD, human_name="Correction method",
+                allowed_values=PValueAdjustHelper.METHODS,
+                short_description="The method used to adjust (correct) p-values"),
+            "alpha": FloatParam(
+                default_value=DEFAULT_ADJUST_ALPHA, min_value=0, max_value=1, human_name="Alpha",
+                short_description=f"FWER, family-wise error rate. Default is {DEFAULT_ADJUST_ALPHA}"),
+            "family": StrParam(
+                default_value=DEFAULT_ADJUST_FAMILY, human_name="Families of tests", allowed_values=ADJUST_FAMILIES,
+                short_description="The families of tests within which p-values are adjusted")
+        }), human_name="Adjust p-values", short_description="Adjust p-values for multiple tests.", max_number_of_occurrences=1, min_number_of_occurrences=0)
+    })
+
+    def run(self, params: ConfigParams, inputs: TaskInputs) -> TaskOutputs:
+        resource_set: ResourceSet = inputs['results']
+        results = list(resource_set.get_resources().values())
+        for result in results:
+            if not isinstance(result, BasePairwiseStatsResult):
+                raise BadRequestException(
+                    f"Only pairwise results can be merged. A '{type(result).__name__}' is given.")
+
+        paraset = params.get_value("adjust_pvalue", [])
+        if len(paraset) == 0:
+            adjust_method = self.DEFAULT_ADJUST_METHOD
+            adjust_alpha = self.DEFAULT_ADJUST_ALPHA
+            family = self.DEFAULT_ADJUST_FAMILY
+        else:
+            adjust_method = paraset[0].get("method", self.DEFAULT_ADJUST_METHOD)
+            adjust_alpha = paraset[0].get("alpha", self.DEFAULT_ADJUST_ALPHA)
+            family = paraset[0].get("family", self.DEFAULT_ADJUST_FAMILY)
+
+        result = self.merge(results, adjust_method, adjust_alpha, family=family)
+        return {'result': result}
+
+    @classmethod
+    def merge(cls, results: List[BasePairwiseStatsResult], adjust_method: str = DEFAULT_ADJUST_METHOD,
+              adjust_alpha: float = DEFAULT_ADJUST_ALPHA, family: str = DEFAULT_ADJUST_FAMILY) -> BasePairwiseStatsResult:
+        """
+        Merge pairwise results
+
+        The p-values are adjusted again over the union of the comparisons.
+        If a pair is found in several results, the first one is kept.
+        The hash of a column that differs between the results is not kept, so that the pairs of the column are
+        recomputed by the next incremental run.
+        """
+        if len(results) == 0:
+            raise BadRequestException("No pairwise result to merge.")
+
+        result_type = type(results[0])
+        for result in results:
+            if type(result) is not result_type:
+                raise BadRequestException(
+                    f"Cannot merge results of different types ('{result_type.__name__}' and '{type(result).__name__}').")
+
+        is_group_comparison = results[0].is_group_comparison()
+        for result in results:
+            if result.is_group_comparison() != is_group_comparison:
+                raise BadRequestException(
+                    "Cannot merge results of column-wise comparisons with results of group-wise comparisons.")
+
+        all_result = BasePairwiseStatsTask.concat_raw_results([result.get_raw_result() for result in results])
+        if all_result.shape[0] == 0:
+            raise BadRequestException("The merged result is empty.")
+
+        all_result_dict = BasePairwiseStatsTask.adjust_pvals(
+            all_result, is_group_comparison, adjust_method, adjust_alpha, family=family)
+        merged_result = result_type(result=all_result_dict)
+
+        column_hashes = {}
+        conflicting_names = set()
+        for result in results:
+            for name, column_hash in (result.get_column_hashes() or {}).items():
+                if name in column_hashes and column_hashes[name] != column_hash:
+                    conflicting_names.add(name)
+                column_hashes[name] = column_hash
+        # the columns computed on different data are recomputed by the next incremental run
+        for name in conflicting_names:
+            del column_hashes[name]
+        if column_hashes:
+            merged_result.set_column_hashes(column_hashes)
+        return merged_result
@@ -1,11 +1,13 @@
 
 import numpy as np
 import pandas
-from gws_core import (BadRequestException, ConfigParams, FloatParam, InputSpec,
-                      InputSpecs, OutputSpec, OutputSpecs, StrParam, ConfigSpecs,
+from gws_core import (BadRequestException, BoolParam, ConfigParams, FloatParam, InputSpec,
+                      InputSpecs, OutputSpec, OutputSpecs, ParamSet, StrParam, ConfigSpecs,
                       Table, Task, TaskInputs, TaskOutputs, resource_decorator,
                       task_decorator)
-from statsmodels.stats.multitest import multipletests
+
+from .pval_adjust_helper import PValueAdjustHelper
+from .streaming_fdr_helper import StreamingFDRHelper
 
 # *****************************************************************************
 #
@@ -38,8 +40,20 @@ class PValueAdjust(Task):
         - `holm`: step-down method using Bonferroni adjustments
         - `simes-hochberg`: step-up method (independent)
         - `hommel`: closed method based on Simes tests (non-negative)
-
-    For more details, see https://www.statsmodels.org/dev/generated/statsmodels.stats.multitest.multipletests.html
+        - `qvalue`: Storey q-values, with the proportion of true null hypotheses (pi0) estimated using the smoother method
+        - `qvalue_bootstrap`: Storey q-values, with pi0 estimated using the bootstrap method
+
+      - other_methods: Additional methods used to compare the cut-offs. All the methods share the same sort of the p-values
+        and the adjusted p-values of each method are added to the output table (columns `Adjusted_<column>_<method>`).
+      - family_column_name: The name of the column containing the family of each test. If given, the p-values are adjusted
+        within each family (all the families are adjusted at once).
+      - streaming: Set True to compute the `fdr_bh` and `fdr_by` adjustments chunk by chunk, without sorting all the p-values at once.
+        It is designed for very large numbers of p-values (e.g. genome-scale screens). The table and the adjusted p-values are still
+        held in memory: only the sort uses a bounded memory. The other methods are computed with a full sort.
+
+    All the selected p-value columns are adjusted at once (each column is a family of tests).
+    Invalid p-values (empty values or values outside [0, 1]) are not counted in the number of tests and their adjusted p-values are empty.
+    The results are the same as the ones of `statsmodels`, see https://www.statsmodels.org/dev/generated/statsmodels.stats.multitest.multipletests.html
     """
 
     DEFAULT_MAX_NUMBER_OF_COLUMNS_TO_USE = 500
@@ -54,28 +68,81 @@ class PValueAdjust(Task):
             short_description="The name of the column containing p-values. If not given, the columns with values between 0 and 1 are supposed to contain p-values."),
         "method": StrParam(
             default_value="bonferroni", human_name="Correction method",
-            allowed_values=["bonferroni", "fdr_bh", "fdr_by", "fdr_tsbh",
-                            "fdr_tsbky", "sidak", "holm-sidak", "holm", "simes-hochberg", "hommel"],
+            allowed_values=PValueAdjustHelper.METHODS,
             short_description="The method used to adjust (correct) p-values"),
+        "other_methods": ParamSet(ConfigSpecs({
+            "method": StrParam(
+                allowed_values=PValueAdjustHelper.METHODS, human_name="Correction method",
+                short_description="An additional method used to adjust (correct) p-values")
+        }), human_name="Other correction methods", short_description="Additional methods used to adjust p-values and compare cut-offs",
+            min_number_of_occurrences=0),
+        "family_column_name": StrParam(
+            default_value=None, optional=True, human_name="Family column name",
+            short_description="The name of the column containing the family of each test. If given, p-values are adjusted within each family."),
         "alpha": FloatParam(
             default_value=0.05, min_value=0, max_value=1, human_name="Alpha",
             short_description="FWER, family-wise error rate"),
+        "streaming": BoolParam(
+            default_value=False, human_name="Streaming fdr", visibility=BoolParam.PROTECTED_VISIBILITY,
+            short_description="Set True to compute the fdr_bh and fdr_by adjustments chunk by chunk, without sorting all the p-values at once"),
     })
 
-    def compute_stats(self, current_data, params: ConfigParams):
+    def compute_stats(self, current_data, params: ConfigParams, families=None):
         """ compute stats """
         alpha = params.get_value("alpha")
-        method = params.get_value("method")
-        _, pvals_corrected, _, _ = multipletests(current_data, alpha, method)
-        stat_result = pvals_corrected
+        methods = self._get_methods(params)
+        if families is not None:
+            if params.get_value("streaming", False):
+                self.log_warning_message("Families of tests are adjusted in memory.")
+            return {
+                method: np.stack([
+                    PValueAdjustHelper.adjust_grouped(current_data[:, j], families, method, alpha)
+                    for j in range(0, current_data.shape[1])], axis=1)
+                for method in methods
+            }
+        if not params.get_value("streaming", False):
+            return PValueAdjustHelper.adjust_many(current_data, methods, alpha, axis=0)
+
+        stat_result = {}
+        in_memory_methods = [method for method in methods if method not in StreamingFDRHelper.METHODS]
+        if len(in_memory_methods) > 0:
+            self.log_warning_message(
+                f"Only {StreamingFDRHelper.METHODS} methods can be computed chunk by chunk. Methods {in_memory_methods} are computed with a full sort.")
+            in_memory_result = PValueAdjustHelper.adjust_many(current_data, in_memory_methods, alpha, axis=0)
+        for method in methods:
+            if method in StreamingFDRHelper.METHODS:
+                # adjusted values are written column by column and chunk by chunk (the table is in memory)
+                adjusted = np.empty(current_data.shape, dtype=float)
+                for j in range(0, current_data.shape[1]):
+                    StreamingFDRHelper.adjust(current_data[:, j], method, out=adjusted[:, j])
+                stat_result[method] = adjusted
+            else:
+                stat_result[method] = in_memory_result[method]
         return stat_result
 
+    def _get_methods(self, params: ConfigParams):
+        methods = [params.get_value("method")]
+        for paraset in params.get_value("other_methods", None) or []:
+            method = paraset.get("method")
+            if method and method not in methods:
+                methods.append(method)
+        return methods
+
     def run(self, params: ConfigParams, inputs: TaskInputs) -> TaskOutputs:
         table = inputs['table']
         data = table.get_data()
+        families = None
+        family_col_name = params.get_value("family_column_name")
+        if family_col_name:
+            if family_col_name not in data.columns:
+                raise BadRequestException(
+                    f"The family column name '{family_col_name}' does not exist")
+            families = data.loc[:, family_col_name].to_list()
+            data = data.drop(columns=[family_col_name])
         data = data.apply(pandas.to_numeric, errors='coerce')
 
         target_col_name = params.get_value("pval_column_name")
+        is_auto_detection = not target_col_name
         if target_col_name:
             if target_col_name in data.columns:
                 target_col_index = data.columns.get_loc(target_col_name)
@@ -90,33 +157,44 @@ class PValueAdjust(Task):
             target_col_index = range(
                 0, min(self.DEFAULT_MAX_NUMBER_OF_COLUMNS_TO_USE, data.shape[1]))
 
-        all_result = None
-        for i in target_col_index:
+        # invalid p-values (NaN or values outside [0, 1]) are excluded from the tests and adjusted to NaN
+        target_col_index = list(target_col_index)
+        current_data = data.iloc[:, target_col_index].to_numpy(dtype=float, na_value=np.nan)
+        is_valid = (current_data >= 0) & (current_data <= 1)
+        nb_valid = is_valid.sum(axis=0)
+        if is_auto_detection:
+            # the columns with values outside [0, 1] are not supposed to contain p-values
+            is_out_of_range = np.logical_and(~is_valid, ~np.isnan(current_data)).any(axis=0)
+            nb_valid[is_out_of_range] = 0
+        valid_col_index = []
+        for j, i in enumerate(target_col_index):
             target_col_name = data.columns[i]
-            current_data = data.iloc[:, [i]]
-            tf = np.logical_and(current_data > 0, current_data < 1)
-            if not tf.all(axis=None):
+            if nb_valid[j] == 0:
                 self.log_warning_message(
-                    f"Data of column '{target_col_name}' are not between 0 and 1. This column is omitted.")
+                    f"Column '{target_col_name}' does not contain p-values (values between 0 and 1). This column is omitted.")
                 continue
+            if nb_valid[j] < current_data.shape[0]:
+                self.log_warning_message(
+                    f"{current_data.shape[0] - nb_valid[j]} value(s) of column '{target_col_name}' are not between 0 and 1. These values are not tested.")
+            valid_col_index.append(i)
 
-            current_data = current_data.to_numpy().flatten()
-
-            stat_result = self.compute_stats(current_data, params)
-
-            if all_result is None:
-                all_result = pandas.DataFrame(
-                    stat_result, columns=["Adjusted_"+target_col_name])
-            else:
-                df = pandas.DataFrame(stat_result, columns=[
-                    "Adjusted_"+target_col_name])
-                all_result = pandas.concat(
-                    [all_result, df], axis=0, ignore_index=True)
-
-        if all_result is None:
+        if len(valid_col_index) == 0:
             raise BadRequestException(
                 "No valid p-value found. Please ensure that values are between 0 and 1.")
 
+        # adjust all the p-value columns at once
+        if len(valid_col_index) < len(target_col_index):
+            current_data = current_data[:, nb_valid > 0]
+        stat_result = self.compute_stats(current_data, params, families=families)
+        adjusted_tables = []
+        for method, adjusted in stat_result.items():
+            if len(stat_result) == 1:
+                column_names = ["Adjusted_" + str(data.columns[i]) for i in valid_col_index]
+            else:
+                column_names = [f"Adjusted_{data.columns[i]}_{method}" for i in valid_col_index]
+            adjusted_tables.append(pandas.DataFrame(adjusted, columns=column_names))
+        all_result = pandas.concat(adjusted_tables, axis=1)
+
         all_result.index = table.get_data().index
         all_result = pandas.concat([table.get_data(), all_result], axis=1)
 
@@ -0,0 +1,368 @@
+
+from typing import Dict, List
+
+import numpy as np
+import pandas
+from gws_core import BadRequestException
+
+# *****************************************************************************
+#
+# PValueAdjustHelper
+#
+# *****************************************************************************
+
+
+class PValueAdjustHelper:
+    """
+    Vectorized p-value adjustment for multiple tests
+
+    The p-values of a whole 2-D array are adjusted along a given axis (each 1-D slice along this axis
+    is a family of tests) using one sort and cumulative min/max operations. The results are the same
+    as the ones of `statsmodels.stats.multitest.multipletests`.
+
+    Invalid p-values (NaN or values outside [0, 1]) are masked: they are not counted in the size of their family
+    and their adjusted p-values are NaN. The valid p-values of the family are adjusted as if the invalid ones did not exist.
+
+    Available methods are:
+
+    - `bonferroni`: one-step correction
+    - `fdr_bh`: Benjamini/Hochberg (non-negative)
+    - `fdr_by`: Benjamini/Yekutieli (negative)
+    - `fdr_tsbh`: two stage fdr correction (non-negative)
+    - `fdr_tsbky`: two stage fdr correction (non-negative)
+    - `sidak`: one-step correction
+    - `holm-sidak`: step down method using Sidak adjustments
+    - `holm`: step-down method using Bonferroni adjustments
+    - `simes-hochberg`: step-up method (independent)
+    - `hommel`: closed method based on Simes tests (non-negative)
+    - `qvalue`: Storey q-values, with the proportion of true null hypotheses (pi0) estimated using the smoother method
+    - `qvalue_bootstrap`: Storey q-values, with pi0 estimated using the bootstrap method
+
+    The q-value methods follow the `qvalue` R package. pi0 is estimated from the histogram of the p-values on the
+    lambda grid 0.05, 0.10, ..., 0.95, computed for all the lambdas at once. The smoother method fits a quadratic
+    polynomial (3 degrees of freedom, instead of a cubic smoothing spline with `df=3`) to pi0(lambda) and takes its value
+    at the largest lambda (or the bootstrap estimate if this value is not positive). The bootstrap method uses the
+    closed-form mean squared error of the `qvalue` package. pi0 is at least 1 / ntests.
+    """
+
+    METHODS = ["bonferroni", "fdr_bh", "fdr_by", "fdr_tsbh", "fdr_tsbky",
+               "sidak", "holm-sidak", "holm", "simes-hochberg", "hommel",
+               "qvalue", "qvalue_bootstrap"]
+    QVALUE_LAMBDAS = np.arange(0.05, 0.96, 0.05)
+
+    @classmethod
+    def adjust(cls, pvals, method: str = "bonferroni", alpha: float = 0.05, axis: int = 0) -> np.ndarray:
+        """
+        Adjust the p-values along an axis
+
+        :param pvals: The p-values (1-D or N-D array)
+        :param method: The adjustment method
+        :param alpha: The FWER, family-wise error rate. Only used by the two-stage fdr methods
+        :param axis: The axis along which the p-values are adjusted
+        :return: The adjusted p-values, with the same shape as `pvals`
+        """
+        cls._check_method(method)
+        sorted_pvals, sort_index = cls.sort(pvals, axis=axis)
+        sorted_adjusted = cls.adjust_sorted(sorted_pvals, method, alpha)
+        return cls.unsort(sorted_adjusted, sort_index, pvals, axis=axis)
+
+    @classmethod
+    def adjust_many(cls, pvals, methods: List[str], alpha: float = 0.05, axis: int = 0) -> Dict[str, np.ndarray]:
+        """
+        Adjust the p-values along an axis with several methods, using one shared sort
+
+        :param pvals: The p-values (1-D or N-D array)
+        :param methods: The list of adjustment methods
+        :param alpha: The FWER, family-wise error rate. Only used by the two-stage fdr methods
+        :param axis: The axis along which the p-values are adjusted
+        :return: The adjusted p-values of each method
+        """
+        for method in methods:
+            cls._check_method(method)
+        sorted_pvals, sort_index = cls.sort(pvals, axis=axis)
+        adjusted = {}
+        for method in methods:
+            sorted_adjusted = cls.adjust_sorted(sorted_pvals, method, alpha)
+            adjusted[method] = cls.unsort(sorted_adjusted, sort_index, pvals, axis=axis)
+        return adjusted
+
+    @classmethod
+    def adjust_grouped(cls, pvals, families, method: str = "bonferroni", alpha: float = 0.05) -> np.ndarray:
+        """
+        Adjust 1-D p-values within families of tests
+
+        All the families are adjusted at once: the p-values are sorted by (family, p-value) with one lexsort
+        and the running min/max of the step-up and step-down methods are computed by family in one groupby pass.
+        The `hommel` and q-value methods are adjusted family by family.
+
+        :param pvals: The p-values (1-D array)
+        :param families: The family label of each p-value (1-D array of hashable values)
+        :param method: The adjustment method
+        :param alpha: The FWER, family-wise error rate. Only used by the two-stage fdr methods
+        :return: The adjusted p-values
+        """
+        cls._check_method(method)
+        pvals = cls.mask_invalid(np.asarray(pvals, dtype=float).ravel())
+        family_ids, _ = pandas.factorize(pandas.Series(list(families)))
+        if len(family_ids) != len(pvals):
+            raise BadRequestException(
+                f"The number of families ({len(family_ids)}) and the number of p-values ({len(pvals)}) are different")
+        if len(pvals) == 0:
+            return pvals.copy()
+        # missing labels form their own family
+        family_ids = np.where(family_ids < 0, family_ids.max() + 1, family_ids)
+
+        sort_index = np.lexsort((pvals, family_ids))
+        sorted_pvals = pvals[sort_index]
+        segment_ids = family_ids[sort_index]
+        sizes = np.bincount(segment_ids)
+        starts = np.cumsum(sizes) - sizes
+        # the invalid p-values are at the end of their segment and are not counted as tests
+        nb_valid = np.bincount(segment_ids, weights=~np.isnan(sorted_pvals)).astype(int)
+        sorted_adjusted = cls._adjust_sorted_segments(
+            sorted_pvals, segment_ids, starts, sizes, nb_valid, method, alpha)
+
+        adjusted = np.empty_like(sorted_adjusted)
+        adjusted[sort_index] = sorted_adjusted
+        return adjusted
+
+    @staticmethod
+    def mask_invalid(pvals: np.ndarray) -> np.ndarray:
+        """ Returns the p-values with NaN in place of the invalid values (i.e. outside [0, 1]) """
+        is_valid = (pvals >= 0) & (pvals <= 1)
+        if is_valid.all():
+            return pvals
+        return np.where(is_valid, pvals, np.nan)
+
+    @classmethod
+    def sort(cls, pvals, axis: int = 0):
+        """
+        Sort the p-values along an axis. The invalid p-values are replaced by NaN and placed at the end.
+
+        :return: The sorted p-values as a 2-D array (the tests along the first axis) and the sort index
+        """
+        pvals = np.asarray(pvals, dtype=float)
+        pvals = np.moveaxis(pvals, axis, 0)
+        pvals = cls.mask_invalid(pvals.reshape(pvals.shape[0], -1))
+        sort_index = np.argsort(pvals, axis=0, kind="stable")
+        sorted_pvals = np.take_along_axis(pvals, sort_index, axis=0)
+        return sorted_pvals, sort_index
+
+    @classmethod
+    def unsort(cls, sorted_values: np.ndarray, sort_index: np.ndarray, pvals, axis: int = 0) -> np.ndarray:
+        """ Restore the original order and shape of sorted values """
+        pvals = np.asarray(pvals)
+        values = np.empty_like(sorted_values)
+        np.put_along_axis(values, sort_index, sorted_values, axis=0)
+        shape = np.moveaxis(np.empty(pvals.shape, dtype=np.int8), axis, 0).shape
+        return np.moveaxis(values.reshape(shape), 0, axis)
+
+    @classmethod
+    def adjust_sorted(cls, sorted_pvals: np.ndarray, method: str, alpha: float = 0.05) -> np.ndarray:
+        """
+        Adjust p-values sorted in ascending order along the first axis of a 2-D array.
+        NaN values (i.e. invalid p-values) must be at the end of each column.
+        """
+        cls._check_method(method)
+        if sorted_pvals.shape[0] == 0:
+            return sorted_pvals.copy()
+
+        # number of valid tests of each column and number of tests above (and including) each rank
+        is_nan = np.isnan(sorted_pvals)
+        ntests = (sorted_pvals.shape[0] - is_nan.sum(axis=0))[None, :]
+        ranks = np.arange(1, sorted_pvals.shape[0] + 1, dtype=float)[:, None]
+        nb_above = ntests - ranks + 1
+        method = method.lower()
+        if method == "bonferroni":
+            adjusted = sorted_pvals * ntests
+        elif method == "sidak":
+            adjusted = -np.expm1(ntests * cls._log1m(sorted_pvals))
+        elif method == "holm-sidak":
+            adjusted = -np.expm1(nb_above * cls._log1m(sorted_pvals))
+            adjusted = np.fmax.accumulate(adjusted, axis=0)
+        elif method == "holm":
+            adjusted = sorted_pvals * nb_above
+            adjusted = np.fmax.accumulate(adjusted, axis=0)
+        elif method == "simes-hochberg":
+            adjusted = sorted_pvals * nb_above
+            adjusted = cls._reverse_cummin(adjusted)
+        elif method == "hommel":
+            adjusted = cls._hommel(sorted_pvals, ntests[0])
+        elif method == "fdr_bh":
+            adjusted = cls._fdr(sorted_pvals, ntests[0])
+        elif method == "fdr_by":
+            adjusted = cls._fdr(sorted_pvals, ntests[0], is_negative=True)
+        elif method == "fdr_tsbh":
+            adjusted = cls._fdr_twostage(sorted_pvals, ntests[0], alpha, is_bky=False)
+        elif method == "fdr_tsbky":
+            adjusted = cls._fdr_twostage(sorted_pvals, ntests[0], alpha, is_bky=True)
+        elif method == "qvalue":
+            adjusted = cls._fdr(sorted_pvals, ntests[0]) * cls.estimate_pi0(sorted_pvals, "smoother")[None, :]
+        elif method == "qvalue_bootstrap":
+            adjusted = cls._fdr(sorted_pvals, ntests[0]) * cls.estimate_pi0(sorted_pvals, "bootstrap")[None, :]
+
+        adjusted = np.minimum(adjusted, 1)
+        adjusted[is_nan] = np.nan
+        return adjusted
+
+    @classmethod
+    def estimate_pi0(cls, pvals: np.ndarray, pi0_method: str = "smoother") -> np.ndarray:
+        """
+        Estimate the proportion of true null hypotheses of each column of a 2-D array of p-values
+        (tests along the first axis). NaN values are ignored.
+
+        :param pi0_method: `smoother` or `bootstrap`
+        """
+        pvals = np.asarray(pvals, dtype=float)
+        nb_columns = pvals.shape[1]
+        lambdas = cls.QVALUE_LAMBDAS
+        nb_lambdas = len(lambdas)
+
+        # histogram of the p-values on the lambda grid: bin l contains the p-values with l lambdas <= p
+        # and the last bin contains the NaN values
+        is_nan = np.isnan(pvals)
+        ntests = np.maximum(pvals.shape[0] - is_nan.sum(axis=0), 1)[None, :]
+        bin_ids = np.where(is_nan, nb_lambdas + 1, np.searchsorted(lambdas, pvals, side="right"))
+        bin_ids = bin_ids + (nb_lambdas + 2) * np.arange(nb_columns)[None, :]
+        counts = np.bincount(bin_ids.ravel(), minlength=(nb_lambdas + 2) * nb_columns)
+        counts = counts.reshape(nb_columns, nb_lambdas + 2).T[:-1]
+        # number of p-values >= lambda, for all the lambdas at once
+        nb_above = np.cumsum(counts[::-1], axis=0)[::-1][1:]
+        pi0_lambda = nb_above / (ntests * (1.0 - lambdas[:, None]))
+
+        if pi0_method not in ["smoother", "bootstrap"]:
+            raise BadRequestException(f"Invalid pi0 estimation method '{pi0_method}'")
+        min_pi0 = np.quantile(pi0_lambda, 0.1, axis=0)
+        mse = (nb_above / (ntests ** 2 * (1.0 - lambdas[:, None]) ** 2)) * (1.0 - nb_above / ntests) + \
+            (pi0_lambda - min_pi0[None, :]) ** 2
+        pi0 = np.take_along_axis(pi0_lambda, np.argmin(mse, axis=0)[None, :], axis=0)[0]
+        if pi0_method == "smoother":
+            coefs = np.polyfit(lambdas, pi0_lambda, deg=2)
+            smoothed_pi0 = np.polyval(coefs, lambdas[-1])
+            # the quadratic fit can go below 0 on small families (rejected by the `qvalue` package): the bootstrap
+            # estimate is used instead
+            pi0 = np.where(smoothed_pi0 > 0, smoothed_pi0, pi0)
+
+        # at least one true null hypothesis, so that the q-values are not all 0
+        return np.clip(pi0, 1.0 / ntests[0], 1)
+
+    @classmethod
+    def _adjust_sorted_segments(cls, sorted_pvals: np.ndarray, segment_ids: np.ndarray, starts: np.ndarray,
+                                sizes: np.ndarray, nb_valid: np.ndarray, method: str, alpha: float) -> np.ndarray:
+        """
+        Adjust 1-D p-values sorted by segment (contiguous families of tests) then in ascending order,
+        with the NaN values at the end of each segment
+        """
+        method = method.lower()
+        if method in ["hommel", "qvalue", "qvalue_bootstrap"]:
+            adjusted = np.empty_like(sorted_pvals)
+            for start, size in zip(starts, sizes):
+                adjusted[start:start+size] = cls.adjust_sorted(
+                    sorted_pvals[start:start+size, None], method, alpha)[:, 0]
+            return adjusted
+
+        # number of valid tests of the family and rank in the family of each p-value
+        ntests = nb_valid[segment_ids].astype(float)
+        ranks = np.arange(1, len(sorted_pvals) + 1, dtype=float) - starts[segment_ids]
+        nb_above = ntests - ranks + 1
+        if method == "bonferroni":
+            adjusted = sorted_pvals * ntests
+        elif method == "sidak":
+            adjusted = -np.expm1(ntests * cls._log1m(sorted_pvals))
+        elif method == "holm-sidak":
+            adjusted = -np.expm1(nb_above * cls._log1m(sorted_pvals))
+            adjusted = cls._segment_cummax(adjusted, segment_ids)
+        elif method == "holm":
+            adjusted = cls._segment_cummax(sorted_pvals * nb_above, segment_ids)
+        elif method == "simes-hochberg":
+            adjusted = cls._segment_reverse_cummin(sorted_pvals * nb_above, segment_ids)
+        elif method == "fdr_bh":
+            adjusted = cls._segment_reverse_cummin(sorted_pvals * ntests / ranks, segment_ids)
+        elif method == "fdr_by":
+            harmonic_sums = np.cumsum(1.0 / np.arange(1, sizes.max() + 1))
+            factor = ntests / ranks * harmonic_sums[np.maximum(nb_valid - 1, 0)][segment_ids]
+            adjusted = cls._segment_reverse_cummin(sorted_pvals * factor, segment_ids)
+        elif method in ["fdr_tsbh", "fdr_tsbky"]:
+            fact = (1.0 + alpha) if method == "fdr_tsbky" else 1.0
+            alpha_prime = alpha / fact
+            # first stage: number of rejections of the BH procedure at level alpha_prime in each family
+            is_below = sorted_pvals <= ranks / ntests * alpha_prime
+            nb_rejected = np.maximum.reduceat(np.where(is_below, ranks, 0), starts)
+            # second stage: rescale with the estimated number of true null hypotheses
+            adjusted = np.minimum(cls._segment_reverse_cummin(sorted_pvals * ntests / ranks, segment_ids), 1)
+            is_single_stage = (nb_rejected == 0) | (nb_rejected == nb_valid)
+            factor = np.where(is_single_stage, fact, fact * (nb_valid - nb_rejected) / np.maximum(nb_valid, 1))
+            adjusted = adjusted * factor[segment_ids]
+
+        return np.minimum(adjusted, 1)
+
+    @staticmethod
+    def _segment_cummax(values: np.ndarray, segment_ids: np.ndarray) -> np.ndarray:
+        # the cumulative operations of pandas skip the NaN values
+        return pandas.Series(values).groupby(segment_ids, sort=False).cummax().to_numpy()
+
+    @staticmethod
+    def _segment_reverse_cummin(values: np.ndarray, segment_ids: np.ndarray) -> np.ndarray:
+        reversed_values = pandas.Series(values[::-1])
+        return reversed_values.groupby(segment_ids[::-1], sort=False).cummin().to_numpy()[::-1]
+
+    @classmethod
+    def _check_method(cls, method: str):
+        if method is None or method.lower() not in cls.METHODS:
+            raise BadRequestException(
+                f"Invalid p-value adjustment method '{method}'. Valid methods are {cls.METHODS}.")
+
+    @staticmethod
+    def _log1m(pvals: np.ndarray) -> np.ndarray:
+        # log(1 - p) is -inf for p = 1 (adjusted p-value of 1)
+        with np.errstate(divide="ignore"):
+            return np.log1p(-pvals)
+
+    @staticmethod
+    def _reverse_cummin(values: np.ndarray) -> np.ndarray:
+        # fmin skips the NaN values placed at the end of the columns
+        return np.fmin.accumulate(values[::-1], axis=0)[::-1]
+
+    @classmethod
+    def _fdr(cls, sorted_pvals: np.ndarray, ntests: np.ndarray, is_negative: bool = False) -> np.ndarray:
+        ecdf_factor = np.arange(1, sorted_pvals.shape[0] + 1, dtype=float)[:, None] / np.maximum(ntests, 1)[None, :]
+        if is_negative:
+            harmonic_sums = np.cumsum(1.0 / np.arange(1, sorted_pvals.shape[0] + 1))
+            ecdf_factor = ecdf_factor / harmonic_sums[np.maximum(ntests - 1, 0)][None, :]
+        adjusted = cls._reverse_cummin(sorted_pvals / ecdf_factor)
+        return np.minimum(adjusted, 1)
+
+    @classmethod
+    def _fdr_twostage(cls, sorted_pvals: np.ndarray, ntests: np.ndarray, alpha: float, is_bky: bool) -> np.ndarray:
+        nb_rows = sorted_pvals.shape[0]
+        fact = (1.0 + alpha) if is_bky else 1.0
+        alpha_prime = alpha / fact
+
+        # first stage: number of rejections of the BH procedure at level alpha_prime
+        ecdf_factor = np.arange(1, nb_rows + 1, dtype=float)[:, None] / np.maximum(ntests, 1)[None, :]
+        is_below = sorted_pvals <= ecdf_factor * alpha_prime
+        nb_rejected = np.where(
+            is_below.any(axis=0),
+            nb_rows - np.argmax(is_below[::-1], axis=0),
+            0)
+
+        # second stage: rescale with the estimated number of true null hypotheses
+        adjusted = cls._fdr(sorted_pvals, ntests)
+        is_single_stage = (nb_rejected == 0) | (nb_rejected == ntests)
+        factor = np.where(is_single_stage, fact, fact * (ntests - nb_rejected) / np.maximum(ntests, 1))
+        return adjusted * factor[None, :]
+
+    @classmethod
+    def _hommel(cls, sorted_pvals: np.ndarray, ntests: np.ndarray) -> np.ndarray:
+        adjusted = np.empty_like(sorted_pvals)
+        # the columns with the same number of valid tests are adjusted together
+        for nb_valid in np.unique(ntests):
+            is_selected = ntests == nb_valid
+            valid_pvals = sorted_pvals[:nb_valid, is_selected]
+            valid_adjusted = valid_pvals.copy()
+            for m in range(nb_valid, 1, -1):
+                cim = np.min(m * valid_pvals[-m:] / np.arange(1, m + 1.0)[:, None], axis=0)
+                valid_adjusted[-m:] = np.maximum(valid_adjusted[-m:], cim)
+                valid_adjusted[:-m] = np.maximum(valid_adjusted[:-m], np.minimum(m * valid_pvals[:-m], cim))
+            adjusted[:nb_valid, is_selected] = valid_adjusted
+        return adjusted
@@ -0,0 +1,211 @@
+
+import os
+import tempfile
+
+import numpy as np
+from gws_core import BadRequestException
+
+# *****************************************************************************
+#
+# StreamingFDRHelper
+#
+# *****************************************************************************
+
+
+class StreamingFDRHelper:
+    """
+    Out-of-core Benjamini/Hochberg (and Benjamini/Yekutieli) p-value adjustment with bounded memory
+
+    The p-values are read chunk by chunk (e.g. from a `numpy.memmap`) and never sorted all at once:
+
+    1. a first pass computes a histogram of the p-values;
+    2. a second pass distributes the (index, p-value) pairs into bucket files on disk, each bucket
+       covering a range of p-values (buckets larger than the chunk size are split again);
+    3. the buckets are then loaded one by one, from the largest to the smallest p-values. Since the rank of
+       the first p-value of a bucket is known from the histogram, the adjusted p-values of the bucket are
+       computed with a local sort and a running minimum, and written back chunk by chunk to the output array.
+
+    The results are exactly the ones of the in-memory adjustment. Invalid p-values (NaN or values outside [0, 1])
+    are not counted as tests and their adjusted p-values are NaN.
+    """
+
+    METHODS = ["fdr_bh", "fdr_by"]
+    DEFAULT_CHUNK_SIZE = 1000000
+    NB_HISTOGRAM_BINS = 1024
+
+    _BUCKET_DTYPE = np.dtype([("index", np.int64), ("pval", np.float64)])
+
+    @classmethod
+    def adjust(cls, pvals, method: str = "fdr_bh", chunk_size: int = DEFAULT_CHUNK_SIZE,
+               out: np.ndarray = None, tmp_dir: str = None) -> np.ndarray:
+        """
+        Adjust a 1-D array of p-values
+
+        :param pvals: The p-values, any 1-D array-like supporting slicing (e.g. a `numpy.memmap`)
+        :param method: The adjustment method (`fdr_bh` or `fdr_by`)
+        :param chunk_size: The maximum number of p-values loaded in memory at once
+        :param out: The output array (e.g. a writable `numpy.memmap`). A new array is created if not given
+        :param tmp_dir: The directory of the temporary bucket files
+        :return: The adjusted p-values
+        """
+        if method not in cls.METHODS:
+            raise BadRequestException(
+                f"Invalid streaming adjustment method '{method}'. Valid methods are {cls.METHODS}.")
+        if chunk_size < 1:
+            raise BadRequestException("The chunk size must be greater than 0")
+
+        nb_values = len(pvals)
+        if out is None:
+            out = np.empty(nb_values, dtype=float)
+
+        # pass 1: histogram of the p-values
+        edges = cls._get_histogram_edges(0.0, 1.0)
+        counts = np.zeros(len(edges) - 1, dtype=np.int64)
+        for start in range(0, nb_values, chunk_size):
+            chunk = np.asarray(pvals[start:start+chunk_size], dtype=float)
+            out[start:start+chunk_size] = np.nan
+            counts += cls._count(chunk, edges)
+
+        ntests = int(counts.sum())
+        if ntests == 0:
+            return out
+
+        factor = float(ntests)
+        if method == "fdr_by":
+            factor = factor * cls._get_harmonic_number(ntests, chunk_size)
+
+        with tempfile.TemporaryDirectory(dir=tmp_dir) as bucket_dir:
+            # pass 2: distribute the p-values into bucket files
+            bucket_paths = cls._partition(
+                lambda: cls._iter_chunks(pvals, nb_values, chunk_size), edges, bucket_dir)
+
+            # pass 3: process the buckets from the largest to the smallest p-values
+            state = {"rank": ntests, "running_min": np.inf}
+            for bucket_id in range(len(counts) - 1, -1, -1):
+                if counts[bucket_id] == 0:
+                    continue
+                cls._process_bucket(bucket_paths[bucket_id], int(counts[bucket_id]),
+                                    factor, chunk_size, out, state, bucket_dir)
+
+        return out
+
+    # -- private methods --
+
+    @classmethod
+    def _get_histogram_edges(cls, lower: float, upper: float) -> np.ndarray:
+        if lower == 0.0 and upper == 1.0:
+            # p-values of large screens accumulate near 0: use log-spaced and linear bins
+            nb_bins = cls.NB_HISTOGRAM_BINS // 2
+            edges = np.unique(np.concatenate([
+                [0.0], np.logspace(-300, 0, nb_bins), np.linspace(0.0, 1.0, nb_bins)]))
+        else:
+            edges = np.linspace(lower, upper, cls.NB_HISTOGRAM_BINS + 1)
+        return edges
+
+    @staticmethod
+    def _get_harmonic_number(ntests: int, chunk_size: int) -> float:
+        """ Returns the sum of 1/i for i in [1, ntests], summed by chunks """
+        harmonic_number = 0.0
+        for start in range(1, ntests + 1, chunk_size):
+            harmonic_number += np.sum(1.0 / np.arange(start, min(start + chunk_size, ntests + 1)))
+        return harmonic_number
+
+    @staticmethod
+    def _get_bin_ids(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+        # the last bin is closed on the right (as numpy.histogram)
+        bin_ids = np.searchsorted(edges, values, side="right") - 1
+        return np.clip(bin_ids, 0, len(edges) - 2)
+
+    @staticmethod
+    def _is_valid(chunk: np.ndarray) -> np.ndarray:
+        return (chunk >= 0) & (chunk <= 1)
+
+    @classmethod
+    def _count(cls, chunk: np.ndarray, edges: np.ndarray) -> np.ndarray:
+        chunk = chunk[cls._is_valid(chunk)]
+        return np.bincount(cls._get_bin_ids(chunk, edges), minlength=len(edges) - 1)
+
+    @staticmethod
+    def _iter_chunks(pvals, nb_values: int, chunk_size: int):
+        for start in range(0, nb_values, chunk_size):
+            chunk = np.asarray(pvals[start:start+chunk_size], dtype=float)
+            yield np.arange(start, start + len(chunk), dtype=np.int64), chunk
+
+    @classmethod
+    def _partition(cls, iter_chunks, edges: np.ndarray, bucket_dir: str):
+        """ Write the (index, p-value) pairs of each non-empty bucket in a separate file """
+        bucket_paths = {}
+        for indexes, chunk in iter_chunks():
+            is_valid = cls._is_valid(chunk)
+            indexes = indexes[is_valid]
+            chunk = chunk[is_valid]
+            bin_ids = cls._get_bin_ids(chunk, edges)
+            order = np.argsort(bin_ids, kind="stable")
+            bin_ids = bin_ids[order]
+            records = np.empty(len(order), dtype=cls._BUCKET_DTYPE)
+            records["index"] = indexes[order]
+            records["pval"] = chunk[order]
+            unique_ids, starts = np.unique(bin_ids, return_index=True)
+            stops = np.append(starts[1:], len(bin_ids))
+            for bucket_id, start, stop in zip(unique_ids, starts, stops):
+                if bucket_id not in bucket_paths:
+                    fd, path = tempfile.mkstemp(dir=bucket_dir, suffix=".bucket")
+                    os.close(fd)
+                    bucket_paths[bucket_id] = path
+                # files are only opened while writing to stay below the limit of open files
+                with open(bucket_paths[bucket_id], "ab") as file:
+                    file.write(records[start:stop].tobytes())
+        return bucket_paths
+
+    @classmethod
+    def _iter_bucket(cls, path: str, chunk_size: int):
+        records = np.memmap(path, dtype=cls._BUCKET_DTYPE, mode="r")
+        for start in range(0, len(records), chunk_size):
+            chunk = np.array(records[start:start+chunk_size])
+            yield chunk["index"], chunk["pval"]
+
+    @classmethod
+    def _process_bucket(cls, path: str, count: int, factor: float, chunk_size: int,
+                        out: np.ndarray, state: dict, bucket_dir: str):
+        if count <= chunk_size:
+            records = np.fromfile(path, dtype=cls._BUCKET_DTYPE)
+            os.remove(path)
+            order = np.argsort(records["pval"], kind="stable")
+            pvals = records["pval"][order]
+            indexes = records["index"][order]
+            ranks = np.arange(state["rank"] - count + 1, state["rank"] + 1, dtype=float)
+            adjusted = np.minimum.accumulate((pvals * factor / ranks)[::-1])[::-1]
+            adjusted = np.minimum(adjusted, state["running_min"])
+            out[indexes] = np.minimum(adjusted, 1.0)
+            state["running_min"] = adjusted[0]
+            state["rank"] -= count
+            return
+
+        lower = np.inf
+        upper = -np.inf
+        for _, chunk in cls._iter_bucket(path, chunk_size):
+            lower = min(lower, chunk.min())
+            upper = max(upper, chunk.max())
+
+        if lower == upper:
+            # all the p-values are equal: they share the adjusted value of the largest rank
+            adjusted = min(lower * factor / state["rank"], state["running_min"])
+            for indexes, _ in cls._iter_bucket(path, chunk_size):
+                out[indexes] = min(adjusted, 1.0)
+            os.remove(path)
+            state["running_min"] = adjusted
+            state["rank"] -= count
+            return
+
+        # the bucket is too large: split it again
+        edges = cls._get_histogram_edges(lower, upper)
+        counts = np.zeros(len(edges) - 1, dtype=np.int64)
+        for _, chunk in cls._iter_bucket(path, chunk_size):
+            counts += cls._count(chunk, edges)
+        sub_bucket_paths = cls._partition(lambda: cls._iter_bucket(path, chunk_size), edges, bucket_dir)
+        os.remove(path)
+        for bucket_id in range(len(counts) - 1, -1, -1):
+            if counts[bucket_id] == 0:
+                continue
+            cls._process_bucket(sub_bucket_paths[bucket_id], int(counts[bucket_id]),
+                                factor, chunk_size, out, state, bucket_dir)
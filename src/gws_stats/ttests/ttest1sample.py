@@ -9,6 +9,8 @@ from scipy.stats import ttest_1samp
 
 from ..base.base_pairwise_stats_result import BasePairwiseStatsResult
 from ..base.base_pairwise_stats_task import BasePairwiseStatsTask
+from ..base.helper.column_summary_helper import ColumnSummaryHelper
+from ..pval_adjust.pval_adjust_helper import PValueAdjustHelper
 
 # *****************************************************************************
 #
@@ -96,8 +98,7 @@ class TTestOneSample(BasePairwiseStatsTask):
         ParamSet(ConfigSpecs({
             "method": StrParam(
                 default_value=BasePairwiseStatsTask.DEFAULT_ADJUST_METHOD, human_name="Correction method",
-                allowed_values=["bonferroni", "fdr_bh", "fdr_by", "fdr_tsbh", "fdr_tsbky",
-                                "sidak", "holm-sidak", "holm", "simes-hochberg", "hommel"],
+                allowed_values=PValueAdjustHelper.METHODS,
                 short_description="The method used to adjust (correct) p-values", visibility=StrParam.PROTECTED_VISIBILITY),
             "alpha": FloatParam(
                 default_value=BasePairwiseStatsTask.DEFAULT_ADJUST_ALPHA, min_value=0, max_value=1, human_name="Alpha",
@@ -126,14 +127,15 @@ class TTestOneSample(BasePairwiseStatsTask):
 
         is_nan_log_shown = False
         all_result = None
+        column_summary = ColumnSummaryHelper.compute_summary(data)
+        nan_counts = column_summary.loc[:, ColumnSummaryHelper.NAN_COUNT_NAME].to_numpy()
 
         for i in range(0, data.shape[1]):
             target_col = data.columns[i]
             current_data = data.iloc[:, [i]]
             current_data = current_data.to_numpy().T
 
-            array_sum = np.sum(current_data)
-            array_has_nan = np.isnan(array_sum)
+            array_has_nan = nan_counts[i] > 0
             if array_has_nan:
                 current_data = [
                     [x for x in y if not np.isnan(x)] for y in current_data]
@@ -155,5 +157,5 @@ class TTestOneSample(BasePairwiseStatsTask):
         all_result_dict = self._adjust_pvals(all_result, False, params)
 
         t = self.output_specs.get_spec("result").get_default_resource_type()
-        result = t(result=all_result_dict, input_table=table)
+        result = t(result=all_result_dict, input_table=table, column_summary=column_summary)
         return {'result': result}
@@ -0,0 +1,476 @@
+
+import os
+import tempfile
+from unittest.mock import patch
+
+import arviz as az
+import numpy as np
+import pymc as pm
+from gws_core import (BadRequestException, BaseTestCaseLight, Table,
+                      TaskRunner)
+from gws_stats import (MCLinearRegressor, MCLinearRegressorBatch,
+                       MCLinearRegressorPredictor, MCLinRegData,
+                       MCLinRegResult, MCLinRegSampler, MCTraceCache,
+                       MCTraceStorage)
+from pandas import DataFrame
+
+
+class TestMCSampler(BaseTestCaseLight):
+
+    def test_mc_sampler(self):
+        sampler = MCLinRegSampler()
+
+        sampler.set_slope_priors([
+            {"func": "Normal", "mu": 0.8, "sigma": 1.0},
+            {"func": "Normal", "mu": 0.8, "sigma": 1.0}
+        ])
+        sampler.set_sigma_prior({"func": "HalfCauchy", "beta": 10})
+
+        x_data = DataFrame({
+            "var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 9.0, 10.0],
+            "var2": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 9.0, 10.0]
+        })
+        y_data = DataFrame({"y": [1.0, 2.0, 3.0, 10.0, 5.0, 6.0, 7.0, 20.0, 9.0, 9.0, 10.0]})
+        data = MCLinRegData(x_data=x_data, y_data=y_data)
+
+        sampler.set_data(data)
+        result = sampler.trace(random_seed=42)
+        traces = result.get_traces()
+
+        slope = result.get_slope_traces()
+
+        # var1 and var2 are equal: only the sum of the slopes is identified (least squares slope 1.2575)
+        m = slope.mean()
+        self.assertAlmostEqual(m.sum(), 1.26, delta=0.05)
+        self.assertAlmostEqual(m.iat[0], m.iat[1], delta=0.2)
+
+        preds = result.get_predictions(num_samples=100)
+
+        pred_stats = result.get_prediction_stats(num_samples=100)
+
+    def test_mc_sampler_with_mixtures(self):
+        sampler = MCLinRegSampler()
+
+        sampler.set_slope_priors([
+            {"func": "Normal", "mu": 0.8, "sigma": 1.0},
+            {"func": "Mixture", "dist": [
+                {"func": "Uniform", "lower": -100, "upper": 100},
+                {"func": "Normal", "mu": 0.8, "sigma": 1.0},
+            ]}
+        ])
+        sampler.set_sigma_prior({"func": "HalfCauchy", "beta": 10})
+
+        x_data = DataFrame({
+            "var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 9.0, 10.0],
+            "var2": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 9.0, 10.0]
+        })
+        y_data = DataFrame({"y": [1.0, 2.0, 3.0, 10.0, 5.0, 6.0, 7.0, 20.0, 9.0, 9.0, 10.0]})
+        data = MCLinRegData(x_data=x_data, y_data=y_data)
+
+        sampler.set_data(data)
+        result = sampler.trace(random_seed=42)
+        traces = result.get_traces()
+
+        slope = result.get_slope_traces()
+
+        # var1 and var2 are equal: only the sum of the slopes is identified (least squares slope 1.2575)
+        m = slope.mean()
+        self.assertAlmostEqual(m.sum(), 1.26, delta=0.05)
+        self.assertAlmostEqual(m.iat[0], m.iat[1], delta=0.2)
+
+        preds = result.get_predictions(num_samples=100)
+
+        pred_stats = result.get_prediction_stats(num_samples=100)
+
+    def test_mc_sampler_inference_methods(self):
+        x_data = DataFrame({
+            "var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 9.0, 10.0],
+            "var2": [2.0, 1.0, 4.0, 3.0, 6.0, 5.0, 8.0, 7.0, 10.0, 9.0, 9.0]
+        })
+        y_data = DataFrame({"y": [1.5, 1.5, 3.5, 3.5, 5.5, 5.5, 7.5, 7.5, 9.5, 9.0, 9.5]})
+        data = MCLinRegData(x_data=x_data, y_data=y_data)
+
+        for method in ["advi", "fullrank_advi", "map_laplace"]:
+            sampler = MCLinRegSampler()
+            sampler.set_slope_priors([
+                {"func": "Normal", "mu": 0.0, "sigma": 10.0},
+                {"func": "Normal", "mu": 0.0, "sigma": 10.0}
+            ])
+            sampler.set_sigma_prior({"func": "HalfCauchy", "beta": 10})
+            sampler.set_inference_method(method)
+            sampler.set_chains(2)
+            sampler.set_draws(300)
+            sampler.set_data(data)
+            result = sampler.trace(random_seed=42)
+
+            # the approximations are sampled with the same chains and draws as the MCMC methods
+            posterior = result.get_traces().posterior
+            self.assertEqual((posterior.sizes["chain"], posterior.sizes["draw"]), (2, 300))
+            slope = result.get_slope_traces()
+            self.assertEqual(list(slope.columns), ["var1", "var2"])
+            self.assertAlmostEqual(slope.sum(axis=1).mean(), 1.0, delta=0.1)
+            pred_stats = result.get_prediction_stats()
+            self.assertEqual(pred_stats.shape, (11, 2))
+
+    def test_mc_sampler_sample_options(self):
+        x_data = DataFrame({"var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]})
+        y_data = DataFrame({"y": [1.1, 2.0, 2.9, 4.2, 5.0, 5.8, 7.1, 8.0, 9.1, 9.9]})
+        sampler = MCLinRegSampler()
+        sampler.set_slope_priors([{"func": "Normal", "mu": 0.0, "sigma": 10.0}])
+        sampler.set_sigma_prior({"func": "HalfCauchy", "beta": 10})
+        sampler.set_data(MCLinRegData(x_data=x_data, y_data=y_data))
+        sampler.set_chains(3)
+        sampler.set_draws(100)
+        sampler.set_tune(100)
+        sampler.set_target_accept(0.9)
+
+        # by default, one process per chain up to the number of CPUs
+        self.assertTrue(1 <= sampler.get_cores() <= 3)
+
+        # one seed is expected: PyMC derives the seeds of the chains from it
+        with self.assertRaises(BadRequestException):
+            sampler.trace(random_seed=[1, 2, 3])
+
+        sampler.set_cores(2)
+        with patch("pymc.sample", wraps=pm.sample) as sample:
+            result = sampler.trace(random_seed=1)
+        self.assertEqual(sample.call_count, 1)
+        kwargs = sample.call_args.kwargs
+        self.assertEqual(kwargs["chains"], 3)
+        self.assertEqual(kwargs["cores"], 2)
+        self.assertEqual(kwargs["target_accept"], 0.9)
+        self.assertEqual(kwargs["random_seed"], 1)
+        self.assertEqual(result.get_traces().posterior.sizes["chain"], 3)
+
+    def test_mc_sampler_trace_cache(self):
+        x_data = DataFrame({"var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]})
+        y_data = DataFrame({"y": [1.1, 2.0, 2.9, 4.2, 5.0, 5.8, 7.1, 8.0, 9.1, 9.9]})
+        data = MCLinRegData(x_data=x_data, y_data=y_data)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = MCTraceCache(cache_dir=cache_dir)
+            slopes = []
+            for _ in range(0, 2):
+                sampler = MCLinRegSampler()
+                sampler.set_slope_priors([{"func": "Normal", "mu": 0.0, "sigma": 10.0}])
+                sampler.set_sigma_prior({"func": "HalfCauchy", "beta": 10})
+                sampler.set_data(data)
+                sampler.set_draws(200)
+                sampler.set_tune(200)
+                sampler.set_trace_cache(cache)
+                result = sampler.trace(random_seed=42)
+                slopes.append(result.get_slope_traces())
+                self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            self.assertTrue(slopes[0].equals(slopes[1]))
+
+    def test_mc_sampler_trace_many(self):
+        x_data = DataFrame({"var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]})
+        y_data = DataFrame({
+            "y1": [1.1, 2.0, 2.9, 4.2, 5.0, 5.8, 7.1, 8.0, 9.1, 9.9],
+            "y2": [2.1, 4.0, 5.9, 8.2, 10.0, 11.8, 14.1, 16.0, 18.1, 19.9],
+        })
+        sampler = MCLinRegSampler()
+        sampler.set_slope_priors([{"func": "Normal", "mu": 0.0, "sigma": 10.0}])
+        sampler.set_sigma_prior({"func": "HalfCauchy", "beta": 10})
+        sampler.set_data(MCLinRegData(x_data=x_data, y_data=y_data.iloc[:, [0]]))
+        # the step method is compiled once for all the columns
+        with patch.object(sampler, "create_step", wraps=sampler.create_step) as create_step:
+            summary = sampler.trace_many(y_data, random_seed=42)
+        self.assertEqual(create_step.call_count, 1)
+
+        slope_summary = summary[summary["parameter"] == "slope[var1]"].set_index("target")
+        self.assertAlmostEqual(slope_summary.loc["y1", "mean"], 1.0, delta=0.1)
+        self.assertAlmostEqual(slope_summary.loc["y2", "mean"], 2.0, delta=0.1)
+
+    def test_mc_sampler_multi_target(self):
+        x_data = DataFrame({"var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]})
+        y_data = DataFrame({
+            "y1": [1.1, 2.0, 2.9, 4.2, 5.0, 5.8, 7.1, 8.0, 9.1, 9.9],
+            "y2": [2.1, 4.0, 5.9, 8.2, 10.0, 11.8, 14.1, 16.0, 18.1, 19.9],
+        })
+        sampler = MCLinRegSampler()
+        sampler.set_slope_priors([{"func": "Normal", "mu": 0.0, "sigma": 10.0}])
+        sampler.set_sigma_prior({"func": "HalfCauchy", "beta": 10})
+        sampler.set_data(MCLinRegData(x_data=x_data, y_data=y_data))
+        result = sampler.trace(random_seed=42)
+
+        self.assertTrue(result.is_multi_target())
+        slope = result.get_slope_traces().mean()
+        self.assertAlmostEqual(slope[("y1", "var1")], 1.0, delta=0.1)
+        self.assertAlmostEqual(slope[("y2", "var1")], 2.0, delta=0.1)
+        pred_stats = result.get_prediction_stats(target="y2")
+        self.assertEqual(pred_stats.shape, (10, 2))
+
+    def test_mc_sampler_adaptive_sampling(self):
+        x_data = DataFrame({"var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]})
+        y_data = DataFrame({"y": [1.1, 2.0, 2.9, 4.2, 5.0, 5.8, 7.1, 8.0, 9.1, 9.9]})
+        sampler = MCLinRegSampler()
+        sampler.set_slope_priors([{"func": "Normal", "mu": 0.0, "sigma": 10.0}])
+        sampler.set_sigma_prior({"func": "HalfCauchy", "beta": 10})
+        sampler.set_data(MCLinRegData(x_data=x_data, y_data=y_data))
+        sampler.set_draws(5000)
+        sampler.set_adaptive_sampling(increment=500)
+        result = sampler.trace(random_seed=42)
+
+        self.assertTrue(sampler.is_converged())
+        diagnostics = sampler.get_convergence_diagnostics()
+        self.assertEqual(list(diagnostics.index), ["slope[var1]", "sigma_0"])
+        self.assertTrue((diagnostics["r_hat"] <= 1.01).all())
+        self.assertTrue((diagnostics[["ess_bulk", "ess_tail"]] >= 400).all(axis=None))
+        nb_draws = result.get_traces().posterior.sizes["draw"]
+        self.assertTrue(nb_draws < 5000)
+        self.assertEqual(nb_draws % 500, 0)
+        self.assertAlmostEqual(result.get_slope_traces().mean().iat[0], 1.0, delta=0.1)
+
+    def test_mc_sampler_conjugate(self):
+        x_data = DataFrame({
+            "var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0],
+            "var2": [2.0, 1.0, 4.0, 3.0, 6.0, 5.0, 8.0, 7.0, 10.0, 9.0]
+        })
+        y_data = DataFrame({"y": [1.6, 2.4, 3.9, 4.6, 6.1, 6.4, 8.0, 8.5, 10.2, 10.4]})
+        data = MCLinRegData(x_data=x_data, y_data=y_data)
+
+        for sigma_prior in [{"func": "Fixed", "value": 0.5}, {"func": "InverseGamma", "alpha": 2.0, "beta": 1.0}]:
+            slopes = []
+            for is_conjugate in [True, False]:
+                sampler = MCLinRegSampler()
+                sampler.set_slope_priors([
+                    {"func": "Normal", "mu": 0.0, "sigma": 10.0},
+                    {"func": "Normal", "mu": 0.0, "sigma": 10.0}
+                ])
+                sampler.set_sigma_prior(dict(sigma_prior))
+                sampler.set_conjugate_solver(is_conjugate)
+                sampler.set_data(data)
+                self.assertEqual(sampler.is_conjugate(), is_conjugate)
+                result = sampler.trace(random_seed=42)
+                slopes.append(result.get_slope_traces())
+                if is_conjugate:
+                    self.assertEqual(result.get_slope_covariance().shape, (2, 2))
+                    for name in ["var1", "var2"]:
+                        self.assertAlmostEqual(result.get_slope_mean()[name], slopes[0][name].mean(), delta=0.01)
+
+            # the closed-form posterior is the one sampled by MCMC
+            for name in ["var1", "var2"]:
+                self.assertAlmostEqual(slopes[0][name].mean(), slopes[1][name].mean(), delta=0.02)
+                self.assertAlmostEqual(slopes[0][name].std(), slopes[1][name].std(), delta=0.01)
+
+    def test_mc_sampler_stream_predictions(self):
+        x_data = DataFrame({"var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]})
+        y_data = DataFrame({"y": [1.1, 2.0, 2.9, 4.2, 5.0, 5.8, 7.1, 8.0, 9.1, 9.9]})
+        sampler = MCLinRegSampler()
+        sampler.set_slope_priors([{"func": "Normal", "mu": 0.0, "sigma": 10.0}])
+        sampler.set_sigma_prior({"func": "HalfCauchy", "beta": 10})
+        sampler.set_data(MCLinRegData(x_data=x_data, y_data=y_data))
+        result = sampler.trace(random_seed=42)
+
+        preds = result.get_predictions()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            draws_path = os.path.join(tmp_dir, "draws.npy")
+            stats = result.stream_predictions(chunk_size=300, draws_path=draws_path, thin=10)
+            draws = np.load(draws_path, mmap_mode="r")
+            self.assertEqual(draws.shape, (10, 400))
+            self.assertTrue(np.allclose(draws, preds.to_numpy()[:, ::10], rtol=1e-5))
+            del draws
+
+        self.assertEqual(list(stats.columns), ["mean", "std", "5%", "50%", "95%"])
+        self.assertTrue(np.allclose(stats["mean"], preds.mean(axis=1)))
+        self.assertTrue(np.allclose(stats["std"], preds.std(axis=1)))
+        exact_quantiles = preds.quantile([0.05, 0.5, 0.95], axis=1).T.to_numpy()
+        self.assertTrue(np.allclose(stats[["5%", "50%", "95%"]].to_numpy(), exact_quantiles, atol=0.05))
+
+        # small chunks and few draws
+        stats = result.stream_predictions(chunk_size=10)
+        self.assertTrue(np.allclose(stats[["5%", "50%", "95%"]].to_numpy(), exact_quantiles, atol=0.05))
+        stats = result.stream_predictions(num_samples=20)
+        self.assertEqual(stats.shape, (10, 5))
+        self.assertTrue((stats["5%"] <= stats["50%"]).all() and (stats["50%"] <= stats["95%"]).all())
+
+    def test_mc_sampler_predict_small_chunks(self):
+        rng = np.random.default_rng(42)
+        x_data = rng.normal(size=(20, 2))
+        probs = [0.05, 0.5, 0.95]
+        for nb_draws in [5, 6, 12, 20, 40, 500]:
+            slope = rng.normal(loc=1.0, size=(nb_draws, 2))
+            preds = x_data @ slope.T
+            exact_quantiles = np.quantile(preds, probs, axis=1).T
+            for chunk_size in [1, 2, 7, 10, 50]:
+                stats = MCLinRegResult.predict_from_draws(x_data, slope, ["var1", "var2"], chunk_size=chunk_size)
+                quantiles = stats[["5%", "50%", "95%"]].to_numpy()
+                if nb_draws <= 40:
+                    # the first draws are kept: the quantiles are exact
+                    self.assertTrue(np.allclose(quantiles, exact_quantiles))
+                else:
+                    # streaming estimation: the errors are of the order of the Monte Carlo error of the quantiles
+                    errors = np.abs(quantiles - exact_quantiles) / preds.std(axis=1)[:, None]
+                    self.assertLess(errors.mean(), 0.1)
+
+    def test_mc_linear_regressor_task(self):
+        table = Table(data=DataFrame({
+            "var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0],
+            "var2": [2.0, 1.0, 4.0, 3.0, 6.0, 5.0, 8.0, 7.0, 10.0, 9.0],
+            "y": [1.6, 2.4, 3.9, 4.6, 6.1, 6.4, 8.0, 8.5, 10.2, 10.4]
+        }))
+        tester = TaskRunner(
+            params={
+                'training_design': [{'target_name': 'y', 'target_origin': 'column', 'target_type': 'numerical'}],
+                'slope': [{'func': 'Normal', 'mu': 0.0, 'sigma': 10.0}],
+                'random_seed': 42
+            },
+            inputs={'table': table},
+            task_type=MCLinearRegressor)
+        outputs = tester.run()
+        summary = outputs['result'].get_data()
+
+        self.assertEqual(list(summary.index), ["slope[var1]", "slope[var2]", "sigma_0"])
+        self.assertEqual(list(summary.columns), ["mean", "sd", "hdi_3%", "hdi_97%", "r_hat", "ess_bulk", "ess_tail"])
+        self.assertAlmostEqual(summary.loc["slope[var1]", "mean"] + summary.loc["slope[var2]", "mean"], 1.11, delta=0.05)
+        self.assertTrue((summary["r_hat"] < 1.05).all())
+
+    def test_mc_sampler_trace_batch(self):
+        x_data = DataFrame({"var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]})
+        data_list = [MCLinRegData(x_data=x_data, y_data=DataFrame({"y": x_data["var1"] * i + 0.1 * (-1) ** x_data.index}))
+                     for i in range(0, 4)]
+        sampler = MCLinRegSampler()
+        sampler.set_slope_priors([{"func": "Normal", "mu": 0.0, "sigma": 10.0}])
+        sampler.set_sigma_prior({"func": "HalfCauchy", "beta": 10})
+        sampler.set_draws(500)
+        sampler.set_tune(500)
+
+        summaries = dict(sampler.trace_batch(data_list, random_seed=42, nb_workers=2))
+        self.assertEqual(sorted(summaries), [0, 1, 2, 3])
+        for i, summary in summaries.items():
+            self.assertAlmostEqual(summary.loc["slope[var1]", "mean"], i, delta=0.1)
+
+        # the results do not depend on the number of workers
+        other_summaries = dict(sampler.trace_batch(data_list, random_seed=42, nb_workers=1))
+        for i, summary in summaries.items():
+            self.assertTrue(summary.equals(other_summaries[i]))
+
+    def test_mc_linear_regressor_batch_task(self):
+        table = Table(data=DataFrame({
+            "var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0],
+            "y1": [1.1, 2.0, 2.9, 4.2, 5.0, 5.8, 7.1, 8.0, 9.1, 9.9],
+            "y2": [2.1, 4.0, 5.9, 8.2, 10.0, None, 14.1, 16.0, 18.1, 19.9],
+        }))
+        tester = TaskRunner(
+            params={
+                'predictor_column_names': [{'name': 'var1', 'is_regex': False}],
+                'target_column_names': [{'name': 'y.*', 'is_regex': True}],
+                'nb_workers': 2,
+                'random_seed': 42
+            },
+            inputs={'table': table},
+            task_type=MCLinearRegressorBatch)
+        outputs = tester.run()
+        summary = outputs['result'].get_data()
+
+        slope_summary = summary[summary["parameter"] == "slope[var1]"].set_index("target")
+        self.assertAlmostEqual(slope_summary.loc["y1", "mean"], 1.0, delta=0.1)
+        self.assertAlmostEqual(slope_summary.loc["y2", "mean"], 2.0, delta=0.1)
+
+    def test_mc_sampler_predict(self):
+        x_data = DataFrame({"var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]})
+        y_data = DataFrame({"y": [1.1, 2.0, 2.9, 4.2, 5.0, 5.8, 7.1, 8.0, 9.1, 9.9]})
+        sampler = MCLinRegSampler()
+        sampler.set_slope_priors([{"func": "Normal", "mu": 0.0, "sigma": 10.0}])
+        sampler.set_sigma_prior({"func": "HalfCauchy", "beta": 10})
+        sampler.set_data(MCLinRegData(x_data=x_data, y_data=y_data))
+        result = sampler.trace(random_seed=42)
+
+        # the predictions of the training data are the same as the ones of the posterior draws
+        preds = result.get_predictions()
+        stats = result.predict(x_data)
+        self.assertEqual(list(stats.columns), ["mean", "std", "5%", "50%", "95%"])
+        self.assertTrue(np.allclose(stats["mean"], preds.mean(axis=1)))
+        self.assertTrue(np.allclose(stats["std"], preds.std(axis=1)))
+        exact_quantiles = preds.quantile([0.05, 0.5, 0.95], axis=1).T.to_numpy()
+        self.assertTrue(np.allclose(stats[["5%", "50%", "95%"]].to_numpy(), exact_quantiles))
+
+        new_x = DataFrame({"id": ["a", "b"], "var1": [20.0, 30.0]}, index=["s1", "s2"])
+        stats = result.predict(new_x, chunk_size=300)
+        self.assertEqual(list(stats.index), ["s1", "s2"])
+        self.assertAlmostEqual(stats.loc["s1", "mean"], 20.0, delta=1.0)
+        self.assertTrue((stats["5%"] < stats["mean"]).all() and (stats["mean"] < stats["95%"]).all())
+
+    def test_mc_linear_regressor_predictor_task(self):
+        table = Table(data=DataFrame({
+            "var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0],
+            "y": [1.1, 2.0, 2.9, 4.2, 5.0, 5.8, 7.1, 8.0, 9.1, 9.9]
+        }))
+        tester = TaskRunner(
+            params={
+                'training_design': [{'target_name': 'y', 'target_origin': 'column', 'target_type': 'numerical'}],
+                'random_seed': 42
+            },
+            inputs={'table': table},
+            task_type=MCLinearRegressor)
+        outputs = tester.run()
+        draws = outputs['posterior_draws']
+        self.assertEqual(list(draws.get_data().columns), ["target", "var1"])
+
+        new_table = Table(data=DataFrame({"var1": [20.0, 30.0]}, index=["s1", "s2"]))
+        tester = TaskRunner(
+            params={},
+            inputs={'table': new_table, 'posterior_draws': draws},
+            task_type=MCLinearRegressorPredictor)
+        outputs = tester.run()
+        stats = outputs['result'].get_data()
+        self.assertEqual(list(stats.columns), ["mean", "std", "5%", "50%", "95%"])
+        self.assertAlmostEqual(stats.loc["s2", "mean"], 30.0, delta=1.5)
+
+        # small chunks of draws: the quantiles are estimated with a streaming sketch
+        for chunk_size in [1, 10]:
+            tester = TaskRunner(
+                params={'chunk_size': chunk_size},
+                inputs={'table': new_table, 'posterior_draws': draws},
+                task_type=MCLinearRegressorPredictor)
+            chunk_stats = tester.run()['result'].get_data()
+            self.assertTrue(np.allclose(chunk_stats[["mean", "std"]], stats[["mean", "std"]]))
+            self.assertTrue(np.allclose(chunk_stats[["5%", "50%", "95%"]], stats[["5%", "50%", "95%"]],
+                                        atol=0.2 * stats["std"].max()))
+
+    def test_mc_sampler_trace_storage(self):
+        x_data = DataFrame({"var1": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]})
+        y_data = DataFrame({"y": [1.1, 2.0, 2.9, 4.2, 5.0, 5.8, 7.1, 8.0, 9.1, 9.9]})
+        sampler = MCLinRegSampler()
+        sampler.set_slope_priors([{"func": "Normal", "mu": 0.0, "sigma": 10.0}])
+        sampler.set_sigma_prior({"func": "HalfCauchy", "beta": 10})
+        sampler.set_data(MCLinRegData(x_data=x_data, y_data=y_data))
+        sampler.set_trace_storage(keep_deterministics=False, dtype="float32")
+        result = sampler.trace(random_seed=42)
+
+        posterior = result.get_traces().posterior
+        self.assertEqual(sorted(posterior.data_vars), ["sigma_0", "slope"])
+        self.assertEqual(posterior["slope"].dtype, np.float32)
+        self.assertAlmostEqual(result.get_summary().loc["slope[var1]", "mean"], 1.0, delta=0.1)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "traces.nc")
+            result.save_traces(path)
+            traces = MCTraceStorage.read(path)
+            self.assertTrue(np.array_equal(traces.posterior["slope"].values, posterior["slope"].values))
+
+        traces = MCTraceStorage.compact(result.get_traces(), var_names=["slope"])
+        self.assertEqual(list(traces.posterior.data_vars), ["slope"])
+
+        # with mixed priors, `slope` is a deterministic required by the result: it is kept
+        x_data["var2"] = [2.0, 1.0, 4.0, 3.0, 6.0, 5.0, 8.0, 7.0, 10.0, 9.0]
+        sampler.set_slope_priors([
+            {"func": "Normal", "mu": 0.0, "sigma": 10.0},
+            {"func": "TruncatedNormal", "mu": 0.0, "sigma": 10.0, "lower": -100.0, "upper": 100.0}
+        ])
+        sampler.set_data(MCLinRegData(x_data=x_data, y_data=y_data))
+        result = sampler.trace(random_seed=42)
+        posterior = result.get_traces().posterior
+        self.assertIn("slope", posterior.data_vars)
+        self.assertNotIn("mu", posterior.data_vars)
+        self.assertEqual(list(result.get_slope_traces().columns), ["var1", "var2"])
+        self.assertIn("slope[var2]", result.get_summary().index)
+        self.assertEqual(result.predict(x_data).shape, (10, 5))
+
+        # with an InverseGamma prior, `sigma_0` is a deterministic required by the result: it is kept
+        sampler.set_slope_priors([{"func": "Normal", "mu": 0.0, "sigma": 10.0}] * 2)
+        sampler.set_sigma_prior({"func": "InverseGamma", "alpha": 2.0, "beta": 1.0})
+        result = sampler.trace(random_seed=42)
+        self.assertEqual(sorted(result.get_traces().posterior.data_vars), ["sigma_0", "sigma_sq_0", "slope"])
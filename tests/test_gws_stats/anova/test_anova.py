@@ -28,6 +28,8 @@ class TestAnova(BaseTestCaseLight):
         )
         outputs = tester.run()
         anova_result = outputs['result']
+        summary = anova_result.get_column_summary_table().get_data()
+        self.assertEqual(summary.shape[0], table.nb_columns)
 
     def test_anova_with_group_comparison(self):
         table = DataProvider.get_iris_table()
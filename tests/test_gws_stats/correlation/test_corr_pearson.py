@@ -1,9 +1,11 @@
 import os
 
-from gws_core import (BaseTestCaseLight, File, Settings, TableImporter,
-                      TaskRunner)
+import numpy as np
+from gws_core import (BadRequestException, BaseTestCaseLight, ConfigParams,
+                      File, Settings, TableImporter, TaskRunner)
 from gws_core.extra import DataProvider
-from gws_stats import PearsonCorrelation
+from gws_stats import PearsonCorrelation, PValueAdjustHelper
+from gws_stats.base.helper.table_view_helper import TableViewHelper
 
 
 class TestPairwiseCorrelationCoef(BaseTestCaseLight):
@@ -39,6 +41,90 @@ class TestPairwiseCorrelationCoef(BaseTestCaseLight):
         outputs = tester.run()
         pairwise_correlationcoef_result = outputs['result']
 
+        summary = pairwise_correlationcoef_result.get_column_summary_table().get_data()
+        self.assertEqual(summary.shape[0], table.nb_columns)
+        self.assertAlmostEqual(summary.loc["T1", "Mean"], table.get_data().loc[:, "T1"].mean(), places=6)
+
+    def test_pearson_paginated_view(self):
+        table = DataProvider.get_iris_table()
+        tester = TaskRunner(
+            params={'preselected_column_names': None},
+            inputs={'table': table},
+            task_type=PearsonCorrelation
+        )
+        outputs = tester.run()
+        result = outputs['result']
+        stat_data = result.get_full_statistics_table().get_data()
+
+        params = ConfigParams({
+            "page": 1, "number_of_rows_per_page": 2, "sort_by": "PValue", "ascending": True,
+            "name_filter": None, "max_pvalue": None, "max_adjusted_pvalue": None})
+        page_data = TableViewHelper.get_page(
+            stat_data, params, result._sort_indexes,
+            name_column_names=["Reference", "Compared"],
+            pvalue_column_name="PValue", adjusted_pvalue_column_name="Adjusted_PValue")
+        self.assertEqual(page_data.shape[0], 2)
+        self.assertEqual(page_data.iat[0, 3], stat_data.loc[:, "PValue"].min())
+
+        view = result.view_full_statistics_table(params)
+        self.assertIsNotNone(view)
+
+        params = ConfigParams({
+            "page": 1, "number_of_rows_per_page": 2, "sort_by": "PValue", "ascending": True,
+            "name_filter": "sepal[", "max_pvalue": None, "max_adjusted_pvalue": None})
+        with self.assertRaises(BadRequestException):
+            TableViewHelper.get_page(
+                stat_data, params, result._sort_indexes,
+                name_column_names=["Reference", "Compared"],
+                pvalue_column_name="PValue", adjusted_pvalue_column_name="Adjusted_PValue")
+
+    def test_pearson_condensed_contingency(self):
+        table = DataProvider.get_iris_table()
+        tester = TaskRunner(
+            params={'preselected_column_names': None},
+            inputs={'table': table},
+            task_type=PearsonCorrelation
+        )
+        dense_result = tester.run()['result']
+        self.assertFalse(dense_result.is_contingency_condensed())
+
+        result_type = type(dense_result)
+        max_nb_columns = result_type.MAX_NUMBER_OF_COLUMNS_FOR_DENSE_CONTINGENCY
+        try:
+            result_type.MAX_NUMBER_OF_COLUMNS_FOR_DENSE_CONTINGENCY = 2
+            tester = TaskRunner(
+                params={'preselected_column_names': None},
+                inputs={'table': table},
+                task_type=PearsonCorrelation
+            )
+            condensed_result = tester.run()['result']
+        finally:
+            result_type.MAX_NUMBER_OF_COLUMNS_FOR_DENSE_CONTINGENCY = max_nb_columns
+
+        self.assertTrue(condensed_result.is_contingency_condensed())
+        vector, names = condensed_result.get_condensed_contingency_vector("PValue")
+        self.assertEqual(len(vector), len(names) * (len(names) - 1) // 2)
+
+        dense = dense_result.get_contingency_table("PValue").get_data()
+        condensed = condensed_result.get_contingency_table("PValue").get_data()
+        self.assertTrue(dense.equals(condensed))
+
+    def test_pearson_reference_column_contingency(self):
+        table = DataProvider.get_iris_table()
+        tester = TaskRunner(
+            params={'preselected_column_names': None, 'reference_column': 'sepal.width'},
+            inputs={'table': table},
+            task_type=PearsonCorrelation
+        )
+        result = tester.run()['result']
+        stat_data = result.get_full_statistics_table().get_data()
+        contingency = result.get_contingency_table("PValue").get_data()
+
+        # the compared columns sorted before the reference column are kept
+        self.assertEqual(list(contingency.index), ["sepal.width"])
+        for _, row in stat_data.iterrows():
+            self.assertEqual(contingency.loc[row["Reference"], row["Compared"]], row["PValue"])
+
     def test_pearson_with_group_comparison(self):
         table = DataProvider.get_iris_table()
         tester = TaskRunner(
@@ -54,3 +140,17 @@ class TestPairwiseCorrelationCoef(BaseTestCaseLight):
 
         tables = pairwise_correlationcoef_result.get_group_statistics_table()
         self.assertEqual(len(tables), 3)
+
+        # adjust the p-values within the comparisons of each reference column
+        tester = TaskRunner(
+            params={'row_tag_key': 'variety',
+                    'preselected_column_names': [{'name': 'petal.*', 'is_regex': True}],
+                    'adjust_pvalue': [{'method': 'fdr_bh', 'alpha': 0.05, 'family': 'reference'}]
+                    },
+            inputs={'table': table},
+            task_type=PearsonCorrelation)
+        outputs = tester.run()
+        data = outputs['result'].get_full_statistics_table().get_data()
+        for _, family_data in data.groupby("Reference"):
+            expected = PValueAdjustHelper.adjust(family_data["PValue"].to_numpy(), "fdr_bh")
+            self.assertTrue(np.allclose(family_data["Adjusted_PValue"].to_numpy(), expected))
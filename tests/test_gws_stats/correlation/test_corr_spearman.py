@@ -27,3 +27,49 @@ class TestPairwiseCorrelationCoef(BaseTestCaseLight):
         )
         outputs = tester.run()
         pairwise_correlationcoef_result = outputs['result']
+
+    def test_incremental(self):
+        settings = Settings.get_instance()
+        test_dir = settings.get_variable("gws_stats:testdata_dir")
+        table = TableImporter.call(
+            File(path=os.path.join(test_dir, "./bacteria.csv")),
+            params={
+                "delimiter": ",",
+                "header": 0
+            }
+        )
+        old_table = table.select_by_column_names(
+            [{"name": name, "is_regex": False} for name in table.column_names[0:5]])
+
+        # ---------------------------------------------------------------------
+        # run statistical test on the old version of the table
+        tester = TaskRunner(
+            params={'preselected_column_names': None, 'reference_column': None},
+            inputs={'table': old_table},
+            task_type=SpearmanCorrelation
+        )
+        previous_result = tester.run()['result']
+
+        # ---------------------------------------------------------------------
+        # run statistical test on the new version of the table
+        tester = TaskRunner(
+            params={'preselected_column_names': None, 'reference_column': None},
+            inputs={'table': table, 'previous_result': previous_result},
+            task_type=SpearmanCorrelation
+        )
+        incremental_result = tester.run()['result']
+
+        tester = TaskRunner(
+            params={'preselected_column_names': None, 'reference_column': None},
+            inputs={'table': table},
+            task_type=SpearmanCorrelation
+        )
+        full_result = tester.run()['result']
+
+        incremental_data = incremental_result.get_full_statistics_table().get_data()
+        full_data = full_result.get_full_statistics_table().get_data()
+        self.assertEqual(incremental_data.shape[0], full_data.shape[0])
+        self.assertAlmostEqual(
+            incremental_data.loc[:, "Adjusted_PValue"].sum(),
+            full_data.loc[:, "Adjusted_PValue"].sum(), places=6)
+        self.assertEqual(incremental_result.get_column_hashes(), full_result.get_column_hashes())
@@ -0,0 +1,81 @@
+import os
+
+from gws_core import (BaseTestCaseLight, File, ResourceSet, Settings,
+                      TableImporter, TaskRunner)
+from gws_stats import PairwiseStatsMerge, PearsonCorrelation
+
+
+class TestPairwiseStatsMerge(BaseTestCaseLight):
+
+    def test_merge(self):
+        settings = Settings.get_instance()
+        test_dir = settings.get_variable("gws_stats:testdata_dir")
+        table = TableImporter.call(
+            File(path=os.path.join(test_dir, "./bacteria.csv")),
+            params={
+                "delimiter": ",",
+                "header": 0
+            }
+        )
+
+        # ---------------------------------------------------------------------
+        # run the full pairwise comparison
+        tester = TaskRunner(
+            params={'preselected_column_names': None},
+            inputs={'table': table},
+            task_type=PearsonCorrelation
+        )
+        full_result = tester.run()['result']
+        full_data = full_result.get_full_statistics_table().get_data()
+
+        # ---------------------------------------------------------------------
+        # run the comparisons on overlapping column-block shards
+        column_names = table.column_names
+        half = len(column_names) // 2
+        blocks = [column_names[:half], column_names[half:]]
+        shards = []
+        for i, block1 in enumerate(blocks):
+            for j, block2 in enumerate(blocks):
+                if j < i:
+                    continue
+                names = sorted(set([*block1, *block2]))
+                tester = TaskRunner(
+                    params={'preselected_column_names': [{"name": name, "is_regex": False} for name in names]},
+                    inputs={'table': table},
+                    task_type=PearsonCorrelation
+                )
+                shards.append(tester.run()['result'])
+
+        resource_set = ResourceSet()
+        for i, shard in enumerate(shards):
+            shard.name = f"shard_{i}"
+            resource_set.add_resource(shard)
+
+        # ---------------------------------------------------------------------
+        # merge the shards
+        tester = TaskRunner(
+            params={},
+            inputs={'results': resource_set},
+            task_type=PairwiseStatsMerge
+        )
+        merged_result = tester.run()['result']
+        merged_data = merged_result.get_full_statistics_table().get_data()
+
+        self.assertEqual(merged_data.shape[0], full_data.shape[0])
+        self.assertAlmostEqual(
+            merged_data.loc[:, "Adjusted_PValue"].sum(),
+            full_data.loc[:, "Adjusted_PValue"].sum(), places=6)
+        merged_contingency = merged_result.get_contingency_table("PValue").get_data()
+        full_contingency = full_result.get_contingency_table("PValue").get_data()
+        self.assertEqual(merged_contingency.shape, full_contingency.shape)
+
+        # ---------------------------------------------------------------------
+        # the hashes of the columns computed on different data are not kept
+        self.assertEqual(merged_result.get_column_hashes(), full_result.get_column_hashes())
+        name = blocks[0][0]
+        column_hashes = dict(shards[1].get_column_hashes())
+        column_hashes[name] = "stale"
+        shards[1].set_column_hashes(column_hashes)
+        merged_result = PairwiseStatsMerge.merge(shards)
+        self.assertNotIn(name, merged_result.get_column_hashes())
+        self.assertEqual(len(merged_result.get_column_hashes()), len(full_result.get_column_hashes()) - 1)
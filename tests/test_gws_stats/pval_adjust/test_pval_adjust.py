@@ -1,8 +1,10 @@
 import os
 
-from gws_core import (BaseTestCaseLight, File, Settings, TableImporter,
+import numpy as np
+from gws_core import (BaseTestCaseLight, File, Settings, Table, TableImporter,
                       TaskRunner)
 from gws_stats import PearsonCorrelation, PValueAdjust
+from pandas import DataFrame
 
 
 class TestPValueAdjust(BaseTestCaseLight):
@@ -59,3 +61,32 @@ class TestPValueAdjust(BaseTestCaseLight):
         )
         outputs = tester.run()
         table = outputs['table']
+
+        # ---------------------------------------------------------------------
+        # run correction test with several methods
+        tester = TaskRunner(
+            params={"pval_column_name": "PValue", "method": "bonferroni",
+                    "other_methods": [{"method": "holm"}, {"method": "fdr_bh"}]},
+            inputs={'table': stat_table},
+            task_type=PValueAdjust
+        )
+        outputs = tester.run()
+        table = outputs['table']
+        data = table.get_data()
+        for method in ["bonferroni", "holm", "fdr_bh"]:
+            self.assertTrue(f"Adjusted_PValue_{method}" in data.columns)
+        self.assertTrue(
+            (data.loc[:, "Adjusted_PValue_fdr_bh"] <= data.loc[:, "Adjusted_PValue_bonferroni"]).all())
+
+    def test_invalid_pvalues(self):
+        data = DataFrame({"PValue": [0.01, 0.02, np.nan, 1.5, 0.04, 0.5]})
+        tester = TaskRunner(
+            params={"pval_column_name": "PValue", "method": "bonferroni"},
+            inputs={'table': Table(data=data)},
+            task_type=PValueAdjust
+        )
+        outputs = tester.run()
+        adjusted = outputs['table'].get_data().loc[:, "Adjusted_PValue"].to_numpy()
+        # the invalid p-values are not counted as tests
+        expected = np.array([0.04, 0.08, np.nan, np.nan, 0.16, 1.0])
+        self.assertTrue(np.allclose(adjusted, expected, equal_nan=True))
@@ -0,0 +1,105 @@
+import numpy as np
+from gws_core import BaseTestCaseLight
+from gws_stats import PValueAdjustHelper
+from statsmodels.stats.multitest import multipletests
+
+
+class TestPValueAdjustHelper(BaseTestCaseLight):
+
+    def test_adjust(self):
+        rng = np.random.default_rng(42)
+        pvals = np.concatenate([
+            rng.uniform(0, 1, (100, 3)) ** 3,
+            rng.uniform(0, 0.001, (100, 1)),
+            rng.uniform(0.5, 1, (100, 1))
+        ], axis=1)
+
+        for method in PValueAdjustHelper.METHODS:
+            if method.startswith("qvalue"):
+                # not available in statsmodels (see test_qvalue)
+                continue
+            for alpha in [0.05, 0.2]:
+                adjusted = PValueAdjustHelper.adjust(pvals, method, alpha, axis=0)
+                expected = np.stack([
+                    multipletests(pvals[:, j], alpha, method)[1] for j in range(pvals.shape[1])
+                ], axis=1)
+                self.assertTrue(np.allclose(adjusted, expected), msg=method)
+
+                adjusted = PValueAdjustHelper.adjust(pvals.T, method, alpha, axis=1)
+                self.assertTrue(np.allclose(adjusted, expected.T), msg=method)
+
+    def test_adjust_many(self):
+        rng = np.random.default_rng(42)
+        pvals = rng.uniform(0, 1, (50, 4)) ** 2
+        methods = ["bonferroni", "holm", "fdr_bh"]
+        all_adjusted = PValueAdjustHelper.adjust_many(pvals, methods, 0.05, axis=0)
+        self.assertEqual(list(all_adjusted.keys()), methods)
+        for method in methods:
+            adjusted = PValueAdjustHelper.adjust(pvals, method, 0.05, axis=0)
+            self.assertTrue(np.allclose(all_adjusted[method], adjusted))
+
+    def test_qvalue(self):
+        rng = np.random.default_rng(42)
+        nb_tests = 100000
+        pvals = np.concatenate([
+            rng.uniform(0, 1, int(nb_tests * 0.8)),
+            rng.beta(0.1, 5, int(nb_tests * 0.2))
+        ])
+        pvals = np.stack([pvals, rng.uniform(0, 1, nb_tests)], axis=1)
+
+        # pi0 estimations
+        sorted_pvals, _ = PValueAdjustHelper.sort(pvals)
+        for pi0_method in ["smoother", "bootstrap"]:
+            pi0 = PValueAdjustHelper.estimate_pi0(sorted_pvals, pi0_method)
+            self.assertAlmostEqual(pi0[0], 0.8, delta=0.02)
+            self.assertAlmostEqual(pi0[1], 1.0, delta=0.02)
+
+        # q-values are the BH adjusted p-values scaled by pi0
+        bh = PValueAdjustHelper.adjust(pvals, "fdr_bh")
+        for method in ["qvalue", "qvalue_bootstrap"]:
+            qvals = PValueAdjustHelper.adjust(pvals, method)
+            self.assertTrue((qvals <= bh + 1e-12).all())
+            self.assertTrue(np.allclose(qvals[:, 1] / bh[:, 1], qvals[0, 1] / bh[0, 1]))
+
+    def test_qvalue_small_families(self):
+        # the quadratic smoother goes below 0 on this family
+        pvals = np.array([0.001, 0.002, 0.003, 0.2, 0.3, 0.4, 0.6, 0.7])
+        bh = PValueAdjustHelper.adjust(pvals, "fdr_bh")
+        for method in ["qvalue", "qvalue_bootstrap"]:
+            qvals = PValueAdjustHelper.adjust(pvals, method)
+            self.assertTrue((qvals > 0).all(), msg=method)
+            self.assertTrue((qvals <= bh + 1e-12).all(), msg=method)
+
+        rng = np.random.default_rng(42)
+        for nb_tests in [5, 10, 20]:
+            sorted_pvals, _ = PValueAdjustHelper.sort(rng.uniform(0, 1, (nb_tests, 200)))
+            for pi0_method in ["smoother", "bootstrap"]:
+                pi0 = PValueAdjustHelper.estimate_pi0(sorted_pvals, pi0_method)
+                self.assertTrue(((pi0 >= 1.0 / nb_tests) & (pi0 <= 1)).all())
+
+    def test_adjust_grouped(self):
+        rng = np.random.default_rng(42)
+        pvals = rng.uniform(0, 1, 1000) ** 2
+        families = rng.choice(["A", "B", "C", "D"], 1000)
+
+        for method in PValueAdjustHelper.METHODS:
+            adjusted = PValueAdjustHelper.adjust_grouped(pvals, families, method, 0.05)
+            for family in ["A", "B", "C", "D"]:
+                is_in_family = families == family
+                expected = PValueAdjustHelper.adjust(pvals[is_in_family], method, 0.05)
+                self.assertTrue(np.allclose(adjusted[is_in_family], expected), msg=method)
+
+    def test_adjust_invalid(self):
+        rng = np.random.default_rng(42)
+        pvals = rng.uniform(0, 1, (200, 2)) ** 2
+        pvals[rng.uniform(0, 1, (200, 2)) < 0.1] = np.nan
+        pvals[0, 0] = 1.5
+        pvals[1, 1] = -0.1
+        is_valid = (pvals >= 0) & (pvals <= 1)
+
+        for method in ["bonferroni", "holm", "fdr_bh", "fdr_by", "hommel"]:
+            adjusted = PValueAdjustHelper.adjust(pvals, method, axis=0)
+            self.assertTrue(np.isnan(adjusted[~is_valid]).all())
+            for j in range(pvals.shape[1]):
+                expected = multipletests(pvals[is_valid[:, j], j], 0.05, method)[1]
+                self.assertTrue(np.allclose(adjusted[is_valid[:, j], j], expected), msg=method)
@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+import numpy as np
+from gws_core import BaseTestCaseLight
+from gws_stats import PValueAdjustHelper, StreamingFDRHelper
+
+
+class TestStreamingFDRHelper(BaseTestCaseLight):
+
+    def test_adjust(self):
+        rng = np.random.default_rng(42)
+        pvals = np.concatenate([
+            rng.uniform(0, 1, 20000) ** 4,
+            np.full(3000, 0.5),
+            np.full(500, 1.0),
+            np.zeros(10),
+            # invalid p-values
+            np.array([np.nan, np.nan, 1.5, -0.1])
+        ])
+        rng.shuffle(pvals)
+
+        for method in StreamingFDRHelper.METHODS:
+            expected = PValueAdjustHelper.adjust(pvals, method)
+            for chunk_size in [100, 1000, 100000]:
+                adjusted = StreamingFDRHelper.adjust(pvals, method, chunk_size=chunk_size)
+                self.assertTrue(np.allclose(adjusted, expected, equal_nan=True), msg=f"{method}, {chunk_size}")
+
+    def test_harmonic_number(self):
+        expected = np.sum(1.0 / np.arange(1, 12346))
+        for chunk_size in [1, 100, 12345, 100000]:
+            self.assertAlmostEqual(StreamingFDRHelper._get_harmonic_number(12345, chunk_size), expected, places=10)
+
+    def test_adjust_memmap(self):
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pvals = np.lib.format.open_memmap(
+                os.path.join(tmp_dir, "pvals.npy"), mode="w+", dtype=float, shape=(50000,))
+            pvals[:] = rng.uniform(0, 1, 50000) ** 2
+            out = np.lib.format.open_memmap(
+                os.path.join(tmp_dir, "adjusted.npy"), mode="w+", dtype=float, shape=(50000,))
+            StreamingFDRHelper.adjust(pvals, "fdr_bh", chunk_size=1000, out=out, tmp_dir=tmp_dir)
+            expected = PValueAdjustHelper.adjust(np.array(pvals), "fdr_bh")
+            self.assertTrue(np.allclose(out, expected))
+            del pvals, out